@@ -0,0 +1,217 @@
+"""
+Benchmark del optimizador de rutas y de la agrupación por proximidad.
+
+Genera instancias sintéticas reproducibles dentro del recuadro de
+UBICACIONES_CIUDADES y mide tiempo, memoria y longitud de la ruta frente a
+una solución de referencia. Uso:
+
+    python App/benchmarks/benchmark_rutas.py --salida resultados.json
+    python App/benchmarks/benchmark_rutas.py --comparar resultados.json
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+# Configuración de rutas
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "modules"))
+
+from rutas import UBICACIONES_CIUDADES, matriz_distancias, resolver_ruta_matriz
+from transportista import optimizar_ruta_ia, agrupar_por_proximidad
+
+
+TAMANOS = [5, 8, 12, 50, 200, 1000]
+SEMILLA = 2025
+RADIO_AGRUPACION_KM = 5
+
+
+# INSTANCIAS SINTÉTICAS
+
+def recuadro_boyaca():
+    """Límites (lat_min, lat_max, lon_min, lon_max) de las ciudades conocidas"""
+    lats = [c[0] for c in UBICACIONES_CIUDADES.values()]
+    lons = [c[1] for c in UBICACIONES_CIUDADES.values()]
+    return min(lats), max(lats), min(lons), max(lons)
+
+
+def generar_instancia(n, semilla=SEMILLA):
+    """Genera n paradas reproducibles y la ciudad base de la instancia"""
+    rng = np.random.default_rng(semilla + n)
+    lat_min, lat_max, lon_min, lon_max = recuadro_boyaca()
+    lats = rng.uniform(lat_min, lat_max, n)
+    lons = rng.uniform(lon_min, lon_max, n)
+
+    nombres = list(UBICACIONES_CIUDADES.keys())
+    centros = np.array([UBICACIONES_CIUDADES[c] for c in nombres])
+    cercana = np.argmin((lats[:, None] - centros[:, 0])**2 + (lons[:, None] - centros[:, 1])**2, axis=1)
+    ciudad_base = nombres[int(rng.integers(len(nombres)))]
+
+    destinos = [
+        {'lat': float(la), 'lon': float(lo), 'nombre': f"Campesino {i}", 'producto': 'Papa'}
+        for i, (la, lo) in enumerate(zip(lats, lons))
+    ]
+    df = pd.DataFrame({
+        'latitud': lats,
+        'longitud': lons,
+        'ciudad': [nombres[c] for c in cercana],
+        'campesino': [d['nombre'] for d in destinos],
+        'producto': 'Papa',
+        'cantidad_kg': rng.integers(10, 500, n),
+        'precio': rng.integers(50000, 500000, n)
+    })
+    return UBICACIONES_CIUDADES[ciudad_base], destinos, df
+
+
+# SOLUCIÓN DE REFERENCIA
+
+def longitud_ruta(origen, ruta):
+    coords = [origen] + [(d['lat'], d['lon']) for d in ruta]
+    D = matriz_distancias(coords)
+    return float(sum(D[i, i + 1] for i in range(len(coords) - 1)))
+
+
+def ruta_referencia(origen, destinos):
+    """Óptimo exacto hasta 8 paradas; para más, vecino más cercano mejorado con 2-opt"""
+    D = matriz_distancias([origen] + [(d['lat'], d['lon']) for d in destinos])
+    orden, _ = resolver_ruta_matriz(D, 0, range(1, len(destinos) + 1))
+    if len(destinos) <= 8:
+        return float(_longitud_orden(D, orden))
+    return float(_longitud_orden(D, _dos_opt(D, orden)))
+
+
+def _longitud_orden(D, orden):
+    nodos = np.concatenate([[0], np.asarray(orden) + 1])
+    return D[nodos[:-1], nodos[1:]].sum()
+
+
+def _dos_opt(D, orden, max_pasadas=50):
+    """2-opt sobre ruta abierta (sin regreso a la base), vectorizado por cada i"""
+    ruta = np.concatenate([[0], np.asarray(orden) + 1])
+    n = len(ruta)
+    for _ in range(max_pasadas):
+        mejorado = False
+        for i in range(n - 2):
+            a, b = ruta[i], ruta[i + 1]
+            c = ruta[i + 2:]
+            d = np.append(ruta[i + 3:], -1)
+            siguiente = np.where(d >= 0, D[b, np.maximum(d, 0)] - D[c, np.maximum(d, 0)], 0.0)
+            delta = D[a, c] + siguiente - D[a, b]
+            j = int(np.argmin(delta))
+            if delta[j] < -1e-9:
+                ruta[i + 1:i + 3 + j] = ruta[i + 1:i + 3 + j][::-1]
+                mejorado = True
+        if not mejorado:
+            break
+    return (ruta[1:] - 1).tolist()
+
+
+# MEDICIÓN
+
+def medir(funcion, repeticiones):
+    """Devuelve (resultado, mediana de segundos, pico de memoria en bytes)"""
+    tiempos = []
+    resultado = None
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        resultado = funcion()
+        tiempos.append(time.perf_counter() - inicio)
+    tracemalloc.start()
+    funcion()
+    _, pico = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return resultado, statistics.median(tiempos), pico
+
+
+def ejecutar(tamanos, repeticiones, semilla):
+    resultados = []
+    for n in tamanos:
+        origen, destinos, df = generar_instancia(n, semilla)
+
+        (ruta, distancia), t_ruta, mem_ruta = medir(lambda: optimizar_ruta_ia(origen, list(destinos)), repeticiones)
+        referencia = ruta_referencia(origen, destinos)
+        resultados.append({
+            'operacion': 'optimizar_ruta_ia',
+            'paradas': n,
+            'tiempo_s': t_ruta,
+            'memoria_pico_bytes': mem_ruta,
+            'longitud_km': float(distancia),
+            'longitud_referencia_km': referencia,
+            'brecha_pct': (float(distancia) / referencia - 1) * 100 if referencia > 0 else 0.0
+        })
+        print(f"optimizar_ruta_ia       n={n:5d}  {t_ruta*1000:10.2f} ms  {mem_ruta/1024:9.1f} KiB  "
+              f"{distancia:9.2f} km  (ref {referencia:9.2f} km)")
+
+        grupos, t_grupos, mem_grupos = medir(lambda: agrupar_por_proximidad(df, RADIO_AGRUPACION_KM), repeticiones)
+        resultados.append({
+            'operacion': 'agrupar_por_proximidad',
+            'paradas': n,
+            'tiempo_s': t_grupos,
+            'memoria_pico_bytes': mem_grupos,
+            'zonas': len(grupos)
+        })
+        print(f"agrupar_por_proximidad  n={n:5d}  {t_grupos*1000:10.2f} ms  {mem_grupos/1024:9.1f} KiB  "
+              f"{len(grupos)} zonas")
+    return resultados
+
+
+def comparar(actual, anterior, tolerancia):
+    """Lista de regresiones de tiempo o de calidad frente a un resultado anterior"""
+    previos = {(r['operacion'], r['paradas']): r for r in anterior['resultados']}
+    regresiones = []
+    for r in actual['resultados']:
+        previo = previos.get((r['operacion'], r['paradas']))
+        if previo is None:
+            continue
+        if r['tiempo_s'] > previo['tiempo_s'] * (1 + tolerancia):
+            regresiones.append(f"{r['operacion']} n={r['paradas']}: tiempo {previo['tiempo_s']:.4f}s -> {r['tiempo_s']:.4f}s")
+        if 'longitud_km' in r and r['longitud_km'] > previo['longitud_km'] * (1 + 1e-6):
+            regresiones.append(f"{r['operacion']} n={r['paradas']}: longitud {previo['longitud_km']:.2f} -> {r['longitud_km']:.2f} km")
+    return regresiones
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de optimización de rutas")
+    parser.add_argument("--tamanos", type=int, nargs="+", default=TAMANOS)
+    parser.add_argument("--repeticiones", type=int, default=3)
+    parser.add_argument("--semilla", type=int, default=SEMILLA)
+    parser.add_argument("--salida", help="Archivo JSON donde guardar los resultados")
+    parser.add_argument("--comparar", help="JSON de una ejecución anterior para detectar regresiones")
+    parser.add_argument("--tolerancia", type=float, default=0.25, help="Margen de tiempo permitido (0.25 = 25%%)")
+    args = parser.parse_args()
+
+    reporte = {
+        'fecha': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        'python': platform.python_version(),
+        'maquina': platform.machine(),
+        'cpus': os.cpu_count(),
+        'semilla': args.semilla,
+        'resultados': ejecutar(args.tamanos, args.repeticiones, args.semilla)
+    }
+
+    if args.salida:
+        with open(args.salida, "w", encoding="utf-8") as f:
+            json.dump(reporte, f, indent=2, ensure_ascii=False)
+        print(f"Resultados guardados en {args.salida}")
+
+    if args.comparar:
+        with open(args.comparar, encoding="utf-8") as f:
+            anterior = json.load(f)
+        regresiones = comparar(reporte, anterior, args.tolerancia)
+        if regresiones:
+            print("REGRESIONES DETECTADAS:")
+            for r in regresiones:
+                print(f"  - {r}")
+            sys.exit(1)
+        print("Sin regresiones frente a la ejecución anterior.")
+
+
+if __name__ == "__main__":
+    main()
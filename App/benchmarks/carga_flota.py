@@ -0,0 +1,306 @@
+"""
+Generador de carga de extremo a extremo: campesinos, camiones y compradores.
+
+Crea campesinos, publicaciones, camiones y compradores sintéticos y, desde
+varios procesos, ejecuta a una tasa objetivo las mismas funciones que usan
+las vistas: registro de productos, agrupar_por_proximidad, optimizar_ruta_ia,
+aceptar cargas, avance de la flota (paso_flota) y compras (registrar_compra).
+Todo ocurre sobre un directorio temporal; los datos reales no se tocan.
+
+La carga es de lazo abierto: cada operación tiene una hora programada y la
+latencia se mide desde esa hora, así que si el sistema no da abasto la espera
+en cola también cuenta. Uso:
+
+    python App/benchmarks/carga_flota.py --campesinos 500 --camiones 100 --segundos 30
+    python App/benchmarks/carga_flota.py --tasa 40 --procesos 8 --mezcla movimiento=5,compra=1
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+# Configuración de rutas
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "modules"))
+
+import comprador
+import transportista
+from eta import estimar_eta_minutos
+from polilineas import obtener_almacen_polilineas
+from rutas import UBICACIONES_CIUDADES
+from seguimiento import paso_flota
+
+
+SEMILLA = 2025
+PRODUCTOS = ['Papa', 'Cebolla', 'Zanahoria', 'Arveja', 'Remolacha', 'Mazorca', 'Tomate']
+RADIO_AGRUPACION_KM = 5
+MAX_PARADAS_RUTA = 8   # por encima optimizar_ruta_ia deja la fuerza bruta
+MEZCLA_DEFECTO = {'registro': 3, 'agrupar': 1, 'optimizar': 1, 'aceptar': 1, 'movimiento': 3, 'compra': 1}
+
+
+# DATOS SINTÉTICOS
+
+def nueva_publicacion(rng, campesino, instante):
+    """Fila de notificación como la que arma vista_registro, en una ciudad conocida"""
+    ciudad = list(UBICACIONES_CIUDADES.keys())[int(rng.integers(len(UBICACIONES_CIUDADES)))]
+    lat, lon = UBICACIONES_CIUDADES[ciudad]
+    kg = int(rng.integers(50, 800))
+    precio = int(kg * rng.uniform(800, 2500))
+    return {
+        'id_notificacion': f"CARGA-{instante:.6f}-{int(rng.integers(1_000_000))}",
+        'fecha_notificacion': datetime.fromtimestamp(instante).strftime("%Y-%m-%d %H:%M:%S"),
+        'campesino': campesino,
+        'producto': PRODUCTOS[int(rng.integers(len(PRODUCTOS)))],
+        'cantidad_kg': kg,
+        'ciudad': ciudad,
+        'direccion': f"Vereda {int(rng.integers(1, 60))}, {ciudad}",
+        'precio': precio,
+        'precio_predicho': precio,
+        'calidad': "Buena",
+        'estado': 'Pendiente',
+        'latitud': lat + rng.normal(0, 0.02),
+        'longitud': lon + rng.normal(0, 0.02),
+        'progreso_viaje': 0.0,
+        'origen': 'Campesino'
+    }
+
+
+def preparar_datos(directorio, n_publicaciones, campesinos, camiones, semilla):
+    """CSV inicial: publicaciones pendientes y un tercio ya aceptadas por algún camión"""
+    rng = np.random.default_rng(semilla)
+    ahora = time.time()
+    filas = [nueva_publicacion(rng, campesinos[int(rng.integers(len(campesinos)))], ahora) for _ in range(n_publicaciones)]
+    df = pd.concat([transportista.cargar_notificaciones(), pd.DataFrame(filas)], ignore_index=True)
+    df['transportista_asignado'] = df['transportista_asignado'].astype(object)
+    aceptadas = rng.random(len(df)) < 1 / 3
+    df.loc[aceptadas, 'estado'] = 'Aceptado'
+    df.loc[aceptadas, 'transportista_asignado'] = [camiones[int(i)] for i in rng.integers(len(camiones), size=aceptadas.sum())]
+    df.to_csv(os.path.join(directorio, "notificaciones_transporte.csv"), index=False)
+
+
+def usar_directorio(directorio):
+    """Apunta los módulos de las vistas a los CSV del directorio de prueba"""
+    for modulo in (transportista, comprador):
+        modulo.CSV_NOTIFICACIONES = os.path.join(directorio, "notificaciones_transporte.csv")
+        modulo.CSV_COMPRAS = os.path.join(directorio, "historial_compras.csv")
+    transportista.CSV_TRACKING = os.path.join(directorio, "tracking_transportistas.csv")
+    transportista.CSV_VENTAS_TRANSPORTADOR = os.path.join(directorio, "ventas_transportador.csv")
+    comprador.CSV_ALERTAS = os.path.join(directorio, "alertas_precios.csv")
+    obtener_almacen_polilineas(os.path.join(directorio, "polilineas_rutas.json"))
+
+
+# OPERACIONES (LAS MISMAS LLAMADAS QUE HACEN LAS VISTAS)
+
+class Escenario:
+    def __init__(self, rng, campesinos, camiones, compradores):
+        self.rng = rng
+        self.campesinos = campesinos
+        self.camiones = camiones
+        self.compradores = compradores
+        self.base = {c: list(UBICACIONES_CIUDADES.values())[i % len(UBICACIONES_CIUDADES)] for i, c in enumerate(camiones)}
+
+    def _elegir(self, lista):
+        return lista[int(self.rng.integers(len(lista)))]
+
+    def registro(self):
+        df = transportista.cargar_notificaciones()
+        fila = nueva_publicacion(self.rng, self._elegir(self.campesinos), time.time())
+        df = pd.concat([df, pd.DataFrame([fila])], ignore_index=True)
+        transportista.guardar_notificaciones(df)
+
+    def agrupar(self):
+        df = transportista.cargar_notificaciones()
+        transportista.agrupar_por_proximidad(df[df['estado'] == 'Pendiente'], RADIO_AGRUPACION_KM)
+
+    def optimizar(self):
+        df = transportista.cargar_notificaciones()
+        pendientes = df[df['estado'] == 'Pendiente']
+        if pendientes.empty:
+            return
+        ciudad = self._elegir(pendientes['ciudad'].unique().tolist())
+        zona = pendientes[pendientes['ciudad'] == ciudad].head(MAX_PARADAS_RUTA)
+        destinos = [{'lat': r['latitud'], 'lon': r['longitud'], 'nombre': r['campesino'], 'producto': r['producto']}
+                    for _, r in zona.iterrows()]
+        transportista.optimizar_ruta_ia(UBICACIONES_CIUDADES.get(ciudad, UBICACIONES_CIUDADES['Tunja']), destinos)
+
+    def aceptar(self):
+        df = transportista.cargar_notificaciones()
+        pendientes = df.index[df['estado'] == 'Pendiente']
+        if len(pendientes) == 0:
+            return
+        idx = self._elegir(pendientes)
+        camion = self._elegir(self.camiones)
+        lat_o, lon_o = self.base[camion]
+        df.loc[idx, ['estado', 'transportista_asignado', 'orden_parada']] = ['Aceptado', camion, 1]
+        df.loc[idx, ['progreso_viaje', 'transportista_lat', 'transportista_lon']] = [0.0, lat_o, lon_o]
+        transportista.guardar_notificaciones(df)
+
+    def movimiento(self):
+        df = transportista.cargar_notificaciones()
+        camion = self._elegir(self.camiones)
+        filas = df.index[(df['transportista_asignado'] == camion) & (df['estado'] == 'Aceptado')]
+        if paso_flota(df, filas, self.base[camion], self.rng).size:
+            transportista.guardar_notificaciones(df)
+
+    def compra(self):
+        df = comprador.cargar_notificaciones()
+        disponibles = df.index[df['estado'].isin(['Pendiente', 'Recogido'])]
+        if len(disponibles) == 0:
+            return
+        idx = self._elegir(disponibles)
+        fila = df.loc[idx]
+        ciudad_entrega = self._elegir(list(UBICACIONES_CIUDADES.keys()))
+        kg = float(min(fila['cantidad_kg'], self.rng.integers(10, 200)))
+        comprador.registrar_compra(self._elegir(self.compradores), {
+            'origen': fila.get('origen') if pd.notna(fila.get('origen')) else 'Campesino',
+            'campesino': fila['campesino'],
+            'transportador': fila.get('transportista_asignado'),
+            'producto': fila['producto'],
+            'ciudad': fila['ciudad'],
+            'cantidad_kg': kg,
+            'precio_unitario': fila['precio_predicho'],
+            'id_notificacion': fila['id_notificacion'],
+            'ciudad_entrega': ciudad_entrega,
+            'lat_entrega': UBICACIONES_CIUDADES[ciudad_entrega][0],
+            'lon_entrega': UBICACIONES_CIUDADES[ciudad_entrega][1]
+        })
+        if kg < fila['cantidad_kg']:
+            df.loc[idx, 'cantidad_kg'] = fila['cantidad_kg'] - kg
+        else:
+            df.loc[idx, 'estado'] = 'Vendido' if fila['estado'] == 'Recogido' else 'Completado'
+        comprador.guardar_notificaciones(df)
+
+
+# EJECUCIÓN
+
+def trabajador(directorio, proceso, tasa, mezcla, segundos, semilla, campesinos, camiones, compradores):
+    """Ejecuta operaciones a 'tasa' por segundo; devuelve latencias (s) y errores por operación"""
+    usar_directorio(directorio)
+    rng = np.random.default_rng(semilla + proceso)
+    escenario = Escenario(rng, campesinos, camiones, compradores)
+    operaciones = list(mezcla)
+    pesos = np.array([mezcla[o] for o in operaciones], dtype=float)
+    pesos /= pesos.sum()
+
+    latencias, servicio, errores = defaultdict(list), defaultdict(list), defaultdict(int)
+    inicio = time.perf_counter()
+    k = 0
+    while True:
+        programada = inicio + k / tasa
+        if programada - inicio >= segundos:
+            break
+        espera = programada - time.perf_counter()
+        if espera > 0:
+            time.sleep(espera)
+        operacion = operaciones[int(rng.choice(len(operaciones), p=pesos))]
+        comienzo = time.perf_counter()
+        try:
+            getattr(escenario, operacion)()
+        except Exception:
+            # con varios procesos un lector puede ver el CSV a medio escribir: se cuenta, no se oculta
+            errores[operacion] += 1
+        fin = time.perf_counter()
+        latencias[operacion].append(fin - programada)
+        servicio[operacion].append(fin - comienzo)
+        k += 1
+    return dict(latencias), dict(servicio), dict(errores), time.perf_counter() - inicio
+
+
+def resumir(resultados, duracion):
+    latencias, servicio, errores = defaultdict(list), defaultdict(list), defaultdict(int)
+    for lat, serv, err, _ in resultados:
+        for op, valores in lat.items():
+            latencias[op].extend(valores)
+            servicio[op].extend(serv[op])
+        for op, n in err.items():
+            errores[op] += n
+    resumen = {}
+    for op in sorted(latencias):
+        ms = np.array(latencias[op]) * 1000
+        resumen[op] = {
+            'operaciones': int(len(ms)),
+            'errores': errores[op],
+            'ops_por_s': len(ms) / duracion,
+            'p50_ms': float(np.percentile(ms, 50)),
+            'p95_ms': float(np.percentile(ms, 95)),
+            'p99_ms': float(np.percentile(ms, 99)),
+            'max_ms': float(ms.max()),
+            'servicio_p50_ms': float(np.percentile(np.array(servicio[op]) * 1000, 50))
+        }
+    return resumen
+
+
+def ejecutar(directorio, n_campesinos, n_camiones, n_compradores, n_publicaciones, procesos, tasa, mezcla, segundos, semilla):
+    campesinos = [f"Campesino {i}" for i in range(n_campesinos)]
+    camiones = [f"Camión {i}" for i in range(n_camiones)]
+    compradores = [f"Comprador {i}" for i in range(n_compradores)]
+    usar_directorio(directorio)
+    preparar_datos(directorio, n_publicaciones, campesinos, camiones, semilla)
+    # el modelo de ETA se carga (o entrena) una vez aquí y los procesos hijos lo heredan
+    estimar_eta_minutos([UBICACIONES_CIUDADES['Tunja']], [UBICACIONES_CIUDADES['Duitama']])
+
+    inicio = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=procesos) as pool:
+        resultados = list(pool.map(
+            trabajador, [directorio] * procesos, range(procesos), [tasa / procesos] * procesos,
+            [mezcla] * procesos, [segundos] * procesos, [semilla] * procesos,
+            [campesinos] * procesos, [camiones] * procesos, [compradores] * procesos
+        ))
+    duracion = time.perf_counter() - inicio
+    return resumir(resultados, duracion), duracion
+
+
+def leer_mezcla(texto):
+    """'registro=3,movimiento=2' -> {'registro': 3.0, 'movimiento': 2.0}"""
+    mezcla = {}
+    for parte in texto.split(','):
+        nombre, _, peso = parte.partition('=')
+        if nombre.strip() not in MEZCLA_DEFECTO:
+            raise argparse.ArgumentTypeError(f"Operación desconocida: {nombre} (válidas: {', '.join(MEZCLA_DEFECTO)})")
+        mezcla[nombre.strip()] = float(peso or 1)
+    return mezcla
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generador de carga de campesinos, camiones y compradores")
+    parser.add_argument("--campesinos", type=int, default=500)
+    parser.add_argument("--camiones", type=int, default=100)
+    parser.add_argument("--compradores", type=int, default=50)
+    parser.add_argument("--publicaciones", type=int, default=200, help="Publicaciones iniciales en el CSV")
+    parser.add_argument("--procesos", type=int, default=4)
+    parser.add_argument("--tasa", type=float, default=20, help="Operaciones por segundo entre todos los procesos")
+    parser.add_argument("--mezcla", type=leer_mezcla, default=MEZCLA_DEFECTO,
+                        help="Pesos por operación, p. ej. registro=3,movimiento=3,compra=1")
+    parser.add_argument("--segundos", type=float, default=30)
+    parser.add_argument("--semilla", type=int, default=SEMILLA)
+    parser.add_argument("--salida", help="Guarda el resumen en JSON")
+    args = parser.parse_args()
+
+    directorio = tempfile.mkdtemp(prefix="carga_flota_")
+    print(f"Datos de prueba en {directorio}")
+    resumen, duracion = ejecutar(directorio, args.campesinos, args.camiones, args.compradores, args.publicaciones,
+                                 args.procesos, args.tasa, args.mezcla, args.segundos, args.semilla)
+
+    total = sum(r['operaciones'] for r in resumen.values())
+    print(f"{total} operaciones en {duracion:.1f} s ({total / duracion:.1f} ops/s, objetivo {args.tasa:.1f})")
+    print(f"{'operación':<12}{'n':>7}{'err':>6}{'ops/s':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'máx ms':>10}{'serv. p50':>11}")
+    for op, r in resumen.items():
+        print(f"{op:<12}{r['operaciones']:>7}{r['errores']:>6}{r['ops_por_s']:>8.1f}{r['p50_ms']:>10.1f}"
+              f"{r['p95_ms']:>10.1f}{r['p99_ms']:>10.1f}{r['max_ms']:>10.1f}{r['servicio_p50_ms']:>11.1f}")
+
+    if args.salida:
+        with open(args.salida, "w", encoding="utf-8") as f:
+            json.dump({'parametros': {k: v for k, v in vars(args).items() if k != 'salida'},
+                       'duracion_s': duracion, 'operaciones': resumen}, f, indent=2, ensure_ascii=False)
+        print(f"Resumen guardado en {args.salida}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,182 @@
+"""
+Generador de carga para el servicio de ingesta GPS.
+
+Simula camiones que envían lotes de pings desde varios procesos por
+conexiones persistentes y reporta pings/s y percentiles de latencia. Con
+--levantar arranca el servicio en este mismo proceso sobre una copia del CSV
+de notificaciones, para probarlo sin tocar los datos reales; a la copia se le
+agregan viajes aceptados de los camiones sintéticos, para que cada vaciado
+ejercite la escritura completa (CSV, trayectos, bitácora y geocercas). Uso:
+
+    python App/benchmarks/carga_gps.py --levantar --camiones 500 --segundos 10
+    python App/benchmarks/carga_gps.py --url http://127.0.0.1:8765 --procesos 4
+"""
+import argparse
+import http.client
+import json
+import os
+import shutil
+import socket
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from urllib.parse import urlparse
+
+import numpy as np
+import pandas as pd
+
+# Configuración de rutas
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "modules"))
+
+from rutas import UBICACIONES_CIUDADES
+from ingesta_gps import CSV_NOTIFICACIONES, PUERTO_DEFECTO, BufferPosiciones, crear_servidor
+
+
+SEMILLA = 2025
+VIAJES_POR_CAMION = 2
+
+
+def recuadro_boyaca():
+    lats = [c[0] for c in UBICACIONES_CIUDADES.values()]
+    lons = [c[1] for c in UBICACIONES_CIUDADES.values()]
+    return min(lats), max(lats), min(lons), max(lons)
+
+
+def conectar(destino):
+    conexion = http.client.HTTPConnection(destino.hostname, destino.port, timeout=10)
+    conexion.connect()
+    conexion.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    return conexion
+
+
+def trabajador(url, camiones, pings_por_lote, segundos, semilla):
+    """Envía lotes durante 'segundos' y devuelve (pings enviados, latencias en s, errores)"""
+    destino = urlparse(url)
+    conexion = conectar(destino)
+    rng = np.random.default_rng(semilla)
+    lat_min, lat_max, lon_min, lon_max = recuadro_boyaca()
+    lat = rng.uniform(lat_min, lat_max, len(camiones))
+    lon = rng.uniform(lon_min, lon_max, len(camiones))
+
+    enviados, errores, latencias = 0, 0, []
+    fin = time.perf_counter() + segundos
+    while time.perf_counter() < fin:
+        elegidos = rng.integers(len(camiones), size=pings_por_lote)
+        lat[elegidos] += rng.normal(0, 0.0005, pings_por_lote)
+        lon[elegidos] += rng.normal(0, 0.0005, pings_por_lote)
+        ahora = time.time()
+        cuerpo = json.dumps({'pings': [
+            {'transportista': camiones[i], 'lat': float(lat[i]), 'lon': float(lon[i]), 'timestamp': ahora}
+            for i in elegidos.tolist()
+        ]})
+        inicio = time.perf_counter()
+        try:
+            conexion.request("POST", "/posiciones", body=cuerpo, headers={"Content-Type": "application/json"})
+            respuesta = conexion.getresponse()
+            respuesta.read()
+            if respuesta.status == 202:
+                enviados += pings_por_lote
+            else:
+                errores += 1
+        except (OSError, http.client.HTTPException):
+            errores += 1
+            conexion.close()
+            conexion = conectar(destino)
+        latencias.append(time.perf_counter() - inicio)
+    conexion.close()
+    return enviados, latencias, errores
+
+
+def nombres_camiones(n_camiones):
+    return [f"Camión {i}" for i in range(n_camiones)]
+
+
+def preparar_viajes(ruta_csv, camiones, viajes_por_camion, semilla):
+    """Agrega al CSV de prueba viajes aceptados de los camiones sintéticos, con destino en Boyacá"""
+    rng = np.random.default_rng(semilla)
+    lat_min, lat_max, lon_min, lon_max = recuadro_boyaca()
+    n = len(camiones) * viajes_por_camion
+    viajes = pd.DataFrame({
+        'id_notificacion': [f"CARGA-GPS-{i}" for i in range(n)],
+        'estado': 'Aceptado',
+        'transportista_asignado': np.repeat(camiones, viajes_por_camion),
+        'producto': 'Papa',
+        'cantidad_kg': 50,
+        'latitud': rng.uniform(lat_min, lat_max, n),
+        'longitud': rng.uniform(lon_min, lon_max, n),
+    })
+    if os.path.exists(ruta_csv):
+        viajes = pd.concat([pd.read_csv(ruta_csv), viajes], ignore_index=True)
+    viajes.to_csv(ruta_csv, index=False)
+    return n
+
+
+def ejecutar(url, n_camiones, procesos, pings_por_lote, segundos, semilla):
+    camiones = nombres_camiones(n_camiones)
+    reparto = [camiones[p::procesos] for p in range(procesos)]
+    inicio = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=procesos) as pool:
+        resultados = list(pool.map(
+            trabajador, [url] * procesos, reparto, [pings_por_lote] * procesos,
+            [segundos] * procesos, [semilla + p for p in range(procesos)]
+        ))
+    duracion = time.perf_counter() - inicio
+    enviados = sum(r[0] for r in resultados)
+    latencias = np.concatenate([r[1] for r in resultados]) * 1000
+    errores = sum(r[2] for r in resultados)
+    return {
+        'pings': enviados,
+        'lotes': int(len(latencias)),
+        'errores': errores,
+        'pings_por_s': enviados / duracion,
+        'latencia_p50_ms': float(np.percentile(latencias, 50)) if len(latencias) else 0.0,
+        'latencia_p95_ms': float(np.percentile(latencias, 95)) if len(latencias) else 0.0,
+        'latencia_p99_ms': float(np.percentile(latencias, 99)) if len(latencias) else 0.0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generador de carga para la ingesta GPS")
+    parser.add_argument("--url", default=f"http://127.0.0.1:{PUERTO_DEFECTO}")
+    parser.add_argument("--levantar", action="store_true", help="Arranca el servicio aquí sobre una copia del CSV")
+    parser.add_argument("--camiones", type=int, default=500)
+    parser.add_argument("--procesos", type=int, default=2)
+    parser.add_argument("--lote", type=int, default=100, help="Pings por petición")
+    parser.add_argument("--segundos", type=float, default=10)
+    parser.add_argument("--semilla", type=int, default=SEMILLA)
+    parser.add_argument("--viajes", type=int, default=VIAJES_POR_CAMION,
+                        help="Viajes aceptados por camión en la copia del CSV (con --levantar)")
+    args = parser.parse_args()
+
+    servidor = buffer = None
+    if args.levantar:
+        copia = os.path.join(tempfile.mkdtemp(prefix="carga_gps_"), "notificaciones_transporte.csv")
+        if os.path.exists(CSV_NOTIFICACIONES):
+            shutil.copy(CSV_NOTIFICACIONES, copia)
+        sembrados = preparar_viajes(copia, nombres_camiones(args.camiones), args.viajes, args.semilla)
+        buffer = BufferPosiciones(copia)
+        buffer.iniciar()
+        servidor = crear_servidor(buffer, "127.0.0.1", 0)
+        threading.Thread(target=servidor.serve_forever, daemon=True).start()
+        args.url = f"http://127.0.0.1:{servidor.server_address[1]}"
+        print(f"Servicio de prueba en {args.url} sobre {copia} ({sembrados} viajes aceptados de prueba)")
+
+    r = ejecutar(args.url, args.camiones, args.procesos, args.lote, args.segundos, args.semilla)
+    print(f"{r['pings']} pings en {r['lotes']} lotes ({r['errores']} errores)")
+    print(f"Throughput: {r['pings_por_s']:,.0f} pings/s")
+    print(f"Latencia por lote: p50 {r['latencia_p50_ms']:.2f} ms | p95 {r['latencia_p95_ms']:.2f} ms | p99 {r['latencia_p99_ms']:.2f} ms")
+
+    if servidor is not None:
+        servidor.shutdown()
+        buffer.detener()
+        e = buffer.estadisticas
+        print(f"Servicio: {e['recibidos']} recibidos, {e['vaciados']} escrituras en grupo, "
+              f"{e['viajes_actualizados']} viajes actualizados, último vaciado {e['ultimo_vaciado_ms']:.1f} ms")
+        if r['pings'] and not e['viajes_actualizados']:
+            sys.exit("Ningún viaje se actualizó: la medición no cubrió la escritura en grupo")
+
+
+if __name__ == "__main__":
+    main()
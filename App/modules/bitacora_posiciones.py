@@ -0,0 +1,97 @@
+import os
+import re
+import threading
+from datetime import datetime
+import pandas as pd
+
+
+# CONFIGURACIÓN
+
+APP_ROOT = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+DIR_BITACORA = os.path.join(APP_ROOT, "data", "bitacora_posiciones")
+
+# cada fila es una posición publicada, con el destino para poder reevaluar geocercas al reproducir
+COLUMNAS_BITACORA = [
+    'instante', 'id_notificacion', 'transportista',
+    'transportista_lat', 'transportista_lon', 'progreso_viaje',
+    'distancia_restante_km', 'tiempo_estimado_llegada', 'latitud', 'longitud'
+]
+
+
+def dia_de(instante):
+    return datetime.fromtimestamp(instante).strftime("%Y-%m-%d")
+
+
+def filas_bitacora(df, indices, instante):
+    """Registros de bitácora de las filas indicadas de un DataFrame de notificaciones"""
+    registros = df.loc[indices, ['id_notificacion', 'transportista_asignado'] + COLUMNAS_BITACORA[3:]]
+    registros = registros.rename(columns={'transportista_asignado': 'transportista'}).reset_index(drop=True)
+    registros.insert(0, 'instante', instante)
+    return registros
+
+
+class BitacoraPosiciones:
+    """
+    Registro completo (sin reducir) de las posiciones de cada día, un CSV de solo
+    agregar por día: data/bitacora_posiciones/AAAA-MM-DD.csv. Es la grabación que
+    luego se reproduce (ver reproduccion).
+    """
+
+    def __init__(self, directorio=DIR_BITACORA):
+        self.directorio = directorio
+        self._lock = threading.Lock()
+
+    def archivo(self, dia):
+        return os.path.join(self.directorio, f"{dia}.csv")
+
+    def registrar_filas(self, df, indices, instante):
+        """Agrega las filas indicadas de un DataFrame de notificaciones ya actualizado"""
+        if len(indices) == 0:
+            return 0
+        return self.agregar(filas_bitacora(df, indices, instante))
+
+    def agregar(self, registros):
+        """Agrega registros con COLUMNAS_BITACORA al archivo del día de cada uno"""
+        if registros.empty:
+            return 0
+        registros = registros[COLUMNAS_BITACORA]
+        dias = registros['instante'].map({t: dia_de(t) for t in registros['instante'].unique()})
+        with self._lock:
+            os.makedirs(self.directorio, exist_ok=True)
+            for dia, del_dia in registros.groupby(dias, sort=True):
+                archivo = self.archivo(dia)
+                nuevo = not os.path.exists(archivo)
+                # una sola escritura en modo append, como la cola de eventos de geocerca
+                with open(archivo, "a", encoding="utf-8", newline="") as f:
+                    f.write((",".join(COLUMNAS_BITACORA) + "\n" if nuevo else "") + del_dia.to_csv(index=False, header=False))
+        return len(registros)
+
+    def dias(self):
+        if not os.path.isdir(self.directorio):
+            return []
+        return sorted(n[:-4] for n in os.listdir(self.directorio) if re.fullmatch(r"\d{4}-\d{2}-\d{2}\.csv", n))
+
+    def leer(self, dia):
+        """Posiciones del día ordenadas por instante (orden estable dentro de cada instante)"""
+        archivo = self.archivo(dia)
+        if not os.path.exists(archivo):
+            return pd.DataFrame(columns=COLUMNAS_BITACORA)
+        registros = pd.read_csv(archivo, on_bad_lines='skip')
+        return registros.sort_values('instante', kind='stable').reset_index(drop=True)
+
+    def borrar(self, dia):
+        with self._lock:
+            if os.path.exists(self.archivo(dia)):
+                os.remove(self.archivo(dia))
+
+
+_bitacora = None
+_lock_bitacora = threading.Lock()
+
+
+def obtener_bitacora(directorio=DIR_BITACORA):
+    global _bitacora
+    with _lock_bitacora:
+        if _bitacora is None:
+            _bitacora = BitacoraPosiciones(directorio)
+        return _bitacora
@@ -0,0 +1,152 @@
+import threading
+import time
+import uuid
+from collections import deque, namedtuple
+
+
+# CONFIGURACIÓN
+
+MAX_EVENTOS = 5000       # historial reciente que conserva el bus
+INTERVALO_ESCUCHA_S = 3  # cada cuánto mira una sesión si llegó algo que le interesa
+TEMAS = ('tipo', 'campesino', 'transportista', 'producto', 'ciudad')
+
+# Tipos de evento que publican las escrituras de los módulos
+PUBLICADA = 'publicada'        # un campesino registró un producto
+ACEPTADA = 'aceptada'          # un transportista aceptó recogerlo
+RECOGIDA = 'recogida'          # el transportista ya tiene el producto
+RETIRADA = 'retirada'          # el vendedor lo sacó del marketplace
+VENDIDA = 'vendida'            # un comprador lo compró (total o parcialmente)
+ENTREGA_ASIGNADA = 'entrega_asignada'
+ENTREGADA = 'entregada'
+
+MENSAJES_BUS = {
+    PUBLICADA: "🆕 Nuevo producto: {producto} en {ciudad}",
+    ACEPTADA: "🚛 {transportista} aceptó recoger {producto} de {campesino}",
+    RECOGIDA: "✅ {producto} de {campesino} fue recogido",
+    RETIRADA: "🗑️ {producto} fue retirado del marketplace",
+    VENDIDA: "💰 Se vendió {producto} de {campesino}",
+    ENTREGA_ASIGNADA: "🔁 {transportista} tomó la entrega de {producto}",
+    ENTREGADA: "📦 {producto} fue entregado"
+}
+
+Evento = namedtuple('Evento', ['version', 'instante', 'tipo', 'id_notificacion',
+                               'campesino', 'transportista', 'producto', 'ciudad', 'origen'])
+
+
+def _texto(valor):
+    # NaN/None de pandas no son un tema válido
+    return None if valor is None or valor != valor else str(valor)
+
+
+def describir_evento(evento):
+    return MENSAJES_BUS.get(evento.tipo, evento.tipo).format(**{k: v or '—' for k, v in evento._asdict().items()})
+
+
+# BUS
+
+class BusEventos:
+    """Bus publicar/suscribir en memoria, compartido por todas las sesiones del proceso"""
+
+    def __init__(self, max_eventos=MAX_EVENTOS):
+        self._eventos = deque(maxlen=max_eventos)
+        self._version = 0
+        self._lock = threading.Lock()
+
+    @property
+    def version(self):
+        return self._version
+
+    def publicar(self, tipo, id_notificacion=None, campesino=None, transportista=None, producto=None,
+                 ciudad=None, origen=None):
+        """'origen' es la suscripción de quien publica: a ella no se le devuelve su propio evento"""
+        with self._lock:
+            self._version += 1
+            evento = Evento(self._version, time.time(), tipo, _texto(id_notificacion), _texto(campesino),
+                            _texto(transportista), _texto(producto), _texto(ciudad),
+                            origen.origen if isinstance(origen, Suscripcion) else origen)
+            self._eventos.append(evento)
+        return evento
+
+    def publicar_fila(self, tipo, fila, transportista=None, origen=None):
+        """Publica un evento con los temas de una fila de notificaciones"""
+        return self.publicar(
+            tipo,
+            id_notificacion=fila.get('id_notificacion'),
+            campesino=fila.get('campesino'),
+            transportista=transportista if transportista is not None else fila.get('transportista_asignado'),
+            producto=fila.get('producto'),
+            ciudad=fila.get('ciudad'),
+            origen=origen
+        )
+
+    def publicar_filas(self, tipo, filas, transportista=None, origen=None):
+        """Un evento por cada fila de un DataFrame de notificaciones"""
+        return [self.publicar_fila(tipo, fila, transportista, origen) for fila in filas.to_dict('records')]
+
+    def eventos_desde(self, version):
+        """Eventos con versión posterior a 'version', del más antiguo al más nuevo"""
+        with self._lock:
+            if version >= self._version:
+                return []
+            nuevos = []
+            for evento in reversed(self._eventos):
+                if evento.version <= version:
+                    break
+                nuevos.append(evento)
+        return nuevos[::-1]
+
+    def suscribir(self, *filtros):
+        return Suscripcion(self, filtros)
+
+
+class Suscripcion:
+    """
+    Cada filtro es un dict tema -> valor (o conjunto de valores) y exige todos sus temas;
+    el evento interesa si cumple al menos uno de los filtros. Sin filtros interesa todo.
+    Mirar si hay novedades cuando no pasó nada es comparar dos enteros.
+    """
+
+    def __init__(self, bus, filtros=()):
+        self.bus = bus
+        self.version = bus.version
+        self.origen = uuid.uuid4().hex
+        self.filtrar(*filtros)
+
+    def filtrar(self, *filtros):
+        self._filtros = [
+            {tema: ({_texto(v) for v in valor} if isinstance(valor, (set, list, tuple, frozenset)) else {_texto(valor)})
+             for tema, valor in filtro.items() if tema in TEMAS}
+            for filtro in filtros
+        ]
+
+    def coincide(self, evento):
+        if evento.origen == self.origen:
+            return False
+        if not self._filtros:
+            return True
+        return any(all(getattr(evento, tema) in valores for tema, valores in filtro.items())
+                   for filtro in self._filtros)
+
+    def nuevos(self):
+        """Eventos relevantes llegados desde la última consulta"""
+        if self.bus.version == self.version:
+            return []
+        eventos = self.bus.eventos_desde(self.version)
+        if not eventos:
+            return []
+        # si el historial ya descartó eventos que no se vieron, por si acaso todo interesa
+        perdidos = eventos[0].version > self.version + 1
+        self.version = eventos[-1].version
+        return eventos if perdidos else [e for e in eventos if self.coincide(e)]
+
+
+_bus = None
+_lock_bus = threading.Lock()
+
+
+def obtener_bus():
+    global _bus
+    with _lock_bus:
+        if _bus is None:
+            _bus = BusEventos()
+        return _bus
@@ -7,13 +7,22 @@ import joblib
 from tensorflow.keras.models import load_model
 from tensorflow.keras.preprocessing import image
 import json
+import hashlib
 import numpy as np
 from pathlib import Path
 from PIL import Image
 import time
+import threading
 import folium
 from streamlit_folium import st_folium
 from folium import plugins
+from seguimiento import LOCK_NOTIFICACIONES, escribir_csv_atomico
+from historial_posiciones import cargar_rastro
+from polilineas import douglas_peucker, obtener_almacen_polilineas, tolerancia_para_zoom
+from geocercas import MENSAJES_EVENTO, obtener_motor_geocercas
+from servidor_teselas import ATRIBUCIONES, url_teselas
+from servicio_precios import obtener_tabla_precios
+from bus_eventos import PUBLICADA, describir_evento, obtener_bus
 
 
 # CONFIGURACIÓN DE RUTAS Y ARCHIVOS
@@ -32,6 +41,8 @@ CSV_NOTIFICACIONES = os.path.join(DATA_DIR, "notificaciones_transporte.csv")
 
 # Configuración de auto-refresh
 AUTO_REFRESH_INTERVAL = 5  # segundos
+_cache_en_vivo = {'firma': None, 'df': None}
+_lock_en_vivo = threading.Lock()
 
 
 # PRESENTACIONES Y EQUIVALENCIAS (GLOBAL)
@@ -116,6 +127,8 @@ MODEL_CALIDAD_PATH = os.path.join(MODELS_DIR, "modelo_rutas_boyaca.pkl")
 modelo_precio = None
 modelo_calidad = None
 IA_CARGADA = False
+# precios de todo el catálogo en una pasada del modelo; se recalcula si cambia el .pkl
+tabla_precios = obtener_tabla_precios(MODEL_PRECIO_PATH, PRESENTACIONES, KG_EQUIVALENTES)
 
 with st.sidebar.expander("🔍 Debug Info", expanded=False):
     st.write("📂 App Root:", APP_ROOT)
@@ -129,8 +142,11 @@ with st.sidebar.expander("🔍 Debug Info", expanded=False):
     
     try:
         if os.path.exists(MODEL_PRECIO_PATH):
-            modelo_precio = joblib.load(MODEL_PRECIO_PATH)
-            st.success("✅ Modelo de precios cargado")
+            modelo_precio = tabla_precios.modelo()
+            if tabla_precios.error_tabla is None:
+                st.success(f"✅ Modelo de precios cargado ({len(tabla_precios)} precios precalculados)")
+            else:
+                st.warning(f"⚠️ Modelo de precios cargado sin precálculo; se predice al consultar: {tabla_precios.error_tabla}")
         else:
             st.warning("⚠️ No se encontró: modelo_precios.pkl")
         
@@ -180,6 +196,9 @@ def inicializar_session_state():
         st.session_state.refresh_counter = 0
     if 'auto_refresh_enabled' not in st.session_state:
         st.session_state.auto_refresh_enabled = True
+    if 'campesinos_propios' not in st.session_state:
+        # nombres con los que esta sesión registró productos: la app no tiene inicio de sesión
+        st.session_state.campesinos_propios = set()
 
 
 # FUNCIONES AUXILIARES
@@ -210,8 +229,30 @@ def cargar_notificaciones():
             'ruta_optimizada', 'orden_parada'
         ])
 
+def firma_notificaciones():
+    """(mtime, tamaño) del CSV: saber si cambió cuesta un stat, no una lectura"""
+    try:
+        info = os.stat(CSV_NOTIFICACIONES)
+        return info.st_mtime_ns, info.st_size
+    except OSError:
+        return None
+
+def leer_notificaciones_en_vivo():
+    """
+    Notificaciones indexadas por id, compartidas por todas las sesiones del proceso.
+    El CSV solo se vuelve a leer cuando cambia su firma; el resultado es de solo lectura.
+    """
+    firma = firma_notificaciones()
+    with _lock_en_vivo:
+        if _cache_en_vivo['df'] is None or firma != _cache_en_vivo['firma']:
+            df = cargar_notificaciones().drop_duplicates('id_notificacion', keep='last')
+            _cache_en_vivo['df'] = df.set_index('id_notificacion', drop=False)
+            _cache_en_vivo['firma'] = firma
+        return _cache_en_vivo['df']
+
 def guardar_notificaciones(df):
-    df.to_csv(CSV_NOTIFICACIONES, index=False)
+    with LOCK_NOTIFICACIONES:
+        escribir_csv_atomico(df, CSV_NOTIFICACIONES)
 
 def guardar_imagen_subida(archivo_subido, prefix="imagen"):
     timestamp = datetime.now().strftime('%Y%m%d%H%M%S')
@@ -288,39 +329,26 @@ def predecir_producto_real(img_path):
 
 # FUNCIÓN PARA CREAR MAPA INTERACTIVO CON FOLIUM
 
-def crear_mapa_seguimiento_folium(lat_campesino, lon_campesino, lat_transportista=None, 
-                                   lon_transportista=None, distancia_km=None, progreso=0.0,
-                                   transportista_nombre=None):
-    """
-    Crea un mapa interactivo con Folium mostrando seguimiento en tiempo real
-    """
-    # Determinar el centro y zoom del mapa
-    if lat_transportista and lon_transportista and validar_coordenadas(lat_transportista, lon_transportista):
-        center_lat = (lat_campesino + lat_transportista) / 2
-        center_lon = (lon_campesino + lon_transportista) / 2
-        
-        if distancia_km:
-            if distancia_km < 5:
-                zoom = 13
-            elif distancia_km < 20:
-                zoom = 11
-            elif distancia_km < 50:
-                zoom = 10
-            else:
-                zoom = 9
-        else:
-            zoom = 11
-    else:
-        center_lat = lat_campesino
-        center_lon = lon_campesino
-        zoom = 13
-    
-    # Crear mapa base con estilo Google Maps
+def zoom_para_distancia(distancia_km):
+    """Zoom de Leaflet que deja ver un tramo de esa longitud"""
+    if not distancia_km:
+        return 11
+    if distancia_km < 5:
+        return 13
+    elif distancia_km < 20:
+        return 11
+    elif distancia_km < 50:
+        return 10
+    return 9
+
+
+def crear_mapa_base(center_lat, center_lon, zoom):
+    """Mapa con estilo Google Maps y los controles de pantalla completa, ubicación y medición"""
     mapa = folium.Map(
         location=[center_lat, center_lon],
         zoom_start=zoom,
-        tiles='https://mt1.google.com/vt/lyrs=r&x={x}&y={y}&z={z}',
-        attr='Google',
+        tiles=url_teselas('google'),  # estilo Google Maps (por el proxy local si se configuró TESELAS_URL)
+        attr=ATRIBUCIONES['google'],
         control_scale=True
     )
     
@@ -334,7 +362,11 @@ def crear_mapa_seguimiento_folium(lat_campesino, lon_campesino, lat_transportist
     
     plugins.LocateControl(auto_start=False).add_to(mapa)
     plugins.MeasureControl(position='bottomleft', primary_length_unit='kilometers').add_to(mapa)
-    
+    return mapa
+
+
+def agregar_destino_al_mapa(capa, lat_campesino, lon_campesino):
+    """Parte estática de un viaje: punto de entrega y su zona"""
     # Marcador del campesino (punto de entrega)
     folium.Marker(
         location=[lat_campesino, lon_campesino],
@@ -363,11 +395,36 @@ def crear_mapa_seguimiento_folium(lat_campesino, lon_campesino, lat_transportist
             icon='home',
             prefix='fa'
         )
-    ).add_to(mapa)
+    ).add_to(capa)
     
+    # Círculo alrededor del punto de entrega
+    folium.Circle(
+        location=[lat_campesino, lon_campesino],
+        radius=500,
+        color='#34A853',
+        fill=True,
+        fillColor='#34A853',
+        fillOpacity=0.1,
+        weight=2,
+        opacity=0.5,
+        tooltip='Zona de entrega'
+    ).add_to(capa)
+
+
+def agregar_transportista_al_mapa(capa, lat_campesino, lon_campesino, lat_transportista=None,
+                                  lon_transportista=None, distancia_km=None, progreso=0.0,
+                                  transportista_nombre=None, tiempo_estimado=None, rastro=None,
+                                  ruta_restante=None):
+    """
+    Parte que cambia en cada refresco: transportista, recorrido hecho y ruta restante.
+    ruta_restante: (M, 2) por carretera desde la posición actual; sin ella, línea directa.
+    """
     # Marcador del transportista (si existe y está en camino)
     if lat_transportista and lon_transportista and validar_coordenadas(lat_transportista, lon_transportista):
-        tiempo_estimado = int(distancia_km / 50 * 60) if distancia_km else 0
+        if tiempo_estimado is None:
+            tiempo_estimado = int(distancia_km / 50 * 60) if distancia_km else 0
+        else:
+            tiempo_estimado = int(tiempo_estimado)
         
         popup_content = f"""
             <div style='font-family: Arial; padding: 12px; width: 280px;'>
@@ -409,11 +466,22 @@ def crear_mapa_seguimiento_folium(lat_campesino, lon_campesino, lat_transportist
                 icon='truck',
                 prefix='fa'
             )
-        ).add_to(mapa)
+        ).add_to(capa)
+        
+        # Recorrido ya hecho (migas de pan) desde el histórico de posiciones
+        if rastro is not None and len(rastro) > 1:
+            folium.PolyLine(
+                locations=rastro[:, 1:3].tolist(),
+                color='#757575',
+                weight=3,
+                opacity=0.7,
+                tooltip="Recorrido del transportista",
+                dash_array='2, 6'
+            ).add_to(capa)
         
         # Línea de ruta entre transportista y destino
         folium.PolyLine(
-            locations=[
+            locations=ruta_restante.tolist() if ruta_restante is not None else [
                 [lat_transportista, lon_transportista],
                 [lat_campesino, lon_campesino]
             ],
@@ -422,7 +490,7 @@ def crear_mapa_seguimiento_folium(lat_campesino, lon_campesino, lat_transportist
             opacity=0.8,
             tooltip=f"Ruta restante: {distancia_km:.2f} km" if distancia_km else "Ruta estimada",
             dash_array='10, 5'
-        ).add_to(mapa)
+        ).add_to(capa)
         
         # Círculo de proximidad alrededor del transportista
         folium.Circle(
@@ -435,29 +503,195 @@ def crear_mapa_seguimiento_folium(lat_campesino, lon_campesino, lat_transportist
             weight=2,
             opacity=0.6,
             tooltip='Área de cobertura del transportista'
-        ).add_to(mapa)
-        
-        # Ajustar vista para mostrar ambos puntos
+        ).add_to(capa)
+
+
+def agregar_viaje_al_mapa(capa, lat_campesino, lon_campesino, lat_transportista=None,
+                          lon_transportista=None, distancia_km=None, progreso=0.0,
+                          transportista_nombre=None, tiempo_estimado=None, rastro=None):
+    """Punto de entrega, transportista, recorrido y ruta restante de un viaje sobre un mapa o una capa"""
+    agregar_destino_al_mapa(capa, lat_campesino, lon_campesino)
+    agregar_transportista_al_mapa(capa, lat_campesino, lon_campesino, lat_transportista, lon_transportista,
+                                  distancia_km, progreso, transportista_nombre, tiempo_estimado, rastro)
+
+
+def crear_mapa_seguimiento_folium(lat_campesino, lon_campesino, lat_transportista=None, 
+                                   lon_transportista=None, distancia_km=None, progreso=0.0,
+                                   transportista_nombre=None, tiempo_estimado=None, rastro=None):
+    """
+    Crea un mapa interactivo con Folium mostrando seguimiento en tiempo real.
+    rastro: arreglo (N, 3) de (t, lat, lon) con el recorrido ya hecho por el transportista.
+    """
+    # Determinar el centro y zoom del mapa
+    con_transportista = bool(lat_transportista and lon_transportista and validar_coordenadas(lat_transportista, lon_transportista))
+    if con_transportista:
+        center_lat = (lat_campesino + lat_transportista) / 2
+        center_lon = (lon_campesino + lon_transportista) / 2
+        zoom = zoom_para_distancia(distancia_km)
+    else:
+        center_lat = lat_campesino
+        center_lon = lon_campesino
+        zoom = 13
+    
+    mapa = crear_mapa_base(center_lat, center_lon, zoom)
+    agregar_viaje_al_mapa(mapa, lat_campesino, lon_campesino, lat_transportista, lon_transportista,
+                          distancia_km, progreso, transportista_nombre, tiempo_estimado, rastro)
+    
+    # Ajustar vista para mostrar ambos puntos
+    if con_transportista:
         mapa.fit_bounds([
             [lat_campesino, lon_campesino],
             [lat_transportista, lon_transportista]
         ], padding=[50, 50])
     
-    # Círculo alrededor del punto de entrega
-    folium.Circle(
-        location=[lat_campesino, lon_campesino],
-        radius=500,
-        color='#34A853',
-        fill=True,
-        fillColor='#34A853',
-        fillOpacity=0.1,
-        weight=2,
-        opacity=0.5,
-        tooltip='Zona de entrega'
-    ).add_to(mapa)
-    
     return mapa
 
+
+def encuadre(puntos):
+    """Centro y zoom que abarcan todos los puntos (lat, lon)"""
+    puntos = np.asarray(puntos, dtype=np.float64).reshape(-1, 2)
+    minimo, maximo = puntos.min(axis=0), puntos.max(axis=0)
+    diagonal = calcular_distancia_haversine(tuple(minimo), tuple(maximo))
+    return [float((minimo[0] + maximo[0]) / 2), float((minimo[1] + maximo[1]) / 2)], zoom_para_distancia(diagonal)
+
+
+def zoom_del_mapa(clave, defecto):
+    """
+    Zoom que el usuario tiene en el navegador: st_folium lo deja en la sesión bajo su clave
+    cada vez que cambia (returned_objects=['zoom']). Antes de tocar el mapa, el inicial.
+    """
+    valor = st.session_state.get(clave)
+    zoom = valor.get('zoom') if isinstance(valor, dict) else None
+    return int(zoom) if zoom else defecto
+
+
+def huella_capa_estatica(ids, puntos):
+    """Hash de los puntos de entrega: la capa estática solo se rehace si cambian"""
+    huella = hashlib.sha1("|".join(map(str, ids)).encode("utf-8"))
+    huella.update(np.ascontiguousarray(puntos, dtype=np.float64).tobytes())
+    return huella.hexdigest()
+
+
+def crear_mapa_seguimiento_estatico(lat_campesino, lon_campesino, lat_transportista=None, lon_transportista=None,
+                                    distancia_km=None):
+    """
+    Capa estática del seguimiento de un pedido: base, punto y zona de entrega. El
+    encuadre se toma con la posición del transportista al momento de crearla.
+    """
+    con_transportista = bool(lat_transportista and lon_transportista and validar_coordenadas(lat_transportista, lon_transportista))
+    if con_transportista:
+        mapa = crear_mapa_base((lat_campesino + lat_transportista) / 2, (lon_campesino + lon_transportista) / 2,
+                               zoom_para_distancia(distancia_km))
+    else:
+        mapa = crear_mapa_base(lat_campesino, lon_campesino, 13)
+    agregar_destino_al_mapa(mapa, lat_campesino, lon_campesino)
+    if con_transportista:
+        mapa.fit_bounds([[lat_campesino, lon_campesino], [lat_transportista, lon_transportista]], padding=[50, 50])
+    return mapa
+
+
+def geometria_para_zoom(id_notificacion, lat_transportista, lon_transportista, rastro, zoom):
+    """
+    Recorrido hecho y ruta restante por carretera con el detalle que se alcanza a ver a
+    ese zoom (Douglas-Peucker, ver polilineas). Sin ruta guardada la restante es None.
+    """
+    if rastro is not None and len(rastro) > 2:
+        rastro = rastro[douglas_peucker(rastro[:, 1:3], tolerancia_para_zoom(zoom, rastro[0, 1]))]
+    ruta = obtener_almacen_polilineas().para_zoom(id_notificacion, zoom)
+    if ruta is None or len(ruta) < 2:
+        return rastro, None
+    # la ruta sigue desde el tramo más cercano al transportista
+    posicion = np.array([lat_transportista, lon_transportista], dtype=np.float64)
+    a, b = ruta[:-1], ruta[1:]
+    tramo = b - a
+    largo2 = (tramo ** 2).sum(axis=1)
+    t = np.clip(np.divide(((posicion - a) * tramo).sum(axis=1), largo2, out=np.zeros_like(largo2), where=largo2 > 0), 0.0, 1.0)
+    k = int(np.argmin(((a + t[:, None] * tramo - posicion) ** 2).sum(axis=1)))
+    return rastro, np.vstack([posicion, ruta[k + 1:]])
+
+
+def crear_capa_transportista(lat_campesino, lon_campesino, lat_transportista=None, lon_transportista=None,
+                             distancia_km=None, progreso=0.0, transportista_nombre=None,
+                             tiempo_estimado=None, rastro=None, ruta_restante=None):
+    """Capa dinámica del seguimiento: lo único que se vuelve a generar en cada refresco"""
+    capa = folium.FeatureGroup(name="🚛 Transportista")
+    agregar_transportista_al_mapa(capa, lat_campesino, lon_campesino, lat_transportista, lon_transportista,
+                                  distancia_km, progreso, transportista_nombre, tiempo_estimado, rastro,
+                                  ruta_restante)
+    return capa
+
+
+def crear_mapa_consolidado_estatico(viajes):
+    """
+    Parte estática del mapa con todos los viajes: base, controles y encuadre. Un iframe
+    y una carga de teselas sin importar cuántos viajes haya; los viajes van en
+    crear_capas_viajes.
+    """
+    puntos = np.vstack([viajes[['latitud', 'longitud']].to_numpy(dtype=np.float64),
+                        viajes[['transportista_lat', 'transportista_lon']].to_numpy(dtype=np.float64)])
+    puntos = puntos[~np.isnan(puntos).any(axis=1)]
+    centro, zoom = encuadre(puntos)
+    mapa = crear_mapa_base(centro[0], centro[1], zoom)
+    mapa.fit_bounds(puntos.tolist(), padding=[50, 50])
+    return mapa
+
+
+def crear_capas_viajes(viajes, rastros, zoom):
+    """
+    Un FeatureGroup dinámico por viaje con su punto de entrega, transportista, recorrido y
+    ruta restante (geometría simplificada para el zoom del mapa), para prender o apagar
+    cada viaje completo desde el control de capas. rastros: id -> (N, 3)
+    """
+    capas = []
+    for _, row in viajes.iterrows():
+        capa = folium.FeatureGroup(name=f"🧾 {row['id_notificacion']} · {row['producto']}", show=True)
+        agregar_destino_al_mapa(capa, row['latitud'], row['longitud'])
+        tiempo_estimado = row['tiempo_estimado_llegada'] if pd.notna(row.get('tiempo_estimado_llegada')) else None
+        distancia = row.get('distancia_restante_km')
+        rastro, ruta_restante = rastros.get(row['id_notificacion']), None
+        if validar_coordenadas(row.get('transportista_lat'), row.get('transportista_lon')):
+            rastro, ruta_restante = geometria_para_zoom(row['id_notificacion'], row['transportista_lat'],
+                                                        row['transportista_lon'], rastro, zoom)
+        agregar_transportista_al_mapa(
+            capa,
+            lat_campesino=row['latitud'],
+            lon_campesino=row['longitud'],
+            lat_transportista=row.get('transportista_lat'),
+            lon_transportista=row.get('transportista_lon'),
+            distancia_km=distancia if pd.notna(distancia) else None,
+            progreso=float(row['progreso_viaje']) if pd.notna(row.get('progreso_viaje')) else 0.0,
+            transportista_nombre=row['transportista_asignado'],
+            tiempo_estimado=tiempo_estimado,
+            rastro=rastro,
+            ruta_restante=ruta_restante
+        )
+        capas.append(capa)
+    return capas
+
+
+def mapa_estatico_en_cache(clave, huella, crear):
+    """Mapa estático guardado en la sesión; 'crear' solo se llama si la huella cambió"""
+    en_cache = st.session_state.get(clave)
+    if en_cache is not None and en_cache[0] == huella:
+        return en_cache[1]
+    mapa = crear()
+    st.session_state[clave] = (huella, mapa)
+    return mapa
+
+
+def st_folium_con_capas(mapa, capas, control_capas=None, **kwargs):
+    """
+    st_folium con capas dinámicas sobre un mapa estático en caché. st_folium agrega las
+    capas y el control al propio mapa; se quitan al terminar para que el mapa de la
+    sesión (y con él el iframe) siga idéntico en el siguiente refresco.
+    """
+    antes = set(mapa._children)
+    try:
+        return st_folium(mapa, feature_group_to_add=capas, layer_control=control_capas, **kwargs)
+    finally:
+        for nombre in set(mapa._children) - antes:
+            del mapa._children[nombre]
+
 # ESTILOS CSS
 
 def aplicar_estilos():
@@ -573,21 +807,9 @@ def vista_prediccion_precios():
     if st.button("🔮 Calcular Precio", type="primary", use_container_width=True):
         with st.spinner("🧮 Calculando precio estimado..."):
             try:
-                entrada = pd.DataFrame({
-                    'producto': [producto],
-                    'presentacion': [presentacion],
-                    'ciudad': ['Tunja'],
-                    'categoria': ['General'],
-                    'unidades (kg)': [kg_por_unidad]
-                })
-                
-                pred = modelo_precio.predict(entrada)
-                resultado = pred[0]
-                
-                try:
-                    precio_min_presentacion, precio_max_presentacion = sorted(resultado)
-                except:
-                    precio_min_presentacion = precio_max_presentacion = float(resultado)
+                precio_min_presentacion, precio_max_presentacion = tabla_precios.precio(
+                    producto, presentacion, kg_por_unidad
+                )
                 
                 precio_min_total = precio_min_presentacion * cantidad
                 precio_max_total = precio_max_presentacion * cantidad
@@ -683,18 +905,9 @@ def vista_registro():
                 precio_predicho = None
                 if IA_CARGADA and modelo_precio:
                     try:
-                        entrada = pd.DataFrame({
-                            'producto': [producto],
-                            'presentacion': [presentacion],
-                            'ciudad': [ciudad],
-                            'categoria': ['General'],
-                            'unidades (kg)': [KG_EQUIVALENTES[presentacion]]
-                        })
-                        pred = modelo_precio.predict(entrada)
-                        try:
-                            precio_min, precio_max = sorted(pred[0])
-                        except:
-                            precio_min = precio_max = float(pred[0])
+                        precio_min, precio_max = tabla_precios.precio(
+                            producto, presentacion, KG_EQUIVALENTES[presentacion], ciudad
+                        )
                         precio_predicho = round((precio_min + precio_max) / 2 * cantidad)
                     except:
                         pass
@@ -727,18 +940,215 @@ def vista_registro():
                 
                 df_notif = pd.concat([df_notif, pd.DataFrame([nueva_notificacion])], ignore_index=True)
                 guardar_notificaciones(df_notif)
+                obtener_bus().publicar_fila(PUBLICADA, nueva_notificacion, origen=st.session_state.bus_campesino)
+                st.session_state.campesinos_propios.add(campesino)
+                st.session_state.bus_campesino.filtrar({'campesino': st.session_state.campesinos_propios})
                 
                 st.success("✅ ¡Producto registrado exitosamente!")
                 if precio_predicho:
                     st.info(f"💰 Precio estimado: ${precio_predicho:,.0f} COP")
 
 
+def mostrar_seguimiento(id_notificacion, estado_inicial, con_mapa=True):
+    """
+    Progreso, ETA y mapa de un pedido leídos de la copia compartida de notificaciones.
+    Con con_mapa=False el viaje se ve en el mapa consolidado y aquí no se dibuja otro.
+    """
+    df_vivo = leer_notificaciones_en_vivo()
+    if id_notificacion not in df_vivo.index:
+        return
+    row = df_vivo.loc[id_notificacion]
+    if row['estado'] != estado_inicial:
+        # cambió de estado (p. ej. ya fue recogido): se refresca la vista completa una sola vez
+        st.rerun()
+
+    # Progreso si está en camino
+    if row['estado'] == 'Aceptado' and pd.notna(row['progreso_viaje']):
+        progreso_valor = float(row['progreso_viaje'])
+        st.markdown("---")
+        st.markdown("### 📊 Progreso del Viaje")
+        st.progress(progreso_valor)
+        st.write(f"**Completado:** {progreso_valor*100:.1f}%")
+        
+        if pd.notna(row['distancia_restante_km']) and pd.notna(row['tiempo_estimado_llegada']):
+            col_dist, col_time = st.columns(2)
+            with col_dist:
+                st.metric("🛣️ Distancia restante", f"{row['distancia_restante_km']:.1f} km")
+            with col_time:
+                st.metric("⏱️ Tiempo estimado", f"~{int(row['tiempo_estimado_llegada'])} min")
+        
+        # Alertas de proximidad: último evento de geocerca emitido para el viaje
+        evento = obtener_motor_geocercas().cola.ultimo_evento(id_notificacion)
+        if evento is not None:
+            {'llegada': st.success, 'cerca': st.warning, 'en_camino': st.info}[evento](MENSAJES_EVENTO[evento])
+
+    if validar_coordenadas(row['latitud'], row['longitud']):
+        st.markdown("---")
+        
+        # Mensaje especial si ya fue recogido
+        if row['estado'] == 'Recogido':
+            st.success("✅ **PEDIDO RECOGIDO EXITOSAMENTE** - El transportista tiene tu producto")
+        
+        if not con_mapa:
+            if row['estado'] == 'Aceptado':
+                st.caption("🗺️ La ubicación del transportista aparece en el mapa de seguimiento de arriba.")
+            return
+        
+        st.markdown("### 🗺️ Seguimiento en Tiempo Real")
+        
+        # Obtener datos del transportista
+        lat_trans = row.get('transportista_lat')
+        lon_trans = row.get('transportista_lon')
+        progreso = float(row.get('progreso_viaje', 0.0)) if pd.notna(row.get('progreso_viaje')) else 0.0
+        distancia = row.get('distancia_restante_km')
+        
+        # Crear mapa interactivo (solo se reconstruye si el transportista se movió)
+        if validar_coordenadas(lat_trans, lon_trans):
+            tiempo_estimado = row['tiempo_estimado_llegada'] if pd.notna(row.get('tiempo_estimado_llegada')) else None
+            distancia = distancia if pd.notna(distancia) else None
+            # la geometría sigue el zoom que el usuario tiene en pantalla, no el inicial del mapa
+            zoom = zoom_del_mapa(f"mapa_{id_notificacion}", zoom_para_distancia(distancia))
+            rastro, ruta_restante = geometria_para_zoom(id_notificacion, lat_trans, lon_trans,
+                                                        cargar_rastro(id_notificacion), zoom)
+            # la base y el punto de entrega no cambian durante el viaje: se crean una vez por pedido
+            mapa = mapa_estatico_en_cache(
+                f"mapa_cache_{id_notificacion}",
+                huella_capa_estatica([id_notificacion], [[row['latitud'], row['longitud']]]),
+                lambda: crear_mapa_seguimiento_estatico(row['latitud'], row['longitud'], lat_trans, lon_trans, distancia)
+            )
+            capa_transportista = crear_capa_transportista(
+                lat_campesino=row['latitud'],
+                lon_campesino=row['longitud'],
+                lat_transportista=lat_trans,
+                lon_transportista=lon_trans,
+                distancia_km=distancia,
+                progreso=progreso,
+                transportista_nombre=row['transportista_asignado'],
+                tiempo_estimado=tiempo_estimado,
+                rastro=rastro,
+                ruta_restante=ruta_restante
+            )
+            
+            # Mostrar el mapa (solo un cambio de zoom provoca un rerun, para ajustar el detalle de
+            # las rutas). La capa del transportista va aparte: el navegador la reemplaza sin recargar el mapa.
+            st_folium_con_capas(mapa, capa_transportista, width=900, height=550,
+                                key=f"mapa_{row['id_notificacion']}", returned_objects=['zoom'])
+            
+            # Leyenda del mapa
+            st.markdown("""
+                <div style='text-align: center; margin-top: 15px; padding: 15px; background: white; border-radius: 10px; box-shadow: 0 2px 5px rgba(0,0,0,0.1);'>
+                    <span class='legend-item' style='color: #34A853;'>🟢 Tu ubicación</span>
+                    <span class='legend-item' style='color: #EA4335;'>🔴 Transportista</span>
+                    <span class='legend-item' style='color: #4285F4;'>🔵 Ruta restante</span>
+                </div>
+            """, unsafe_allow_html=True)
+            
+            # Botón de actualización manual
+            st.markdown("<br>", unsafe_allow_html=True)
+            if st.button(f"🔄 Actualizar ubicación del transportista", 
+                        key=f"refresh_{row['id_notificacion']}", 
+                        use_container_width=True):
+                st.rerun()
+        else:
+            st.info("🚛 El transportista aceptó tu pedido. En breve verás su ubicación en el mapa.")
+    else:
+        st.warning("⚠️ No se pudo obtener la geolocalización de tu dirección.")
+
+
+@st.fragment(run_every=AUTO_REFRESH_INTERVAL)
+def avisos_geocerca(ids_visibles):
+    """Avisos emergentes con los eventos de geocerca nuevos; si la cola no creció no se lee nada"""
+    cola = obtener_motor_geocercas().cola
+    if 'posicion_eventos' not in st.session_state:
+        # al abrir la vista solo interesan los eventos que lleguen desde ahora
+        firma = cola.firma()
+        st.session_state.posicion_eventos = firma[1] if firma else 0
+        st.session_state.eventos_vistos = set()
+    eventos, st.session_state.posicion_eventos = cola.leer_desde(st.session_state.posicion_eventos)
+    for _, evento in eventos[eventos['id_notificacion'].isin(ids_visibles)].iterrows():
+        clave = (evento['id_notificacion'], evento['tipo'])
+        if clave not in st.session_state.eventos_vistos:
+            st.session_state.eventos_vistos.add(clave)
+            st.toast(f"🧾 {evento['id_notificacion']}: {MENSAJES_EVENTO[evento['tipo']]}")
+
+
+@st.fragment(run_every=AUTO_REFRESH_INTERVAL)
+def escuchar_cambios():
+    """Aceptaciones, recogidas o ventas de los pedidos listados: solo entonces se recarga la página"""
+    eventos = st.session_state.bus_campesino.nuevos()
+    if eventos:
+        for evento in eventos[-3:]:
+            st.toast(describir_evento(evento))
+        st.rerun()
+
+
+@st.fragment(run_every=AUTO_REFRESH_INTERVAL)
+def seguimiento_en_vivo(id_notificacion, estado_inicial, con_mapa=True):
+    mostrar_seguimiento(id_notificacion, estado_inicial, con_mapa)
+
+
+def mostrar_mapa_consolidado(ids_activos):
+    """Todos los viajes activos en un solo mapa, con una capa por viaje y controles para enfocar cada uno"""
+    df_vivo = leer_notificaciones_en_vivo()
+    viajes = df_vivo.loc[[i for i in ids_activos if i in df_vivo.index]]
+    viajes = viajes[viajes['latitud'].notna() & viajes['longitud'].notna()]
+    if viajes.empty:
+        return
+    
+    st.markdown("### 🗺️ Seguimiento de Todos tus Viajes")
+    rastros = {i: cargar_rastro(i) for i in viajes['id_notificacion']}
+    
+    # la capa estática solo se rehace si cambian los viajes; los viajes se dibujan en cada refresco
+    mapa = mapa_estatico_en_cache(
+        'mapa_consolidado_cache',
+        huella_capa_estatica(viajes['id_notificacion'], viajes[['latitud', 'longitud']].to_numpy(dtype=np.float64)),
+        lambda: crear_mapa_consolidado_estatico(viajes)
+    )
+    
+    # enfocar un viaje solo mueve la cámara del mapa ya cargado; no se vuelve a dibujar
+    opciones = ["Todos"] + viajes['id_notificacion'].tolist()
+    productos = dict(zip(viajes['id_notificacion'], viajes['producto']))
+    enfoque = st.radio(
+        "🎯 Enfocar:", opciones, horizontal=True, key="enfoque_mapa_consolidado",
+        format_func=lambda i: "🗺️ Todos" if i == "Todos" else f"🧾 {i} · {productos.get(i, '')}"
+    )
+    if enfoque == "Todos" or enfoque not in viajes.index:
+        puntos = np.vstack([viajes[['latitud', 'longitud']].to_numpy(dtype=np.float64),
+                            viajes[['transportista_lat', 'transportista_lon']].to_numpy(dtype=np.float64)])
+    else:
+        row = viajes.loc[enfoque]
+        puntos = np.array([[row['latitud'], row['longitud']], [row['transportista_lat'], row['transportista_lon']]], dtype=np.float64)
+    centro, zoom = encuadre(puntos[~np.isnan(puntos).any(axis=1)])
+    # zoom fija la cámara al enfocar; las rutas se simplifican para el zoom real del usuario
+    capas_viajes = crear_capas_viajes(viajes, rastros, zoom_del_mapa("mapa_consolidado", zoom))
+    
+    st_folium_con_capas(mapa, capas_viajes, folium.LayerControl(position='topleft', collapsed=len(viajes) > 8),
+                        width=900, height=550, center=centro, zoom=zoom, key="mapa_consolidado",
+                        returned_objects=['zoom'])
+    
+    st.markdown("""
+        <div style='text-align: center; margin-top: 15px; padding: 15px; background: white; border-radius: 10px; box-shadow: 0 2px 5px rgba(0,0,0,0.1);'>
+            <span class='legend-item' style='color: #34A853;'>🟢 Puntos de entrega</span>
+            <span class='legend-item' style='color: #EA4335;'>🔴 Transportistas</span>
+            <span class='legend-item' style='color: #4285F4;'>🔵 Rutas restantes</span>
+            <span class='legend-item' style='color: #757575;'>🗂️ Capas: un viaje por capa</span>
+        </div>
+    """, unsafe_allow_html=True)
+
+
+@st.fragment(run_every=AUTO_REFRESH_INTERVAL)
+def mapa_consolidado_en_vivo(ids_activos):
+    mostrar_mapa_consolidado(ids_activos)
+
+
 # VISTA: MIS NOTIFICACIONES CON SEGUIMIENTO EN TIEMPO REAL
 
 def vista_notificaciones():
     st.markdown('<div class="card-venta"><h2>📬 Mis Notificaciones</h2><p>Visualiza el estado de tus productos registrados con seguimiento en tiempo real</p></div>', unsafe_allow_html=True)
     
-    df_notif = cargar_notificaciones()
+    # una fila por pedido, la última, como en la copia en vivo que lee mostrar_seguimiento:
+    # si el listado mostrara otra, su estado nunca coincidiría y la vista se recargaría sin fin
+    df_notif = cargar_notificaciones().drop_duplicates('id_notificacion', keep='last')
     
     if df_notif.empty:
         st.info("📭 No tienes productos registrados aún.")
@@ -764,6 +1174,9 @@ def vista_notificaciones():
         </div>
         """, unsafe_allow_html=True)
     
+    if st.session_state.auto_refresh_enabled:
+        avisos_geocerca(tuple(df_notif['id_notificacion']))
+    
     # Filtros
     col_filtro, col_refresh = st.columns([3, 1])
     
@@ -786,6 +1199,21 @@ def vista_notificaciones():
     
     st.write(f"**Total de registros:** {len(df_filtrado)}")
     
+    # Un mapa para todos los viajes: el peso de la página no crece con el número de viajes
+    modo_mapa = st.radio(
+        "🗺️ Mapas de seguimiento:",
+        ["Un mapa con todos los viajes", "Un mapa por pedido"],
+        horizontal=True,
+        key="modo_mapa_notif"
+    )
+    consolidado = modo_mapa == "Un mapa con todos los viajes"
+    activos = df_filtrado[df_filtrado['estado'].isin(['Aceptado', 'Recogido']) & df_filtrado['transportista_asignado'].notna()]
+    if consolidado and not activos.empty:
+        if st.session_state.auto_refresh_enabled:
+            mapa_consolidado_en_vivo(tuple(activos['id_notificacion']))
+        else:
+            mostrar_mapa_consolidado(tuple(activos['id_notificacion']))
+    
     # Mostrar cada notificación
     for idx, row in df_filtrado.iterrows():
         # Determinar si expandir automáticamente
@@ -825,29 +1253,6 @@ def vista_notificaciones():
                 if pd.notna(row['transportista_asignado']):
                     st.write(f"**🚛 Transportista:** {row['transportista_asignado']}")
                 
-                # Mostrar progreso si está en camino
-                if row['estado'] == 'Aceptado' and pd.notna(row['progreso_viaje']):
-                    progreso_valor = float(row['progreso_viaje'])
-                    st.markdown("---")
-                    st.markdown("### 📊 Progreso del Viaje")
-                    st.progress(progreso_valor)
-                    st.write(f"**Completado:** {progreso_valor*100:.1f}%")
-                    
-                    if pd.notna(row['distancia_restante_km']) and pd.notna(row['tiempo_estimado_llegada']):
-                        col_dist, col_time = st.columns(2)
-                        with col_dist:
-                            st.metric("🛣️ Distancia restante", f"{row['distancia_restante_km']:.1f} km")
-                        with col_time:
-                            st.metric("⏱️ Tiempo estimado", f"~{int(row['tiempo_estimado_llegada'])} min")
-                    
-                    # Alertas de proximidad
-                    if progreso_valor >= 0.95:
-                        st.success("🎯 ¡El transportista está muy cerca! Prepara tu producto.")
-                    elif progreso_valor >= 0.7:
-                        st.warning("📍 El transportista se está acercando.")
-                    elif progreso_valor >= 0.3:
-                        st.info("🚚 El transportista está en camino.")
-            
             with col2:
                 # Mostrar imagen del producto
                 if pd.notna(row['imagen']):
@@ -855,57 +1260,12 @@ def vista_notificaciones():
                     if os.path.exists(img_path):
                         st.image(img_path, width=200, caption=row['producto'])
             
-            # MAPA DE SEGUIMIENTO EN TIEMPO REAL
+            # SEGUIMIENTO EN TIEMPO REAL: solo esta sección se refresca con el temporizador
             if row['estado'] in ['Aceptado', 'Recogido'] and pd.notna(row['transportista_asignado']):
-                if validar_coordenadas(row['latitud'], row['longitud']):
-                    st.markdown("---")
-                    
-                    # Mensaje especial si ya fue recogido
-                    if row['estado'] == 'Recogido':
-                        st.success("✅ **PEDIDO RECOGIDO EXITOSAMENTE** - El transportista tiene tu producto")
-                    
-                    st.markdown("### 🗺️ Seguimiento en Tiempo Real")
-                    
-                    # Obtener datos del transportista
-                    lat_trans = row.get('transportista_lat')
-                    lon_trans = row.get('transportista_lon')
-                    progreso = float(row.get('progreso_viaje', 0.0)) if pd.notna(row.get('progreso_viaje')) else 0.0
-                    distancia = row.get('distancia_restante_km')
-                    
-                    # Crear mapa interactivo
-                    if validar_coordenadas(lat_trans, lon_trans):
-                        mapa = crear_mapa_seguimiento_folium(
-                            lat_campesino=row['latitud'],
-                            lon_campesino=row['longitud'],
-                            lat_transportista=lat_trans,
-                            lon_transportista=lon_trans,
-                            distancia_km=distancia if pd.notna(distancia) else None,
-                            progreso=progreso,
-                            transportista_nombre=row['transportista_asignado']
-                        )
-                        
-                        # Mostrar el mapa
-                        st_folium(mapa, width=900, height=550, key=f"mapa_{row['id_notificacion']}")
-                        
-                        # Leyenda del mapa
-                        st.markdown("""
-                            <div style='text-align: center; margin-top: 15px; padding: 15px; background: white; border-radius: 10px; box-shadow: 0 2px 5px rgba(0,0,0,0.1);'>
-                                <span class='legend-item' style='color: #34A853;'>🟢 Tu ubicación</span>
-                                <span class='legend-item' style='color: #EA4335;'>🔴 Transportista</span>
-                                <span class='legend-item' style='color: #4285F4;'>🔵 Ruta restante</span>
-                            </div>
-                        """, unsafe_allow_html=True)
-                        
-                        # Botón de actualización manual
-                        st.markdown("<br>", unsafe_allow_html=True)
-                        if st.button(f"🔄 Actualizar ubicación del transportista", 
-                                    key=f"refresh_{row['id_notificacion']}", 
-                                    use_container_width=True):
-                            st.rerun()
-                    else:
-                        st.info("🚛 El transportista aceptó tu pedido. En breve verás su ubicación en el mapa.")
+                if st.session_state.auto_refresh_enabled:
+                    seguimiento_en_vivo(row['id_notificacion'], row['estado'], not consolidado)
                 else:
-                    st.warning("⚠️ No se pudo obtener la geolocalización de tu dirección.")
+                    mostrar_seguimiento(row['id_notificacion'], row['estado'], not consolidado)
 
 
 # VISTA: VENTA RÁPIDA IA
@@ -965,38 +1325,27 @@ def vista_venta_rapida():
         resultados_presentaciones = []
 
         if IA_CARGADA and modelo_precio is not None:
-            for nombre_pres in presentaciones_validas:
-                kg = KG_EQUIVALENTES.get(nombre_pres, 1)
-                try:
-                    entrada = pd.DataFrame({
-                        'producto': [producto_detectado],
-                        'presentacion': [nombre_pres],
-                        'ciudad': ['Tunja'],
-                        'categoria': ['General'],
-                        'unidades (kg)': [kg]
-                    })
-
-                    pred = modelo_precio.predict(entrada)
-                    resultado = pred[0]
-
+            # todas las presentaciones salen de la tabla; las que falten se predicen en un solo lote
+            kgs = [KG_EQUIVALENTES.get(nombre_pres, 1) for nombre_pres in presentaciones_validas]
+            try:
+                precios = tabla_precios.precios([
+                    (producto_detectado, nombre_pres, 'Tunja', kg) for nombre_pres, kg in zip(presentaciones_validas, kgs)
+                ])
+            except Exception:
+                # si el lote falla, una por una: solo se pierden las presentaciones que el modelo rechaza
+                precios = []
+                for nombre_pres, kg in zip(presentaciones_validas, kgs):
                     try:
-                        precio_min_total, precio_max_total = sorted(resultado)
-                    except:
-                        precio_min_total = precio_max_total = float(resultado)
-
-                    precio_min_kg = precio_min_total / kg
-                    precio_max_kg = precio_max_total / kg
-                    precio_promedio_kg = (precio_min_kg + precio_max_kg) / 2
-
-                    resultados_presentaciones.append({
-                        "presentacion": nombre_pres,
-                        "kg": kg,
-                        "precio_min": float(precio_min_kg),
-                        "precio_max": float(precio_max_kg),
-                        "precio_promedio": float(precio_promedio_kg)
-                    })
-                except Exception as e:
-                    st.warning(f"⚠️ Error al calcular precio para {nombre_pres}: {e}")
+                        precios.append(tabla_precios.precio(producto_detectado, nombre_pres, kg, 'Tunja'))
+                    except Exception as e:
+                        st.warning(f"⚠️ Error al calcular precio para {nombre_pres}: {e}")
+                        precios.append(None)
+            for pres, kg, precio in zip(presentaciones_validas, kgs, precios):
+                if precio is None:
+                    continue
+                pmin, pmax = precio
+                resultados_presentaciones.append({"presentacion": pres, "kg": kg, "precio_min": pmin / kg,
+                                                  "precio_max": pmax / kg, "precio_promedio": (pmin + pmax) / 2 / kg})
 
         st.session_state.venta_resultados = resultados_presentaciones
 
@@ -1175,6 +1524,9 @@ def vista_venta_rapida():
 
                     df_notif = pd.concat([df_notif, pd.DataFrame([nueva_notificacion])], ignore_index=True)
                     guardar_notificaciones(df_notif)
+                    obtener_bus().publicar_fila(PUBLICADA, nueva_notificacion, origen=st.session_state.bus_campesino)
+                    st.session_state.campesinos_propios.add(nueva_notificacion['campesino'])
+                    st.session_state.bus_campesino.filtrar({'campesino': st.session_state.campesinos_propios})
 
                     st.success("✅ ¡Venta registrada exitosamente!")
                     st.balloons()
@@ -1201,7 +1553,13 @@ def view_campesino():
     else:
         st.sidebar.warning("⚠️ IA Limitada")
     
-    df_notif = cargar_notificaciones()
+    # suscripción de la sesión al bus: lo publicado hasta aquí ya está en el CSV que se lee ahora
+    if 'bus_campesino' not in st.session_state:
+        st.session_state.bus_campesino = obtener_bus().suscribir()
+    st.session_state.bus_campesino.nuevos()
+    df_notif = leer_notificaciones_en_vivo()
+    # solo avisa lo que toca a los campesinos de esta sesión; sin ninguno todavía, nada
+    st.session_state.bus_campesino.filtrar({'campesino': st.session_state.campesinos_propios})
     en_camino = len(df_notif[df_notif['estado'] == 'Aceptado'])
     pendientes = len(df_notif[df_notif['estado'] == 'Pendiente'])
     recogidos = len(df_notif[df_notif['estado'] == 'Recogido'])
@@ -1227,21 +1585,12 @@ def view_campesino():
     st.session_state.auto_refresh_enabled = auto_refresh
     
     if auto_refresh:
+        escuchar_cambios()
         st.sidebar.success(f"✅ Activo ({AUTO_REFRESH_INTERVAL}s)")
         if en_camino > 0:
             st.sidebar.info(f"🚛 {en_camino} transportista(s) en seguimiento")
         
-        # JavaScript para auto-refresh
-        st.markdown(f"""
-            <script>
-                setTimeout(function(){{
-                    window.parent.location.reload();
-                }}, {AUTO_REFRESH_INTERVAL * 1000});
-            </script>
-        """, unsafe_allow_html=True)
-        
-        st.session_state.refresh_counter += 1
-        st.sidebar.caption(f"Actualización #{st.session_state.refresh_counter}")
+        st.sidebar.caption("Solo el progreso y los mapas de seguimiento se refrescan; el resto de la página no se recarga.")
     else:
         st.sidebar.warning("⏸️ Pausado")
     
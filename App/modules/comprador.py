@@ -6,6 +6,11 @@ from datetime import datetime, timedelta
 from collections import Counter
 import plotly.graph_objects as go
 import plotly.express as px
+from rutas import UBICACIONES_CIUDADES
+from seguimiento import LOCK_NOTIFICACIONES, escribir_csv_atomico
+from oferta_grilla import mostrar_mapa_oferta
+from bus_eventos import (ACEPTADA, INTERVALO_ESCUCHA_S, PUBLICADA, RECOGIDA, RETIRADA, VENDIDA,
+                         describir_evento, obtener_bus)
 
 
 # ═══════════════════════════════════════════════════════════════════════════
@@ -84,7 +89,8 @@ def cargar_notificaciones():
 def guardar_notificaciones(df):
     """Guarda el DataFrame de notificaciones"""
     try:
-        df.to_csv(CSV_NOTIFICACIONES, index=False)
+        with LOCK_NOTIFICACIONES:
+            escribir_csv_atomico(df, CSV_NOTIFICACIONES)
     except Exception as e:
         st.error(f"❌ Error al guardar notificaciones: {e}")
 
@@ -95,7 +101,8 @@ def cargar_historial_compras():
         return pd.DataFrame(columns=[
             'fecha_compra', 'comprador', 'vendedor', 'origen',
             'producto', 'cantidad_kg', 'precio_unitario', 'precio_total',
-            'ciudad', 'calificacion', 'comentario'
+            'ciudad', 'calificacion', 'comentario', 'id_notificacion',
+            'ciudad_entrega', 'lat_entrega', 'lon_entrega', 'estado_entrega', 'transportista_entrega'
         ])
     try:
         df = pd.read_csv(CSV_COMPRAS)
@@ -106,7 +113,8 @@ def cargar_historial_compras():
         return pd.DataFrame(columns=[
             'fecha_compra', 'comprador', 'vendedor', 'origen',
             'producto', 'cantidad_kg', 'precio_unitario', 'precio_total',
-            'ciudad', 'calificacion', 'comentario'
+            'ciudad', 'calificacion', 'comentario', 'id_notificacion',
+            'ciudad_entrega', 'lat_entrega', 'lon_entrega', 'estado_entrega', 'transportista_entrega'
         ])
 
 
@@ -294,7 +302,8 @@ def registrar_compra(comprador, producto_data):
             df_compras = pd.DataFrame(columns=[
                 'fecha_compra', 'comprador', 'vendedor', 'origen',
                 'producto', 'cantidad_kg', 'precio_unitario', 'precio_total',
-                'ciudad', 'calificacion', 'comentario'
+                'ciudad', 'calificacion', 'comentario', 'id_notificacion',
+                'ciudad_entrega', 'lat_entrega', 'lon_entrega', 'estado_entrega', 'transportista_entrega'
             ])
         else:
             df_compras = pd.read_csv(CSV_COMPRAS)
@@ -312,7 +321,13 @@ def registrar_compra(comprador, producto_data):
             'precio_total': producto_data['cantidad_kg'] * producto_data['precio_unitario'],
             'ciudad': producto_data['ciudad'],
             'calificacion': producto_data.get('calificacion', 0),
-            'comentario': producto_data.get('comentario', '')
+            'comentario': producto_data.get('comentario', ''),
+            'id_notificacion': producto_data.get('id_notificacion'),
+            'ciudad_entrega': producto_data.get('ciudad_entrega'),
+            'lat_entrega': producto_data.get('lat_entrega'),
+            'lon_entrega': producto_data.get('lon_entrega'),
+            'estado_entrega': 'Por entregar' if producto_data.get('lat_entrega') is not None else None,
+            'transportista_entrega': None
         }
 
         df_compras = pd.concat([df_compras, pd.DataFrame([nueva_compra])], ignore_index=True)
@@ -485,11 +500,37 @@ def view_comprador():
         </div>
     """, unsafe_allow_html=True)
 
+    # Suscripción de la sesión al bus: solo los cambios del catálogo recargan la vista.
+    # Lo publicado hasta aquí ya está en el CSV que se lee a continuación.
+    if 'bus_comprador' not in st.session_state:
+        st.session_state.bus_comprador = obtener_bus().suscribir(
+            {'tipo': {PUBLICADA, ACEPTADA, RECOGIDA, VENDIDA, RETIRADA}}
+        )
+    suscripcion = st.session_state.bus_comprador
+    suscripcion.nuevos()
+
     # Cargar datos
     df_productos = cargar_notificaciones()
     df_compras = cargar_historial_compras()
     df_alertas = cargar_alertas()
 
+    def escuchar_cambios():
+        eventos = suscripcion.nuevos()
+        if eventos:
+            nombre = st.session_state.get('nombre_comprador_sidebar')
+            vigiladas = set()
+            if not df_alertas.empty:
+                activas = df_alertas[(df_alertas['comprador'] == nombre) & (df_alertas['activa'] == True)]
+                vigiladas = set(zip(activas['producto'], activas['ciudad']))
+            for evento in eventos[-3:]:
+                if evento.tipo == PUBLICADA and (evento.producto, evento.ciudad) in vigiladas:
+                    st.toast(f"🔔 Alerta: {describir_evento(evento)}")
+                else:
+                    st.toast(describir_evento(evento))
+            st.rerun()
+
+    st.fragment(run_every=INTERVALO_ESCUCHA_S)(escuchar_cambios)()
+
     # Verificar si hay productos
     if df_productos.empty:
         st.warning("⚠️ No hay productos disponibles actualmente.")
@@ -536,7 +577,8 @@ def view_comprador():
         "🛍️ Realizar Compra",
         "📈 Análisis de Precios",
         "🔔 Mis Alertas",
-        "📜 Mi Historial"
+        "📜 Mi Historial",
+        "🔥 Mapa de Oferta"
     ])
 
     # ═══════════════════════════════════════════════════════════════════════
@@ -826,6 +868,11 @@ def view_comprador():
                         key="calificacion_compra"
                     )
                     st.write("⭐" * calificacion)
+                    ciudad_entrega = st.selectbox(
+                        "📍 Ciudad de entrega:",
+                        list(UBICACIONES_CIUDADES.keys()),
+                        key="ciudad_entrega_compra"
+                    )
                 
                 with col_calif2:
                     comentario = st.text_area(
@@ -850,7 +897,11 @@ def view_comprador():
                             'cantidad_kg': cantidad_compra,
                             'precio_unitario': producto_data['precio_predicho'],
                             'calificacion': calificacion,
-                            'comentario': comentario
+                            'comentario': comentario,
+                            'id_notificacion': producto_data.get('id_notificacion'),
+                            'ciudad_entrega': ciudad_entrega,
+                            'lat_entrega': UBICACIONES_CIUDADES[ciudad_entrega][0],
+                            'lon_entrega': UBICACIONES_CIUDADES[ciudad_entrega][1]
                         }
                         
                         if registrar_compra(nombre_comprador, compra_data):
@@ -873,6 +924,7 @@ def view_comprador():
                                     df_productos.loc[idx_real, 'estado'] = 'Pendiente'  # Sigue en finca
                             
                             guardar_notificaciones(df_productos)
+                            obtener_bus().publicar_fila(VENDIDA, df_productos.loc[idx_real], origen=suscripcion)
                             
                             st.success(f"✅ ¡Compra realizada con éxito!")
                             st.balloons()
@@ -1198,6 +1250,15 @@ def view_comprador():
                         
                         if pd.notna(compra.get('comentario')) and compra['comentario']:
                             st.write(f"**💬 Comentario:** {compra['comentario']}")
+
+    # ═══════════════════════════════════════════════════════════════════════
+    #  TAB 7: MAPA DE OFERTA 
+    # ═══════════════════════════════════════════════════════════════════════
+    with tabs[6]:
+        st.subheader("🔥 ¿Dónde hay oferta?")
+        st.caption("Kilos y publicaciones pendientes por zona de ~5 km, para saber dónde concentrar las compras.")
+        mostrar_mapa_oferta(df_productos, "oferta_comprador")
+
 #EJECUCIÓN DIRECTA
 if __name__ == "__main__":
     st.set_page_config(
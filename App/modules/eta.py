@@ -0,0 +1,176 @@
+import os
+import threading
+import joblib
+import numpy as np
+import pandas as pd
+
+
+# CONFIGURACIÓN
+
+APP_ROOT = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+DATA_DIR = os.path.join(APP_ROOT, "data")
+MODELS_DIR = os.path.join(APP_ROOT, "models")
+
+DATASET_RUTAS = os.path.join(DATA_DIR, "dataset_rutas_boyaca.csv")
+# modelo_rutas_boyaca.pkl predice costo_total y recibe tiempo_hr como entrada, así que no
+# sirve para estimar tiempos; este es su sucesor reentrenable sobre el mismo dataset
+MODELO_ETA_PATH = os.path.join(MODELS_DIR, "modelo_eta_boyaca.pkl")
+
+VELOCIDAD_RESPALDO_KMH = 40   # si no hay modelo se mantiene el cálculo original
+FACTOR_VIA = 1.3              # km por carretera / km en línea recta
+TIPO_VIA_DEFECTO = 'rural'    # las fincas están sobre vías rurales
+MAX_SEGMENTOS_CACHE = 50000
+DECIMALES_CLAVE = 4           # ~10 m: puntos más cercanos comparten tramo
+
+_modelo = None
+_modelo_cargado = False
+_cache_segmentos = {}
+_lock = threading.Lock()
+
+
+# MODELO
+
+def entrenar_modelo_eta(ruta_dataset=DATASET_RUTAS, guardar=True):
+    """Entrena el regresor de velocidad media (km/h) a partir de distancia y tipo de vía"""
+    from sklearn.compose import ColumnTransformer
+    from sklearn.ensemble import RandomForestRegressor
+    from sklearn.pipeline import Pipeline
+    from sklearn.preprocessing import OneHotEncoder
+
+    df = pd.read_csv(ruta_dataset)
+    modelo = Pipeline([
+        ('preprocesamiento', ColumnTransformer([
+            ('cat', OneHotEncoder(handle_unknown='ignore'), ['tipo_via']),
+            ('num', 'passthrough', ['distancia_km'])
+        ])),
+        ('regresor', RandomForestRegressor(n_estimators=100, min_samples_leaf=3, random_state=42))
+    ])
+    # se aprende la velocidad y no el tiempo para que los tramos cortos (fuera del rango del
+    # dataset) escalen con la distancia en lugar de quedarse en el mínimo de entrenamiento
+    modelo.fit(df[['distancia_km', 'tipo_via']], df['distancia_km'] / df['tiempo_hr'])
+    if guardar:
+        joblib.dump(modelo, MODELO_ETA_PATH)
+    return modelo
+
+
+def cargar_modelo_eta():
+    """Carga el modelo de ETA (entrenándolo la primera vez); None si no es posible"""
+    global _modelo, _modelo_cargado
+    with _lock:
+        if _modelo_cargado:
+            return _modelo
+        try:
+            if os.path.exists(MODELO_ETA_PATH):
+                _modelo = joblib.load(MODELO_ETA_PATH)
+            elif os.path.exists(DATASET_RUTAS):
+                _modelo = entrenar_modelo_eta()
+        except Exception:
+            _modelo = None
+        _modelo_cargado = True
+        _cache_segmentos.clear()
+        return _modelo
+
+
+def recargar_modelo_eta():
+    """Olvida el modelo y la caché (por ejemplo tras reentrenar)"""
+    global _modelo, _modelo_cargado
+    with _lock:
+        _modelo = None
+        _modelo_cargado = False
+        _cache_segmentos.clear()
+
+
+# PREDICCIÓN EN LOTE
+
+def distancia_tramos_km(origenes, destinos):
+    """Distancia haversine fila a fila entre dos arreglos (N, 2) de coordenadas"""
+    o = np.radians(np.asarray(origenes, dtype=np.float64).reshape(-1, 2))
+    d = np.radians(np.asarray(destinos, dtype=np.float64).reshape(-1, 2))
+    dlat = d[:, 0] - o[:, 0]
+    dlon = d[:, 1] - o[:, 1]
+    a = np.sin(dlat/2)**2 + np.cos(o[:, 0])*np.cos(d[:, 0])*np.sin(dlon/2)**2
+    return 6371 * 2*np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def predecir_minutos(distancias_km, tipo_via=TIPO_VIA_DEFECTO):
+    """Minutos de viaje para muchos tramos en una sola llamada al modelo"""
+    distancias_km = np.asarray(distancias_km, dtype=np.float64)
+    respaldo = distancias_km / VELOCIDAD_RESPALDO_KMH * 60
+    modelo = cargar_modelo_eta()
+    if modelo is None or len(distancias_km) == 0:
+        return respaldo
+    try:
+        km_via = distancias_km * FACTOR_VIA
+        entrada = pd.DataFrame({'distancia_km': km_via, 'tipo_via': tipo_via})
+        velocidad = np.asarray(modelo.predict(entrada), dtype=np.float64)
+    except Exception:
+        return respaldo
+    minutos = respaldo.copy()
+    valida = velocidad > 0
+    minutos[valida] = km_via[valida] / velocidad[valida] * 60
+    return minutos
+
+
+def estimar_eta_minutos(origenes, destinos, distancia_restante_km=None, tipo_via=TIPO_VIA_DEFECTO):
+    """
+    ETA en minutos para muchos tramos (origen -> destino) a la vez.
+    Cada tramo se predice una sola vez y queda en caché; si se da la distancia restante,
+    la ETA es la parte proporcional del tiempo del tramo completo.
+    """
+    origenes = np.asarray(origenes, dtype=np.float64).reshape(-1, 2)
+    destinos = np.asarray(destinos, dtype=np.float64).reshape(-1, 2)
+    if len(origenes) == 0:
+        return np.zeros(0)
+
+    claves = [
+        (tipo_via,) + tuple(fila)
+        for fila in np.round(np.hstack([origenes, destinos]), DECIMALES_CLAVE).tolist()
+    ]
+    distancias = distancia_tramos_km(origenes, destinos)
+
+    with _lock:
+        faltantes = {}
+        for i, clave in enumerate(claves):
+            if clave not in _cache_segmentos and clave not in faltantes:
+                faltantes[clave] = i
+    if faltantes:
+        indices = list(faltantes.values())
+        minutos_nuevos = predecir_minutos(distancias[indices], tipo_via)
+        with _lock:
+            if len(_cache_segmentos) + len(faltantes) > MAX_SEGMENTOS_CACHE:
+                _cache_segmentos.clear()
+            _cache_segmentos.update(zip(faltantes.keys(), minutos_nuevos.tolist()))
+
+    with _lock:
+        minutos = np.array([_cache_segmentos.get(c, np.nan) for c in claves])
+    # por si otro hilo vació la caché entre medias
+    sin_dato = np.isnan(minutos)
+    if sin_dato.any():
+        minutos[sin_dato] = predecir_minutos(distancias[sin_dato], tipo_via)
+
+    if distancia_restante_km is None:
+        return minutos
+    restante = np.asarray(distancia_restante_km, dtype=np.float64).reshape(-1)
+    fraccion = np.divide(restante, distancias, out=np.zeros_like(restante), where=distancias > 0)
+    return minutos * np.clip(fraccion, 0.0, 1.0)
+
+
+def estimar_tiempo_rutas_minutos(origen, rutas):
+    """Duración de varias rutas (listas de {'lat','lon'}) con todos los tramos en una sola predicción"""
+    origenes, destinos, ruta_de_tramo = [], [], []
+    for r, ruta in enumerate(rutas):
+        anterior = origen
+        for d in ruta:
+            origenes.append(anterior)
+            destinos.append((d['lat'], d['lon']))
+            ruta_de_tramo.append(r)
+            anterior = (d['lat'], d['lon'])
+    if not origenes:
+        return np.zeros(len(rutas))
+    minutos = estimar_eta_minutos(origenes, destinos)
+    return np.bincount(ruta_de_tramo, weights=minutos, minlength=len(rutas))
+
+
+if __name__ == "__main__":
+    modelo = entrenar_modelo_eta()
+    print(f"Modelo de ETA guardado en {MODELO_ETA_PATH}")
@@ -0,0 +1,180 @@
+import os
+import threading
+import time
+from io import StringIO
+import numpy as np
+import pandas as pd
+from eta import distancia_tramos_km
+
+
+# CONFIGURACIÓN
+
+APP_ROOT = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+CSV_EVENTOS = os.path.join(APP_ROOT, "data", "eventos_geocerca.csv")
+
+RADIO_CERCA_KM = 3.0      # el transportista se está acercando a la finca
+RADIO_LLEGADA_KM = 0.3    # el transportista llegó al punto de recogida
+# cada viaje solo sube de nivel; cada nivel genera su evento una única vez
+NIVELES = ['en_camino', 'cerca', 'llegada']
+COLUMNAS_EVENTO = ['id_evento', 'instante', 'id_notificacion', 'transportista', 'tipo', 'distancia_km']
+
+MENSAJES_EVENTO = {
+    'en_camino': "🚚 El transportista está en camino.",
+    'cerca': "📍 El transportista se está acercando.",
+    'llegada': "🎯 ¡El transportista está muy cerca! Prepara tu producto."
+}
+
+
+# EVALUACIÓN VECTORIZADA
+
+def niveles_geocerca(posiciones, destinos, radio_cerca=RADIO_CERCA_KM, radio_llegada=RADIO_LLEGADA_KM):
+    """Nivel (1 en camino, 2 cerca, 3 llegada) y distancia de todos los viajes en una pasada"""
+    distancias = distancia_tramos_km(posiciones, destinos)
+    niveles = 1 + (distancias <= radio_cerca).astype(int) + (distancias <= radio_llegada).astype(int)
+    return niveles, distancias
+
+
+# COLA DE EVENTOS (CSV DE SOLO AGREGAR)
+
+class ColaEventos:
+    """
+    Cola persistente compartida entre procesos: se agrega al final y cada lector
+    recuerda hasta qué byte leyó. Si dos procesos emitieran el mismo evento, los
+    lectores se quedan con el primero, así que cada evento se entrega una sola vez.
+    """
+
+    def __init__(self, ruta=CSV_EVENTOS):
+        self.ruta = ruta
+        self._lock = threading.Lock()
+        self._cache = (None, pd.DataFrame(columns=COLUMNAS_EVENTO))
+
+    def firma(self):
+        try:
+            info = os.stat(self.ruta)
+            return info.st_mtime_ns, info.st_size
+        except OSError:
+            return None
+
+    def publicar(self, eventos):
+        if not eventos:
+            return
+        texto = pd.DataFrame(eventos, columns=COLUMNAS_EVENTO).to_csv(index=False, header=False)
+        with self._lock:
+            nuevo = not os.path.exists(self.ruta)
+            os.makedirs(os.path.dirname(self.ruta), exist_ok=True)
+            # una sola escritura en modo append: las líneas de distintos procesos no se mezclan
+            with open(self.ruta, "a", encoding="utf-8", newline="") as f:
+                f.write((",".join(COLUMNAS_EVENTO) + "\n" if nuevo else "") + texto)
+
+    def leer_desde(self, posicion=0):
+        """Eventos agregados después del byte 'posicion'; devuelve (eventos, nueva posición)"""
+        firma = self.firma()
+        if firma is None or firma[1] <= posicion:
+            return pd.DataFrame(columns=COLUMNAS_EVENTO), posicion
+        with open(self.ruta, "rb") as f:
+            f.seek(posicion)
+            bloque = f.read()
+        # solo líneas completas; una línea a medio escribir se leerá la próxima vez
+        fin = bloque.rfind(b"\n") + 1
+        texto = bloque[:fin].decode("utf-8")
+        if posicion == 0:
+            texto = texto.split("\n", 1)[1] if "\n" in texto else ""
+        eventos = pd.read_csv(StringIO(texto), names=COLUMNAS_EVENTO) if texto.strip() else pd.DataFrame(columns=COLUMNAS_EVENTO)
+        return eventos, posicion + fin
+
+    def todos(self):
+        """Todos los eventos sin duplicados, cacheados hasta que el archivo cambie"""
+        firma = self.firma()
+        with self._lock:
+            if firma is not None and firma != self._cache[0]:
+                eventos, _ = self.leer_desde(0)
+                eventos = eventos.drop_duplicates(['id_notificacion', 'tipo'], keep='first').reset_index(drop=True)
+                self._cache = (firma, eventos)
+            return self._cache[1]
+
+    def ids_con_evento(self, tipo):
+        eventos = self.todos()
+        return set(eventos.loc[eventos['tipo'] == tipo, 'id_notificacion'])
+
+    def ultimo_evento(self, id_notificacion):
+        """Tipo del evento de mayor nivel emitido para un viaje, o None"""
+        eventos = self.todos()
+        tipos = set(eventos.loc[eventos['id_notificacion'] == id_notificacion, 'tipo'])
+        return next((t for t in reversed(NIVELES) if t in tipos), None)
+
+
+# MOTOR DE GEOCERCAS
+
+class MotorGeocercas:
+    """Evalúa geocercas por cada actualización de posiciones y emite solo los cambios de nivel"""
+
+    def __init__(self, cola):
+        self.cola = cola
+        self._nivel = {}
+        self._firma = None
+        self._lock = threading.Lock()
+
+    def _sincronizar(self):
+        # si otro proceso agregó eventos, se reconstruyen los niveles desde la cola
+        firma = self.cola.firma()
+        if firma == self._firma:
+            return
+        eventos = self.cola.todos()
+        nivel = eventos['tipo'].map({t: i + 1 for i, t in enumerate(NIVELES)}).fillna(0)
+        self._nivel = nivel.groupby(eventos['id_notificacion']).max().astype(int).to_dict()
+        self._firma = firma
+
+    def evaluar(self, ids, transportistas, posiciones, destinos, instante=None):
+        """Una pasada vectorizada sobre todos los viajes; devuelve los eventos emitidos"""
+        ids = list(ids)
+        if not ids:
+            return []
+        niveles, distancias = niveles_geocerca(posiciones, destinos)
+        transportistas = list(transportistas)
+        instante = time.time() if instante is None else instante
+        with self._lock:
+            self._sincronizar()
+            previos = np.array([self._nivel.get(i, 0) for i in ids])
+            sube = np.flatnonzero(niveles > previos)
+            if len(sube) == 0:
+                return []
+            eventos = []
+            for k in sube.tolist():
+                for nivel in range(previos[k] + 1, niveles[k] + 1):
+                    tipo = NIVELES[nivel - 1]
+                    eventos.append({
+                        'id_evento': f"{ids[k]}-{tipo}",
+                        'instante': instante,
+                        'id_notificacion': ids[k],
+                        'transportista': transportistas[k],
+                        'tipo': tipo,
+                        'distancia_km': round(float(distancias[k]), 3)
+                    })
+                self._nivel[ids[k]] = int(niveles[k])
+            self.cola.publicar(eventos)
+            self._firma = self.cola.firma()
+        return eventos
+
+    def evaluar_filas(self, df, indices, instante=None):
+        """Evalúa las filas indicadas de un DataFrame de notificaciones ya actualizado"""
+        if len(indices) == 0:
+            return []
+        filas = df.loc[indices]
+        return self.evaluar(
+            filas['id_notificacion'], filas['transportista_asignado'],
+            filas[['transportista_lat', 'transportista_lon']].to_numpy(dtype=np.float64),
+            filas[['latitud', 'longitud']].to_numpy(dtype=np.float64),
+            instante
+        )
+
+
+_motor_geocercas = None
+_lock_geocercas = threading.Lock()
+
+
+def obtener_motor_geocercas(ruta_eventos=CSV_EVENTOS):
+    global _motor_geocercas
+    with _lock_geocercas:
+        if _motor_geocercas is None:
+            _motor_geocercas = MotorGeocercas(ColaEventos(ruta_eventos))
+        return _motor_geocercas
@@ -0,0 +1,169 @@
+"""
+Exportación GeoJSON de las rutas activas.
+
+Rutas, paradas y camiones de los viajes aceptados en una sola FeatureCollection
+con el estilo en las propiedades de cada feature (color, grosor, radio,
+etiqueta). El mapa del transportista la pinta como una única capa y otras
+herramientas (QGIS, geojson.io, kepler.gl) la pueden abrir tal cual. Uso:
+
+    python App/modules/geojson_rutas.py --salida rutas_activas.geojson
+    python App/modules/geojson_rutas.py --transportista "Juan" --ciudad Tunja
+"""
+import argparse
+import json
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+from rutas import UBICACIONES_CIUDADES
+
+
+# CONFIGURACIÓN
+
+APP_ROOT = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+CSV_NOTIFICACIONES = os.path.join(APP_ROOT, "data", "notificaciones_transporte.csv")
+
+COLORES_RUTA = ['#4285F4', '#EA4335', '#FBBC04', '#34A853', '#FF6D00', '#9C27B0']
+COLOR_BASE = '#1A73E8'
+COLOR_CAMION = '#EA4335'
+DECIMALES = 6  # ~10 cm: suficiente para el mapa y el archivo comprime mejor
+
+
+def _punto(lat, lon):
+    return {"type": "Point", "coordinates": [round(float(lon), DECIMALES), round(float(lat), DECIMALES)]}
+
+
+def _feature(geometria, propiedades):
+    return {"type": "Feature", "geometry": geometria, "properties": propiedades}
+
+
+def coleccion_rutas(viajes_activos, ciudad_origen=None):
+    """
+    FeatureCollection con una línea por ruta, un punto por parada y un camión por ruta
+    (y por entrega individual). Con ciudad_origen las rutas salen de esa base, como en
+    el mapa del transportista; sin ella (varios transportistas) salen de su primera parada.
+    Las coordenadas van en orden GeoJSON: [lon, lat].
+    """
+    features = []
+    origen = None
+    if ciudad_origen is not None:
+        origen = UBICACIONES_CIUDADES.get(ciudad_origen, UBICACIONES_CIUDADES['Tunja'])
+        features.append(_feature(_punto(*origen), {
+            'tipo': 'base', 'etiqueta': f"🏢 Base: {ciudad_origen}",
+            'color': COLOR_BASE, 'radio': 9, 'grosor': 3
+        }))
+
+    paradas = viajes_activos[viajes_activos['latitud'].notna() & viajes_activos['longitud'].notna()].copy()
+    if paradas.empty:
+        return {"type": "FeatureCollection", "features": features}
+
+    # un color por ruta; con un solo transportista, el mismo orden de grupos que crear_mapa
+    paradas['grupo'] = paradas.groupby(['transportista_asignado', 'ruta_optimizada'], dropna=False).ngroup()
+    paradas = paradas.sort_values(['grupo', 'orden_parada'], kind='stable')
+    orden = paradas['orden_parada'].fillna(1).astype(int).to_numpy()
+    progreso = (paradas['progreso_viaje'].astype(float).fillna(0.0) * 100).round().astype(int).to_numpy()
+    ruta = paradas['ruta_optimizada'].fillna("Entrega Individual").astype(str).to_numpy()
+    grupos = paradas['grupo'].to_numpy()
+    colores = np.array(COLORES_RUTA)[grupos % len(COLORES_RUTA)]
+    transportistas = paradas['transportista_asignado'].astype(str).to_numpy()
+    lat = paradas['latitud'].to_numpy(dtype=np.float64)
+    lon = paradas['longitud'].to_numpy(dtype=np.float64)
+
+    # rutas primero: las paradas y camiones quedan dibujados encima
+    cortes = np.flatnonzero(np.diff(grupos)) + 1
+    for tramo in np.split(np.arange(len(paradas)), cortes):
+        coords = np.column_stack([lon[tramo], lat[tramo]])
+        if origen is not None:
+            coords = np.vstack([[origen[1], origen[0]], coords])
+        if len(coords) < 2:
+            continue
+        i = tramo[0]
+        features.append(_feature(
+            {"type": "LineString", "coordinates": np.round(coords, DECIMALES).tolist()},
+            {'tipo': 'ruta', 'etiqueta': f"Ruta: {ruta[i]}", 'ruta': ruta[i], 'transportista': transportistas[i],
+             'paradas': int(len(tramo)), 'color': colores[i], 'grosor': 4}
+        ))
+
+    for i, (id_notificacion, campesino, producto) in enumerate(zip(
+            paradas['id_notificacion'].astype(str), paradas['campesino'].astype(str), paradas['producto'].astype(str))):
+        features.append(_feature(_punto(lat[i], lon[i]), {
+            'tipo': 'parada', 'etiqueta': f"📍 Parada {orden[i]}: {campesino} · {producto} ({progreso[i]}%)",
+            'id_notificacion': id_notificacion, 'ruta': ruta[i], 'transportista': transportistas[i],
+            'orden': int(orden[i]), 'campesino': campesino, 'producto': producto, 'progreso': int(progreso[i]),
+            'color': colores[i], 'radio': 7, 'grosor': 2
+        }))
+
+    # el camión de cada ruta va con su primera parada; si aún no reporta posición, en la base
+    con_camion = (orden == 1) | paradas['ruta_optimizada'].isna().to_numpy()
+    lat_t = paradas['transportista_lat'].to_numpy(dtype=np.float64)
+    lon_t = paradas['transportista_lon'].to_numpy(dtype=np.float64)
+    for i in np.flatnonzero(con_camion):
+        if not (np.isnan(lat_t[i]) or np.isnan(lon_t[i])):
+            posicion = (lat_t[i], lon_t[i])
+        elif origen is not None:
+            posicion = origen
+        else:
+            continue
+        features.append(_feature(_punto(*posicion), {
+            'tipo': 'camion', 'etiqueta': f"🚚 {transportistas[i]} · {ruta[i]} ({progreso[i]}%)",
+            'ruta': ruta[i], 'transportista': transportistas[i], 'progreso': int(progreso[i]),
+            'color': COLOR_CAMION, 'radio': 10, 'grosor': 3
+        }))
+
+    return {"type": "FeatureCollection", "features": features}
+
+
+# Estilo de Leaflet a partir de las propiedades de cada feature, aplicado en el navegador
+# (onEachFeature): el tamaño del mapa no crece con el número de paradas
+ESTILO_FEATURE_JS = """
+function(feature, layer) {
+    var p = feature.properties;
+    var esLinea = p.tipo === 'ruta';
+    layer.setStyle({
+        color: esLinea ? p.color : 'white',
+        weight: p.grosor,
+        opacity: esLinea ? 0.7 : 1.0,
+        fill: !esLinea,
+        fillColor: p.color,
+        fillOpacity: 0.9
+    });
+    if (layer.setRadius) {
+        layer.setRadius(p.radio || 6);
+    }
+}
+"""
+
+
+def a_texto(coleccion):
+    """Serialización compacta, sin espacios"""
+    return json.dumps(coleccion, ensure_ascii=False, separators=(',', ':'))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Exporta las rutas activas como GeoJSON")
+    parser.add_argument("--notificaciones", default=CSV_NOTIFICACIONES)
+    parser.add_argument("--transportista", help="Solo las rutas de este transportista")
+    parser.add_argument("--ciudad", help="Ciudad base desde donde salen las rutas")
+    parser.add_argument("--salida", help="Archivo .geojson (por defecto, salida estándar)")
+    args = parser.parse_args()
+    if args.ciudad is not None and args.ciudad not in UBICACIONES_CIUDADES:
+        parser.error(f"Ciudad desconocida: {args.ciudad}")
+
+    df = pd.read_csv(args.notificaciones, on_bad_lines='skip')
+    viajes = df[df['estado'] == 'Aceptado']
+    if args.transportista:
+        viajes = viajes[viajes['transportista_asignado'] == args.transportista]
+    texto = a_texto(coleccion_rutas(viajes, args.ciudad))
+
+    if args.salida:
+        with open(args.salida, "w", encoding="utf-8") as f:
+            f.write(texto)
+        print(f"{len(viajes)} paradas exportadas a {args.salida} ({len(texto) / 1024:.1f} KB)")
+    else:
+        sys.stdout.write(texto + "\n")
+
+
+if __name__ == "__main__":
+    main()
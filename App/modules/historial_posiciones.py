@@ -0,0 +1,247 @@
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+import numpy as np
+
+
+# CONFIGURACIÓN
+
+APP_ROOT = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+DIR_TRAYECTOS = os.path.join(APP_ROOT, "data", "trayectos")
+
+CAPACIDAD_RECIENTE = 256   # puntos a resolución completa por viaje
+PUNTOS_POR_CUBETA = 32     # al compactar, cada cubeta de 32 puntos queda en 6 como mucho
+MAX_HISTORIA = 2048        # por encima, la historia se vuelve a reducir a la mitad
+SEGUNDOS_INACTIVA = 600    # una serie ya guardada y sin uso en este tiempo sale de memoria
+MAX_RASTROS_CACHE = 256    # recorridos leídos del disco que recuerdan las vistas
+
+_T, _LAT, _LON = 0, 1, 2
+
+
+# REDUCCIÓN QUE CONSERVA EXTREMOS
+
+def reducir_min_max(puntos, tam_cubeta=PUNTOS_POR_CUBETA):
+    """
+    Reduce una serie (N, 3) de (t, lat, lon) ordenada por tiempo conservando, en
+    cada cubeta, el primer y el último punto y los extremos de latitud y longitud,
+    de modo que el trazo reducido no recorta las esquinas del recorrido.
+    """
+    n = len(puntos)
+    if n <= tam_cubeta:
+        return puntos
+    n_cubetas = -(-n // tam_cubeta)
+    relleno = n_cubetas * tam_cubeta - n
+    desplazamiento = np.arange(n_cubetas) * tam_cubeta
+
+    seleccion = [desplazamiento, np.minimum(desplazamiento + tam_cubeta, n) - 1]
+    for columna in (_LAT, _LON):
+        valores = np.concatenate([puntos[:, columna], np.full(relleno, np.nan)]).reshape(n_cubetas, tam_cubeta)
+        seleccion.append(desplazamiento + np.nanargmin(valores, axis=1))
+        seleccion.append(desplazamiento + np.nanargmax(valores, axis=1))
+    return puntos[np.unique(np.concatenate(seleccion))]
+
+
+# SERIE DE UN VIAJE
+
+class SerieTrayecto:
+    """Anillo numpy con los puntos recientes más una historia reducida de los antiguos"""
+
+    def __init__(self, capacidad=CAPACIDAD_RECIENTE):
+        self._anillo = np.empty((capacidad, 3))
+        self._inicio = 0
+        self._n = 0
+        self._historia = np.empty((0, 3))
+
+    def __len__(self):
+        return len(self._historia) + self._n
+
+    def agregar(self, t, lat, lon):
+        """Agrega uno o varios puntos; si el anillo se llena, la mitad más antigua se compacta"""
+        nuevos = np.column_stack([np.atleast_1d(t), np.atleast_1d(lat), np.atleast_1d(lon)]).astype(np.float64)
+        capacidad = len(self._anillo)
+        while len(nuevos):
+            if self._n == capacidad:
+                self._compactar()
+            k = min(capacidad - self._n, len(nuevos))
+            posiciones = (self._inicio + self._n + np.arange(k)) % capacidad
+            self._anillo[posiciones] = nuevos[:k]
+            self._n += k
+            nuevos = nuevos[k:]
+
+    def _compactar(self):
+        capacidad = len(self._anillo)
+        mitad = capacidad // 2
+        viejos = self._anillo[(self._inicio + np.arange(mitad)) % capacidad]
+        viejos = viejos[np.argsort(viejos[:, _T], kind='stable')]
+        self._historia = np.concatenate([self._historia, reducir_min_max(viejos)])
+        if len(self._historia) > MAX_HISTORIA:
+            # cubetas de 12 con hasta 6 supervivientes: la historia queda más o menos a la mitad
+            self._historia = reducir_min_max(self._historia, 12)
+        self._inicio = (self._inicio + mitad) % capacidad
+        self._n -= mitad
+
+    def recientes(self):
+        return self._anillo[(self._inicio + np.arange(self._n)) % len(self._anillo)]
+
+    def puntos(self):
+        """Toda la serie (N, 3) ordenada por tiempo: historia reducida + puntos recientes"""
+        todos = np.concatenate([self._historia, self.recientes()])
+        if len(todos) > 1 and np.any(np.diff(todos[:, _T]) < 0):
+            todos = todos[np.argsort(todos[:, _T], kind='stable')]
+        return todos
+
+    def rango(self, desde=None, hasta=None):
+        """Puntos con desde <= t <= hasta (búsqueda binaria sobre la serie ordenada)"""
+        return recortar_rango(self.puntos(), desde, hasta)
+
+    def a_arreglos(self):
+        return {'historia': self._historia, 'recientes': self.recientes()}
+
+    @classmethod
+    def desde_arreglos(cls, historia, recientes, capacidad=CAPACIDAD_RECIENTE):
+        serie = cls(capacidad)
+        serie._historia = np.asarray(historia, dtype=np.float64).reshape(-1, 3)
+        serie.agregar(*np.asarray(recientes, dtype=np.float64).reshape(-1, 3).T)
+        return serie
+
+
+def recortar_rango(puntos, desde=None, hasta=None):
+    tiempos = puntos[:, _T]
+    i = 0 if desde is None else np.searchsorted(tiempos, desde, side='left')
+    j = len(puntos) if hasta is None else np.searchsorted(tiempos, hasta, side='right')
+    return puntos[i:j]
+
+
+# ALMACÉN DE TODOS LOS VIAJES
+
+def _archivo_trayecto(directorio, id_notificacion):
+    return os.path.join(directorio, re.sub(r'[^A-Za-z0-9_-]', '_', str(id_notificacion)) + ".npz")
+
+
+class AlmacenTrayectos:
+    """
+    Series por id_notificacion; cada viaje se persiste en su propio .npz. Las series ya
+    guardadas que nadie usa en segundos_inactiva se sueltan y, si vuelven, se releen del disco.
+    """
+
+    def __init__(self, directorio=DIR_TRAYECTOS, segundos_inactiva=SEGUNDOS_INACTIVA):
+        self.directorio = directorio
+        self.segundos_inactiva = segundos_inactiva
+        self._series = {}
+        self._ultimo_uso = {}
+        self._tocados = set()
+        self._lock = threading.Lock()
+        self._lock_guardar = threading.Lock()
+
+    def _serie(self, id_notificacion):
+        self._ultimo_uso[id_notificacion] = time.monotonic()
+        serie = self._series.get(id_notificacion)
+        if serie is None:
+            archivo = _archivo_trayecto(self.directorio, id_notificacion)
+            serie = SerieTrayecto()
+            if os.path.exists(archivo):
+                try:
+                    with np.load(archivo) as datos:
+                        serie = SerieTrayecto.desde_arreglos(datos['historia'], datos['recientes'])
+                except (OSError, ValueError, KeyError):
+                    pass
+            self._series[id_notificacion] = serie
+        return serie
+
+    def registrar(self, ids, t, lat, lon):
+        """Registra un lote de puntos de muchos viajes, agrupados por viaje en una sola ordenación"""
+        ids = np.asarray(ids, dtype=object)
+        if len(ids) == 0:
+            return
+        t, lat, lon = (np.broadcast_to(np.asarray(v, dtype=np.float64), ids.shape) for v in (t, lat, lon))
+        orden = np.argsort(ids.astype(str), kind='stable')
+        claves, inicios = np.unique(ids[orden].astype(str), return_index=True)
+        limites = np.append(inicios, len(orden))
+        with self._lock:
+            for k in range(len(claves)):
+                tramo = orden[limites[k]:limites[k + 1]]
+                id_notificacion = ids[tramo[0]]
+                self._serie(id_notificacion).agregar(t[tramo], lat[tramo], lon[tramo])
+                self._tocados.add(id_notificacion)
+
+    def rango(self, id_notificacion, desde=None, hasta=None):
+        with self._lock:
+            return self._serie(id_notificacion).rango(desde, hasta)
+
+    def guardar(self):
+        """
+        Persiste los viajes modificados desde el último guardado (escritura atómica) y
+        suelta las series inactivas, que ya están en disco.
+        """
+        with self._lock_guardar:
+            with self._lock:
+                tocados, self._tocados = self._tocados, set()
+                datos = {i: self._series[i].a_arreglos() for i in tocados}
+            if datos:
+                os.makedirs(self.directorio, exist_ok=True)
+            for id_notificacion, arreglos in datos.items():
+                archivo = _archivo_trayecto(self.directorio, id_notificacion)
+                temporal = f"{archivo}.{os.getpid()}.tmp"
+                with open(temporal, "wb") as f:
+                    np.savez(f, **arreglos)
+                os.replace(temporal, archivo)
+            self._soltar_inactivas()
+        return len(datos)
+
+    def _soltar_inactivas(self):
+        limite = time.monotonic() - self.segundos_inactiva
+        with self._lock:
+            for id_notificacion in [i for i, t in self._ultimo_uso.items() if t < limite and i not in self._tocados]:
+                self._series.pop(id_notificacion, None)
+                del self._ultimo_uso[id_notificacion]
+
+
+_almacen = None
+_lock_almacen = threading.Lock()
+
+
+def obtener_almacen():
+    """Almacén de trayectos compartido por el proceso (motor de seguimiento o ingesta GPS)"""
+    global _almacen
+    with _lock_almacen:
+        if _almacen is None:
+            _almacen = AlmacenTrayectos()
+        return _almacen
+
+
+# LECTURA DESDE LAS VISTAS
+
+_cache_rastros = OrderedDict()   # archivo -> (mtime, puntos), el más reciente al final
+_lock_rastros = threading.Lock()
+
+
+def cargar_rastro(id_notificacion, desde=None, hasta=None, directorio=DIR_TRAYECTOS):
+    """
+    Recorrido (N, 3) de un viaje leído del disco, para dibujarlo en otro proceso.
+    Solo se vuelve a leer el archivo si cambió desde la última vez; se recuerdan los
+    MAX_RASTROS_CACHE usados más recientemente.
+    """
+    archivo = _archivo_trayecto(directorio, id_notificacion)
+    try:
+        mtime = os.stat(archivo).st_mtime_ns
+    except OSError:
+        return np.empty((0, 3))
+    with _lock_rastros:
+        en_cache = _cache_rastros.get(archivo)
+        if en_cache is not None:
+            _cache_rastros.move_to_end(archivo)
+    if en_cache is None or en_cache[0] != mtime:
+        try:
+            with np.load(archivo) as datos:
+                puntos = SerieTrayecto.desde_arreglos(datos['historia'], datos['recientes']).puntos()
+        except (OSError, ValueError, KeyError):
+            return np.empty((0, 3))
+        en_cache = (mtime, puntos)
+        with _lock_rastros:
+            _cache_rastros[archivo] = en_cache
+            _cache_rastros.move_to_end(archivo)
+            while len(_cache_rastros) > MAX_RASTROS_CACHE:
+                _cache_rastros.popitem(last=False)
+    return recortar_rango(en_cache[1], desde, hasta)
@@ -0,0 +1,305 @@
+"""
+Servicio local de ingesta de posiciones GPS.
+
+Los teléfonos de los transportistas envían lotes de pings por HTTP:
+
+    POST /posiciones
+    {"pings": [{"transportista": "Carlos Pérez", "lat": 5.53, "lon": -73.36, "timestamp": 1731940000}, ...]}
+
+Los pings se acumulan en memoria y se escriben en grupo (una lectura y una
+escritura del CSV por vaciado) actualizando transportista_lat/lon,
+distancia_restante_km, progreso_viaje y tiempo_estimado_llegada de los viajes
+aceptados de cada transportista; el recorrido completo de cada viaje queda en
+data/trayectos (ver historial_posiciones), cada vaciado se agrega a la bitácora
+que luego se puede reproducir (ver reproduccion) y las llegadas se publican
+como eventos de geocerca (ver geocercas). Puede correr en su propio proceso:
+cada vaciado lee y reescribe el CSV con el mismo candado de archivo que usa la
+app (en Windows el candado no cruza procesos, así que allí debe correr dentro
+del proceso de la app). Uso:
+
+    python App/modules/ingesta_gps.py --puerto 8765
+"""
+import argparse
+import json
+import os
+import threading
+import time
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+import pandas as pd
+
+from eta import distancia_tramos_km, estimar_eta_minutos
+from geocercas import ColaEventos, MotorGeocercas
+from historial_posiciones import AlmacenTrayectos
+from bitacora_posiciones import BitacoraPosiciones
+from rutas import UBICACIONES_CIUDADES
+from seguimiento import COLUMNAS_MOVIMIENTO, candado_archivo, escribir_csv_atomico
+
+
+# CONFIGURACIÓN
+
+APP_ROOT = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+DATA_DIR = os.path.join(APP_ROOT, "data")
+CSV_NOTIFICACIONES = os.path.join(DATA_DIR, "notificaciones_transporte.csv")
+CSV_TRACKING = os.path.join(DATA_DIR, "tracking_transportistas.csv")
+
+PUERTO_DEFECTO = 8765
+INTERVALO_VACIADO_S = 1.0     # como mucho un segundo entre escrituras en grupo
+MAX_PINGS_PENDIENTES = 20000  # vaciado anticipado si el búfer crece más
+MAX_PINGS_POR_LOTE = 5000
+MAX_BYTES_CUERPO = 2 * 1024 * 1024
+
+
+# VALIDACIÓN
+
+def _instante(valor):
+    """Acepta segundos epoch o fecha ISO; sin valor se usa la hora de llegada"""
+    if valor is None:
+        return time.time()
+    if isinstance(valor, (int, float)):
+        return float(valor)
+    return datetime.fromisoformat(str(valor)).timestamp()
+
+
+def validar_ping(ping):
+    """Devuelve (transportista, lat, lon, timestamp) o None si el ping no es válido"""
+    try:
+        transportista = str(ping['transportista']).strip()
+        lat = float(ping['lat'])
+        lon = float(ping['lon'])
+        instante = _instante(ping.get('timestamp'))
+    except (KeyError, TypeError, ValueError, AttributeError):
+        return None
+    if not transportista or not (-90 <= lat <= 90 and -180 <= lon <= 180):
+        return None
+    return transportista, lat, lon, instante
+
+
+# APLICACIÓN EN GRUPO
+
+def ultimo_ping_por_transportista(pings):
+    """De todos los pings del lote se queda con el más reciente de cada transportista"""
+    ultimos = {}
+    for transportista, lat, lon, instante in pings:
+        previo = ultimos.get(transportista)
+        if previo is None or instante >= previo[2]:
+            ultimos[transportista] = (lat, lon, instante)
+    return ultimos
+
+
+def aplicar_pings(df, ultimos, bases):
+    """
+    Actualiza en df (in-place) los viajes aceptados de los transportistas con ping.
+    bases: transportista -> (lat, lon) de su ciudad base, para medir el progreso.
+    Devuelve los índices actualizados.
+    """
+    if df.empty or not ultimos:
+        return df.index[:0]
+    activos = df[(df['estado'] == 'Aceptado') & df['transportista_asignado'].isin(ultimos.keys())]
+    destinos = activos[['latitud', 'longitud']].to_numpy(dtype=np.float64)
+    activos = activos[~np.isnan(destinos).any(axis=1)]
+    if activos.empty:
+        return activos.index
+
+    destinos = activos[['latitud', 'longitud']].to_numpy(dtype=np.float64)
+    nombres = activos['transportista_asignado'].tolist()
+    posicion = np.array([ultimos[n][:2] for n in nombres], dtype=np.float64)
+    base_defecto = UBICACIONES_CIUDADES['Tunja']
+    origenes = np.array([bases.get(n, base_defecto) for n in nombres], dtype=np.float64)
+
+    restante = distancia_tramos_km(posicion, destinos)
+    total = distancia_tramos_km(origenes, destinos)
+    progreso = np.clip(1.0 - np.divide(restante, total, out=np.zeros_like(restante), where=total > 0), 0.0, 1.0)
+    tiempo = estimar_eta_minutos(origenes, destinos, restante)
+
+    df.loc[activos.index, COLUMNAS_MOVIMIENTO] = np.column_stack([posicion, progreso, restante, tiempo])
+    return activos.index
+
+
+def registrar_trayectos(almacen, lote, viajes):
+    """Guarda todos los pings del lote (no solo el último) en el recorrido de cada viaje de su transportista"""
+    pings = pd.DataFrame(lote, columns=['transportista_asignado', 'lat', 'lon', 't'])
+    puntos = pings.merge(viajes, on='transportista_asignado')
+    if puntos.empty:
+        return
+    almacen.registrar(puntos['id_notificacion'].to_numpy(), puntos['t'].to_numpy(),
+                      puntos['lat'].to_numpy(), puntos['lon'].to_numpy())
+    almacen.guardar()
+
+
+def cargar_bases(ruta_tracking=CSV_TRACKING):
+    """Ciudad base declarada por cada transportista activo (ver registrar_transportista_activo)"""
+    if not os.path.exists(ruta_tracking):
+        return {}
+    try:
+        df = pd.read_csv(ruta_tracking).dropna(subset=['latitud', 'longitud'])
+    except Exception:
+        return {}
+    return {t: (la, lo) for t, la, lo in zip(df['transportista'], df['latitud'], df['longitud'])}
+
+
+# BÚFER CON ESCRITURA EN GRUPO
+
+class BufferPosiciones:
+    """Acumula pings en memoria y los vacía al CSV en grupo desde un hilo propio"""
+
+    def __init__(self, ruta_csv=CSV_NOTIFICACIONES, ruta_tracking=CSV_TRACKING,
+                 intervalo_s=INTERVALO_VACIADO_S, max_pendientes=MAX_PINGS_PENDIENTES):
+        self.ruta_csv = ruta_csv
+        self.ruta_tracking = ruta_tracking
+        self.intervalo_s = intervalo_s
+        self.max_pendientes = max_pendientes
+        self.almacen = AlmacenTrayectos(os.path.join(os.path.dirname(ruta_csv), "trayectos"))
+        self.geocercas = MotorGeocercas(ColaEventos(os.path.join(os.path.dirname(ruta_csv), "eventos_geocerca.csv")))
+        self.bitacora = BitacoraPosiciones(os.path.join(os.path.dirname(ruta_csv), "bitacora_posiciones"))
+        self._pendientes = []
+        self._lock = threading.Lock()
+        self._hay_lote = threading.Event()
+        self._detener = threading.Event()
+        self._hilo = None
+        self.estadisticas = {'recibidos': 0, 'rechazados': 0, 'vaciados': 0,
+                             'viajes_actualizados': 0, 'ultimo_vaciado_ms': 0.0}
+
+    def agregar(self, pings):
+        """Valida y encola un lote; devuelve (aceptados, rechazados)"""
+        validos = [v for v in map(validar_ping, pings) if v is not None]
+        rechazados = len(pings) - len(validos)
+        with self._lock:
+            self._pendientes.extend(validos)
+            self.estadisticas['recibidos'] += len(validos)
+            self.estadisticas['rechazados'] += rechazados
+            lleno = len(self._pendientes) >= self.max_pendientes
+        if lleno:
+            self._hay_lote.set()
+        return len(validos), rechazados
+
+    def vaciar(self):
+        """Escritura en grupo: una lectura y una escritura del CSV para todos los pings pendientes"""
+        with self._lock:
+            lote, self._pendientes = self._pendientes, []
+        if not lote:
+            return 0
+        inicio = time.perf_counter()
+        actualizados = 0
+        if os.path.exists(self.ruta_csv):
+            # candado de archivo: la app (otro proceso) también reescribe este CSV
+            with candado_archivo(self.ruta_csv):
+                df = pd.read_csv(self.ruta_csv)
+                for col in COLUMNAS_MOVIMIENTO:
+                    if col not in df.columns:
+                        df[col] = np.nan
+                indices = aplicar_pings(df, ultimo_ping_por_transportista(lote), cargar_bases(self.ruta_tracking))
+                if len(indices):
+                    escribir_csv_atomico(df, self.ruta_csv)
+                actualizados = len(indices)
+            if actualizados:
+                registrar_trayectos(self.almacen, lote, df.loc[indices, ['id_notificacion', 'transportista_asignado']])
+                ahora = time.time()
+                self.bitacora.registrar_filas(df, indices, ahora)
+                self.geocercas.evaluar_filas(df, indices, ahora)
+        with self._lock:
+            self.estadisticas['vaciados'] += 1
+            self.estadisticas['viajes_actualizados'] += actualizados
+            self.estadisticas['ultimo_vaciado_ms'] = (time.perf_counter() - inicio) * 1000
+        return actualizados
+
+    def iniciar(self):
+        if self._hilo is not None and self._hilo.is_alive():
+            return
+        self._detener.clear()
+        self._hilo = threading.Thread(target=self._bucle, name="ingesta-gps", daemon=True)
+        self._hilo.start()
+
+    def detener(self):
+        self._detener.set()
+        self._hay_lote.set()
+        if self._hilo is not None:
+            self._hilo.join()
+        self.vaciar()
+
+    def _bucle(self):
+        while not self._detener.is_set():
+            self._hay_lote.wait(self.intervalo_s)
+            self._hay_lote.clear()
+            try:
+                self.vaciar()
+            except Exception as e:
+                print(f"Error al vaciar posiciones: {e}")
+
+
+# SERVIDOR HTTP
+
+class ManejadorIngesta(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"   # conexiones persistentes para los teléfonos
+    disable_nagle_algorithm = True  # respuestas pequeñas sin esperar al ACK retardado
+    buffer = None
+
+    def _responder(self, codigo, cuerpo):
+        datos = json.dumps(cuerpo).encode("utf-8")
+        self.send_response(codigo)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(datos)))
+        self.end_headers()
+        self.wfile.write(datos)
+
+    def do_POST(self):
+        if self.path != "/posiciones":
+            self._responder(404, {'error': 'ruta no encontrada'})
+            return
+        largo = int(self.headers.get("Content-Length", 0))
+        if largo <= 0 or largo > MAX_BYTES_CUERPO:
+            self._responder(413 if largo > 0 else 400, {'error': 'cuerpo vacío o demasiado grande'})
+            return
+        try:
+            cuerpo = json.loads(self.rfile.read(largo))
+        except ValueError:
+            self._responder(400, {'error': 'JSON inválido'})
+            return
+        pings = cuerpo.get('pings') if isinstance(cuerpo, dict) else cuerpo
+        if not isinstance(pings, list) or len(pings) > MAX_PINGS_POR_LOTE:
+            self._responder(400, {'error': f'se espera una lista de hasta {MAX_PINGS_POR_LOTE} pings'})
+            return
+        aceptados, rechazados = self.buffer.agregar(pings)
+        self._responder(202, {'aceptados': aceptados, 'rechazados': rechazados})
+
+    def do_GET(self):
+        if self.path != "/estado":
+            self._responder(404, {'error': 'ruta no encontrada'})
+            return
+        self._responder(200, self.buffer.estadisticas)
+
+    def log_message(self, formato, *args):
+        # un log por petición costaría más que la propia ingesta
+        pass
+
+
+def crear_servidor(buffer, host="127.0.0.1", puerto=PUERTO_DEFECTO):
+    manejador = type("ManejadorIngestaLocal", (ManejadorIngesta,), {'buffer': buffer})
+    return ThreadingHTTPServer((host, puerto), manejador)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Servicio de ingesta de posiciones GPS")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--puerto", type=int, default=PUERTO_DEFECTO)
+    parser.add_argument("--intervalo", type=float, default=INTERVALO_VACIADO_S, help="Segundos entre escrituras en grupo")
+    parser.add_argument("--csv", default=CSV_NOTIFICACIONES, help="CSV de notificaciones a actualizar")
+    args = parser.parse_args()
+
+    buffer = BufferPosiciones(args.csv, intervalo_s=args.intervalo)
+    buffer.iniciar()
+    servidor = crear_servidor(buffer, args.host, args.puerto)
+    print(f"Ingesta GPS escuchando en http://{args.host}:{args.puerto}/posiciones")
+    try:
+        servidor.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        servidor.server_close()
+        buffer.detener()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,163 @@
+import json
+import os
+import numpy as np
+import pandas as pd
+import pydeck as pdk
+from pydeck.bindings.json_tools import default_serialize
+import streamlit as st
+from rutas import UBICACIONES_CIUDADES
+from geojson_rutas import COLORES_RUTA
+
+
+# CONFIGURACIÓN
+
+APP_ROOT = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+CSV_NOTIFICACIONES = os.path.join(APP_ROOT, "data", "notificaciones_transporte.csv")
+
+# Mapa WebGL (deck.gl): todo se dibuja en la GPU a partir de columnas, así que
+# decenas de miles de paradas y camiones siguen siendo fluidos.
+ESTILO_MAPA = "light"
+COLOR_CAMION = [234, 67, 53]
+COLOR_BASE = [26, 115, 232]
+DECIMALES = 5  # ~1 m
+_RGB_RUTAS = np.array([[int(c[i:i + 2], 16) for i in (1, 3, 5)] for c in COLORES_RUTA], dtype=np.uint8)
+
+
+class CapaColumnas(pdk.Layer):
+    """
+    Capa cuyos datos van del DataFrame al JSON con pandas (en C). pdk.Layer convierte el
+    DataFrame en un dict de Python por fila (to_dict(orient="records")); aquí los datos
+    quedan en columnas hasta que DeckCompacto los escribe. El navegador sigue recibiendo
+    un objeto por fila: st.pydeck_chart no tiene transporte binario.
+    """
+
+    def __init__(self, tipo, datos, **kwargs):
+        super().__init__(tipo, None, **kwargs)
+        self._columnas = datos
+        # marcador que DeckCompacto.to_json reemplaza por los datos
+        self._data = f"@@datos:{self.id}@@"
+
+    def datos_json(self):
+        return self._columnas.to_json(orient="records", double_precision=DECIMALES)
+
+
+class DeckCompacto(pdk.Deck):
+    """
+    Deck que se serializa sin sangría ni claves ordenadas. pydeck usa indent=2, que
+    obliga a json a usar su codificador en Python: con 100 mil puntos son segundos.
+    Los datos de las CapaColumnas se insertan ya serializados por pandas.
+    """
+
+    def to_json(self):
+        texto = json.dumps(self, default=default_serialize, separators=(",", ":"))
+        for capa in self.layers:
+            if isinstance(capa, CapaColumnas):
+                texto = texto.replace(json.dumps(capa.data), capa.datos_json(), 1)
+        return texto
+
+
+# COLUMNAS PARA LAS CAPAS
+
+def columnas_flota(viajes, origen=None):
+    """
+    Paradas, tramos de ruta y camiones como DataFrames de columnas numéricas armadas con
+    numpy, sin recorrer las paradas en Python. Los tramos unen paradas consecutivas de
+    cada ruta (y la base con la primera, si se da origen).
+    """
+    viajes = viajes[viajes['latitud'].notna() & viajes['longitud'].notna()]
+    grupo = viajes.groupby(['transportista_asignado', 'ruta_optimizada'], dropna=False).ngroup().to_numpy()
+    orden_parada = viajes['orden_parada'].to_numpy(dtype=np.float64)
+    orden = np.lexsort((np.nan_to_num(orden_parada, nan=1.0), grupo))
+    grupo = grupo[orden]
+    lat = viajes['latitud'].to_numpy(dtype=np.float64)[orden].round(DECIMALES)
+    lon = viajes['longitud'].to_numpy(dtype=np.float64)[orden].round(DECIMALES)
+    rgb = _RGB_RUTAS[grupo % len(_RGB_RUTAS)]
+
+    paradas = pd.DataFrame({
+        'lon': lon, 'lat': lat, 'r': rgb[:, 0], 'g': rgb[:, 1], 'b': rgb[:, 2],
+        'etiqueta': ("📍 " + viajes['campesino'].astype(str) + " · " + viajes['producto'].astype(str)).to_numpy()[orden]
+    })
+
+    # tramo i -> i+1 cuando ambas paradas son de la misma ruta
+    misma = grupo[1:] == grupo[:-1]
+    lon0, lat0, lon1, lat1 = lon[:-1][misma], lat[:-1][misma], lon[1:][misma], lat[1:][misma]
+    color_tramo = rgb[:-1][misma]
+    if origen is not None and len(grupo):
+        primeras = np.flatnonzero(np.concatenate([[True], ~misma]))
+        lon0 = np.concatenate([np.full(len(primeras), origen[1]), lon0])
+        lat0 = np.concatenate([np.full(len(primeras), origen[0]), lat0])
+        lon1 = np.concatenate([lon[primeras], lon1])
+        lat1 = np.concatenate([lat[primeras], lat1])
+        color_tramo = np.concatenate([rgb[primeras], color_tramo])
+    tramos = pd.DataFrame({'lon0': lon0, 'lat0': lat0, 'lon1': lon1, 'lat1': lat1,
+                           'r': color_tramo[:, 0], 'g': color_tramo[:, 1], 'b': color_tramo[:, 2]})
+
+    # un camión por transportista, en la posición guardada en su parada más próxima (orden_parada
+    # más bajo), como en geojson_rutas: el CSV no guarda la hora de cada reporte
+    con_posicion = viajes['transportista_lat'].notna() & viajes['transportista_lon'].notna()
+    ultimas = (viajes[con_posicion].sort_values('orden_parada', kind='stable', na_position='last')
+               .drop_duplicates('transportista_asignado'))
+    camiones = pd.DataFrame({
+        'lon': ultimas['transportista_lon'].to_numpy(dtype=np.float64).round(DECIMALES),
+        'lat': ultimas['transportista_lat'].to_numpy(dtype=np.float64).round(DECIMALES),
+        'etiqueta': ("🚚 " + ultimas['transportista_asignado'].astype(str) + " · "
+                     + (ultimas['progreso_viaje'].astype(float).fillna(0.0) * 100).round().astype(int).astype(str) + "%").to_numpy()
+    })
+    return paradas, tramos, camiones
+
+
+def crear_deck(paradas, tramos, camiones, centro, zoom=11, origen=None):
+    """Mapa WebGL con tres capas: tramos de ruta, paradas y camiones (y la base, si se da)"""
+    capas = [
+        CapaColumnas("LineLayer", tramos, get_source_position="[lon0, lat0]", get_target_position="[lon1, lat1]",
+                     get_color="[r, g, b, 170]", get_width=3, width_min_pixels=1),
+        CapaColumnas("ScatterplotLayer", paradas, get_position="[lon, lat]", get_fill_color="[r, g, b, 220]",
+                     get_line_color=[255, 255, 255], stroked=True, line_width_min_pixels=1,
+                     get_radius=60, radius_min_pixels=3, radius_max_pixels=12, pickable=True),
+        CapaColumnas("ScatterplotLayer", camiones, get_position="[lon, lat]", get_fill_color=COLOR_CAMION,
+                     get_line_color=[255, 255, 255], stroked=True, line_width_min_pixels=2,
+                     get_radius=150, radius_min_pixels=5, radius_max_pixels=16, pickable=True),
+    ]
+    if origen is not None:
+        base = pd.DataFrame({'lon': [origen[1]], 'lat': [origen[0]], 'etiqueta': ["🏢 Base"]})
+        capas.append(CapaColumnas("ScatterplotLayer", base, get_position="[lon, lat]", get_fill_color=COLOR_BASE,
+                                  get_radius=250, radius_min_pixels=8, pickable=True))
+    return DeckCompacto(
+        layers=capas,
+        initial_view_state=pdk.ViewState(latitude=centro[0], longitude=centro[1], zoom=zoom),
+        map_provider="carto", map_style=ESTILO_MAPA,
+        tooltip={"text": "{etiqueta}"}
+    )
+
+
+def mapa_webgl_transportista(ciudad_origen, viajes_activos):
+    origen = UBICACIONES_CIUDADES.get(ciudad_origen, UBICACIONES_CIUDADES['Tunja'])
+    paradas, tramos, camiones = columnas_flota(viajes_activos, origen)
+    return crear_deck(paradas, tramos, camiones, origen, 11, origen)
+
+
+# VISTA DE FLOTA (ADMINISTRADOR)
+
+def vista_flota():
+    """Todos los viajes aceptados y todos los camiones en un solo mapa WebGL"""
+    if not os.path.exists(CSV_NOTIFICACIONES):
+        st.info("No hay viajes registrados todavía.")
+        return
+    df = pd.read_csv(CSV_NOTIFICACIONES, on_bad_lines='skip')
+    for col in ['transportista_asignado', 'ruta_optimizada', 'orden_parada', 'transportista_lat',
+                'transportista_lon', 'progreso_viaje']:
+        if col not in df.columns:
+            df[col] = np.nan
+    viajes = df[df['estado'] == 'Aceptado']
+    paradas, tramos, camiones = columnas_flota(viajes)
+
+    col1, col2, col3 = st.columns(3)
+    col1.metric("📍 Paradas activas", f"{len(paradas):,}")
+    col2.metric("🚚 Camiones en ruta", f"{len(camiones):,}")
+    col3.metric("👤 Transportistas", f"{viajes['transportista_asignado'].nunique():,}")
+    if paradas.empty:
+        st.info("No hay viajes en curso.")
+        return
+
+    centro = (float(paradas['lat'].mean()), float(paradas['lon'].mean()))
+    st.pydeck_chart(crear_deck(paradas, tramos, camiones, centro, 9), use_container_width=True)
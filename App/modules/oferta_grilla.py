@@ -0,0 +1,217 @@
+import threading
+import numpy as np
+import pandas as pd
+import streamlit as st
+import folium
+from streamlit_folium import st_folium
+from folium import plugins
+from servidor_teselas import ATRIBUCIONES, url_teselas
+from bus_eventos import ACEPTADA, PUBLICADA, RECOGIDA, RETIRADA, VENDIDA, obtener_bus
+
+
+# CONFIGURACIÓN
+
+PRECISION_GEOHASH = 5   # celdas de ~4.9 x 4.9 km: unas mil cubren todo Boyacá
+CENTRO_BOYACA = (5.55, -73.35)
+ZOOM_BOYACA = 9
+# eventos que sacan, agregan o cambian una publicación pendiente
+TIPOS_OFERTA = {PUBLICADA, ACEPTADA, RECOGIDA, RETIRADA, VENDIDA}
+
+_BASE32 = np.array(list("0123456789bcdefghjkmnpqrstuvwxyz"))
+_DECODIFICAR = {c: i for i, c in enumerate(_BASE32)}
+
+
+# GEOHASH
+
+def geohash(lat, lon, precision=PRECISION_GEOHASH):
+    """Geohash de arreglos de coordenadas, sin recorrerlos punto por punto"""
+    lat = np.asarray(lat, dtype=np.float64)
+    lon = np.asarray(lon, dtype=np.float64)
+    bits = 5 * precision
+    bits_lon, bits_lat = (bits + 1) // 2, bits // 2
+    ilat = np.clip(((lat + 90.0) / 180.0 * (1 << bits_lat)).astype(np.int64), 0, (1 << bits_lat) - 1)
+    ilon = np.clip(((lon + 180.0) / 360.0 * (1 << bits_lon)).astype(np.int64), 0, (1 << bits_lon) - 1)
+    # bits intercalados empezando por la longitud
+    codigo = np.zeros_like(ilat)
+    for i in range(bits):
+        if i % 2 == 0:
+            bit = (ilon >> (bits_lon - 1 - i // 2)) & 1
+        else:
+            bit = (ilat >> (bits_lat - 1 - i // 2)) & 1
+        codigo = (codigo << 1) | bit
+    celdas = _BASE32[(codigo >> (5 * (precision - 1))) & 31]
+    for k in range(1, precision):
+        celdas = np.char.add(celdas, _BASE32[(codigo >> (5 * (precision - 1 - k))) & 31])
+    return celdas
+
+
+def centro_celda(celda):
+    """Centro (lat, lon) de una celda geohash"""
+    lat_min, lat_max, lon_min, lon_max = -90.0, 90.0, -180.0, 180.0
+    es_lon = True
+    for c in celda:
+        valor = _DECODIFICAR[c]
+        for desplazamiento in range(4, -1, -1):
+            bit = (valor >> desplazamiento) & 1
+            if es_lon:
+                medio = (lon_min + lon_max) / 2
+                lon_min, lon_max = (medio, lon_max) if bit else (lon_min, medio)
+            else:
+                medio = (lat_min + lat_max) / 2
+                lat_min, lat_max = (medio, lat_max) if bit else (lat_min, medio)
+            es_lon = not es_lon
+    return (lat_min + lat_max) / 2, (lon_min + lon_max) / 2
+
+
+# GRILLA DE OFERTA
+
+class GrillaOferta:
+    """
+    Kilos y número de publicaciones pendientes por celda geohash y producto. Se arma
+    una vez desde el CSV y luego solo se corrigen las publicaciones que el bus de
+    eventos reporta como publicadas, aceptadas, retiradas o vendidas. Si algo se
+    escribió por fuera del bus (otro proceso), los totales no cuadran y se rearma.
+    """
+
+    def __init__(self, precision=PRECISION_GEOHASH):
+        self.precision = precision
+        self._lock = threading.Lock()
+        self._suscripcion = obtener_bus().suscribir({'tipo': TIPOS_OFERTA})
+        self._aportes = None   # id_notificacion -> (celda, producto, kg)
+        self._celdas = {}      # (celda, producto) -> [kg, publicaciones]
+        self._centros = {}
+        self.reconstrucciones = 0
+        self.actualizaciones = 0
+
+    @staticmethod
+    def _pendientes(df):
+        return df[(df['estado'] == 'Pendiente') & df['latitud'].notna() & df['longitud'].notna()]
+
+    def _aportes_de(self, pendientes):
+        celdas = geohash(pendientes['latitud'], pendientes['longitud'], self.precision)
+        kg = pd.to_numeric(pendientes['cantidad_kg'], errors='coerce').fillna(0.0).to_numpy(dtype=np.float64)
+        return zip(pendientes['id_notificacion'].astype(str), celdas.tolist(),
+                   pendientes['producto'].astype(str), kg.tolist())
+
+    def _reconstruir(self, pendientes):
+        self._aportes = {i: (celda, producto, kg) for i, celda, producto, kg in self._aportes_de(pendientes)}
+        self._celdas = {}
+        for celda, producto, kg in self._aportes.values():
+            acumulado = self._celdas.setdefault((celda, producto), [0.0, 0])
+            acumulado[0] += kg
+            acumulado[1] += 1
+        self.reconstrucciones += 1
+
+    def _quitar(self, id_notificacion):
+        aporte = self._aportes.pop(id_notificacion, None)
+        if aporte is None:
+            return
+        clave = (aporte[0], aporte[1])
+        acumulado = self._celdas[clave]
+        acumulado[0] -= aporte[2]
+        acumulado[1] -= 1
+        if acumulado[1] <= 0:
+            del self._celdas[clave]
+
+    def _actualizar(self, ids, pendientes):
+        """Solo las publicaciones indicadas: se quita su aporte anterior y se suma el actual"""
+        for id_notificacion in ids:
+            self._quitar(id_notificacion)
+        for i, celda, producto, kg in self._aportes_de(pendientes[pendientes['id_notificacion'].astype(str).isin(ids)]):
+            self._aportes[i] = (celda, producto, kg)
+            acumulado = self._celdas.setdefault((celda, producto), [0.0, 0])
+            acumulado[0] += kg
+            acumulado[1] += 1
+        self.actualizaciones += 1
+
+    def sincronizar(self, df):
+        """Pone la grilla al día con el DataFrame de notificaciones recién leído"""
+        pendientes = self._pendientes(df)
+        with self._lock:
+            eventos = self._suscripcion.nuevos()
+            if self._aportes is None:
+                self._reconstruir(pendientes)
+                return
+            ids = {e.id_notificacion for e in eventos}
+            if None in ids:
+                self._reconstruir(pendientes)
+                return
+            if ids:
+                self._actualizar(ids, pendientes)
+            # escrituras que no pasaron por el bus de este proceso
+            kg_total = pd.to_numeric(pendientes['cantidad_kg'], errors='coerce').fillna(0.0).sum()
+            if len(pendientes) != len(self._aportes) or not np.isclose(kg_total, sum(a[0] for a in self._celdas.values())):
+                self._reconstruir(pendientes)
+
+    def productos(self):
+        with self._lock:
+            return sorted({producto for _, producto in self._celdas})
+
+    def celdas(self, producto=None):
+        """Celdas con oferta (de un producto o de todos): celda, lat, lon, kg, publicaciones"""
+        with self._lock:
+            filas = [(celda, kg, n) for (celda, p), (kg, n) in self._celdas.items()
+                     if producto is None or p == producto]
+        if not filas:
+            return pd.DataFrame(columns=['celda', 'lat', 'lon', 'kg', 'publicaciones'])
+        celdas = pd.DataFrame(filas, columns=['celda', 'kg', 'publicaciones']).groupby('celda', as_index=False).sum()
+        for celda in celdas['celda']:
+            if celda not in self._centros:
+                self._centros[celda] = centro_celda(celda)
+        centros = np.array([self._centros[c] for c in celdas['celda']])
+        celdas.insert(1, 'lat', centros[:, 0])
+        celdas.insert(2, 'lon', centros[:, 1])
+        return celdas.sort_values('kg', ascending=False).reset_index(drop=True)
+
+
+def crear_mapa_calor(celdas, peso='kg'):
+    """Mapa de calor con una entrada por celda, ponderada por kilos o por número de publicaciones"""
+    mapa = folium.Map(location=list(CENTRO_BOYACA), zoom_start=ZOOM_BOYACA, control_scale=True,
+                      tiles=url_teselas('osm'), attr=ATRIBUCIONES['osm'])
+    plugins.Fullscreen(position='topright').add_to(mapa)
+    if not celdas.empty:
+        pesos = celdas[peso].to_numpy(dtype=np.float64)
+        pesos = pesos / pesos.max() if pesos.max() > 0 else pesos
+        plugins.HeatMap(np.column_stack([celdas['lat'], celdas['lon'], pesos]).tolist(),
+                        name="Oferta", radius=25, blur=18, min_opacity=0.3).add_to(mapa)
+    return mapa
+
+
+def mostrar_mapa_oferta(df, clave):
+    """Vista del mapa de calor de oferta pendiente, compartida por compradores y transportistas"""
+    grilla = obtener_grilla_oferta()
+    grilla.sincronizar(df)
+    col_producto, col_peso = st.columns(2)
+    producto = col_producto.selectbox("Producto:", ["Todos"] + grilla.productos(), key=f"{clave}_producto")
+    peso = col_peso.radio("Intensidad por:", ["Kilos", "Publicaciones"], horizontal=True, key=f"{clave}_peso")
+    celdas = grilla.celdas(None if producto == "Todos" else producto)
+    if celdas.empty:
+        st.info("📭 No hay oferta pendiente con ubicación para mostrar.")
+        return
+    
+    col1, col2, col3 = st.columns(3)
+    col1.metric("⚖️ Kilos pendientes", f"{celdas['kg'].sum():,.0f} kg")
+    col2.metric("📦 Publicaciones", f"{int(celdas['publicaciones'].sum()):,}")
+    col3.metric("🗺️ Zonas con oferta", len(celdas))
+    
+    mapa = crear_mapa_calor(celdas, 'kg' if peso == "Kilos" else 'publicaciones')
+    st_folium(mapa, width=1400, height=550, key=f"{clave}_mapa", returned_objects=[])
+    
+    st.markdown("**🔝 Zonas con más oferta**")
+    st.dataframe(
+        celdas.head(10).rename(columns={'celda': 'Zona', 'lat': 'Latitud', 'lon': 'Longitud',
+                                        'kg': 'Kilos', 'publicaciones': 'Publicaciones'}),
+        use_container_width=True, hide_index=True
+    )
+
+
+_grilla = None
+_lock_grilla = threading.Lock()
+
+
+def obtener_grilla_oferta():
+    global _grilla
+    with _lock_grilla:
+        if _grilla is None:
+            _grilla = GrillaOferta()
+        return _grilla
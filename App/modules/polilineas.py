@@ -0,0 +1,300 @@
+import json
+import os
+import threading
+import numpy as np
+from eta import distancia_tramos_km
+from rutas import UBICACIONES_CIUDADES, matriz_distancias
+
+
+# CONFIGURACIÓN
+
+APP_ROOT = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+JSON_POLILINEAS = os.path.join(APP_ROOT, "data", "polilineas_rutas.json")
+
+VECINOS_RED = 3           # cada población se conecta por carretera con sus 3 más cercanas
+DISTANCIA_DIRECTA_KM = 8  # trayectos cortos: línea directa por vía rural
+TOLERANCIA_EXTREMOS = 1e-6  # grados (~0.1 m): la ruta guardada sirve si empieza y termina ahí
+
+# Versiones simplificadas de cada ruta: una por nivel de zoom, con tolerancia de
+# un píxel a ese zoom. Por encima del último nivel se envía la geometría completa.
+ZOOMS_SIMPLIFICACION = (9, 11, 13, 15)
+KM_POR_PIXEL_ZOOM_0 = 156.543  # en el ecuador, teselas de 256 px
+PIXELES_TOLERANCIA = 1.0
+KM_POR_GRADO = 111.32
+
+
+# TRAZADO DE POLILÍNEAS
+
+def _red_vial():
+    """Grafo aproximado de carreteras: cada población unida a sus vecinas más cercanas"""
+    nombres = list(UBICACIONES_CIUDADES.keys())
+    coords = np.array([UBICACIONES_CIUDADES[n] for n in nombres])
+    D = matriz_distancias(coords)
+    adyacencia = np.full_like(D, np.inf)
+    vecinos = np.argsort(D, axis=1)[:, 1:VECINOS_RED + 1]
+    filas = np.repeat(np.arange(len(nombres)), vecinos.shape[1])
+    adyacencia[filas, vecinos.ravel()] = D[filas, vecinos.ravel()]
+    adyacencia = np.minimum(adyacencia, adyacencia.T)
+    return coords, adyacencia
+
+
+_COORDS_RED, _ADYACENCIA_RED = _red_vial()
+
+
+def _dijkstra(adyacencia, inicio, fin):
+    n = len(adyacencia)
+    dist = np.full(n, np.inf)
+    previo = np.full(n, -1)
+    visitado = np.zeros(n, dtype=bool)
+    dist[inicio] = 0.0
+    for _ in range(n):
+        u = int(np.argmin(np.where(visitado, np.inf, dist)))
+        if visitado[u] or not np.isfinite(dist[u]):
+            break
+        if u == fin:
+            break
+        visitado[u] = True
+        nuevas = dist[u] + adyacencia[u]
+        mejora = nuevas < dist
+        dist[mejora] = nuevas[mejora]
+        previo[mejora] = u
+    camino = [fin]
+    while camino[-1] != inicio and previo[camino[-1]] >= 0:
+        camino.append(int(previo[camino[-1]]))
+    return camino[::-1] if camino[-1] == inicio else [inicio, fin]
+
+
+def trazar_polilinea(origen, destino):
+    """
+    Polilínea (M, 2) de origen a destino pasando por las poblaciones de la red vial.
+    Origen y destino se enganchan a sus poblaciones más cercanas, como quien sale a la
+    carretera principal; los trayectos cortos van en línea directa.
+    """
+    origen = np.asarray(origen, dtype=np.float64)
+    destino = np.asarray(destino, dtype=np.float64)
+    if distancia_tramos_km(origen, destino)[0] <= DISTANCIA_DIRECTA_KM:
+        return np.vstack([origen, destino])
+
+    coords = np.vstack([_COORDS_RED, origen, destino])
+    n = len(coords)
+    adyacencia = np.full((n, n), np.inf)
+    adyacencia[:n - 2, :n - 2] = _ADYACENCIA_RED
+    D = matriz_distancias(coords)
+    for extremo in (n - 2, n - 1):
+        cercanos = np.argsort(D[extremo, :n - 2])[:VECINOS_RED]
+        adyacencia[extremo, cercanos] = adyacencia[cercanos, extremo] = D[extremo, cercanos]
+    # la conexión directa siempre existe, penalizada: atravesar el monte cuesta más
+    adyacencia[n - 2, n - 1] = adyacencia[n - 1, n - 2] = D[n - 2, n - 1] * 1.5
+
+    camino = _dijkstra(adyacencia, n - 2, n - 1)
+    return coords[camino]
+
+
+def longitudes_acumuladas(polilinea):
+    """Kilómetros acumulados en cada vértice (el primero es 0)"""
+    polilinea = np.asarray(polilinea, dtype=np.float64)
+    if len(polilinea) < 2:
+        return np.zeros(len(polilinea))
+    return np.concatenate([[0.0], np.cumsum(distancia_tramos_km(polilinea[:-1], polilinea[1:]))])
+
+
+# SIMPLIFICACIÓN POR ZOOM
+
+def tolerancia_para_zoom(zoom, lat=5.5):
+    """Kilómetros que ocupa PIXELES_TOLERANCIA a ese zoom y latitud"""
+    return KM_POR_PIXEL_ZOOM_0 * np.cos(np.radians(lat)) / (1 << int(zoom)) * PIXELES_TOLERANCIA
+
+
+def douglas_peucker(puntos, tolerancia_km):
+    """
+    Índices de los vértices (lat, lon) que conserva Douglas-Peucker con esa tolerancia.
+    Sin recursión: una pila de tramos, y la distancia de todos los puntos de un tramo
+    a su cuerda se calcula de una vez.
+    """
+    puntos = np.asarray(puntos, dtype=np.float64).reshape(-1, 2)
+    n = len(puntos)
+    if n < 3 or tolerancia_km <= 0:
+        return np.arange(n)
+    # plano local en km: a la escala de Boyacá el error es despreciable
+    coseno = np.cos(np.radians(puntos[:, 0].mean()))
+    xy = np.column_stack([puntos[:, 1] * KM_POR_GRADO * coseno, puntos[:, 0] * KM_POR_GRADO])
+    conservar = np.zeros(n, dtype=bool)
+    conservar[[0, -1]] = True
+    pila = [(0, n - 1)]
+    while pila:
+        i, j = pila.pop()
+        if j <= i + 1:
+            continue
+        cuerda = xy[j] - xy[i]
+        relativos = xy[i + 1:j] - xy[i]
+        largo2 = cuerda @ cuerda
+        if largo2 > 0:
+            t = np.clip(relativos @ cuerda / largo2, 0.0, 1.0)
+            relativos = relativos - t[:, None] * cuerda
+        distancias = np.hypot(relativos[:, 0], relativos[:, 1])
+        k = int(np.argmax(distancias))
+        if distancias[k] > tolerancia_km:
+            medio = i + 1 + k
+            conservar[medio] = True
+            pila.append((i, medio))
+            pila.append((medio, j))
+    return np.flatnonzero(conservar)
+
+
+def simplificaciones(polilinea):
+    """Versión de la polilínea para cada zoom de ZOOMS_SIMPLIFICACION"""
+    polilinea = np.asarray(polilinea, dtype=np.float64).reshape(-1, 2)
+    lat = float(polilinea[:, 0].mean()) if len(polilinea) else 5.5
+    return {z: polilinea[douglas_peucker(polilinea, tolerancia_para_zoom(z, lat))] for z in ZOOMS_SIMPLIFICACION}
+
+
+def version_para_zoom(versiones, polilinea, zoom):
+    """La versión más simple que no se distingue de la completa a ese zoom"""
+    for z in ZOOMS_SIMPLIFICACION:
+        if zoom <= z:
+            return versiones[z]
+    return polilinea
+
+
+# FLOTA: MUCHAS POLILÍNEAS EMPAQUETADAS
+
+def _mismos_puntos(a, b):
+    # tolerancia absoluta en grados; la relativa de np.allclose daría ~80 m a la longitud de Boyacá
+    return np.allclose(a, b, rtol=0, atol=TOLERANCIA_EXTREMOS)
+
+
+class FlotaPolilineas:
+    """
+    Polilíneas de muchos viajes concatenadas en arreglos planos con sus longitudes
+    acumuladas precalculadas. Los viajes se colocan uno tras otro sobre un eje de
+    kilómetros global, así que ubicar a todos es un solo np.searchsorted.
+    """
+
+    def __init__(self, polilineas, acumuladas=None):
+        polilineas = [np.asarray(p, dtype=np.float64).reshape(-1, 2) for p in polilineas]
+        if acumuladas is None:
+            acumuladas = [longitudes_acumuladas(p) for p in polilineas]
+        self.longitudes = np.array([a[-1] if len(a) else 0.0 for a in acumuladas])
+        tamanos = np.array([len(p) for p in polilineas])
+        self.inicios = np.concatenate([[0], np.cumsum(tamanos)[:-1]]).astype(int)
+        self.finales = self.inicios + tamanos - 1
+        self.vertices = np.vstack(polilineas) if polilineas else np.empty((0, 2))
+        # desplazamiento de cada viaje en el eje global (con un margen para no tocar al siguiente)
+        self._desplazamiento = np.concatenate([[0.0], np.cumsum(self.longitudes + 1.0)[:-1]])
+        self._eje = np.concatenate([a + d for a, d in zip(acumuladas, self._desplazamiento)]) if polilineas else np.empty(0)
+
+    def __len__(self):
+        return len(self.longitudes)
+
+    def posiciones(self, progreso):
+        """Posición (N, 2) de cada viaje para su fracción de recorrido, en O(log n) por viaje"""
+        progreso = np.clip(np.asarray(progreso, dtype=np.float64), 0.0, 1.0)
+        objetivo = self._desplazamiento + progreso * self.longitudes
+        i = np.searchsorted(self._eje, objetivo, side='right') - 1
+        i = np.clip(i, self.inicios, np.maximum(self.finales - 1, self.inicios))
+        j = np.minimum(i + 1, self.finales)
+        tramo = self._eje[j] - self._eje[i]
+        t = np.divide(objetivo - self._eje[i], tramo, out=np.zeros_like(tramo), where=tramo > 0)
+        t = np.clip(t, 0.0, 1.0)[:, None]
+        return self.vertices[i] + (self.vertices[j] - self.vertices[i]) * t
+
+
+# ALMACÉN DE POLILÍNEAS POR VIAJE
+
+class AlmacenPolilineas:
+    """
+    Polilínea guardada de cada viaje (data/polilineas_rutas.json). Si un viaje no
+    tiene una, se traza por la red vial y se guarda; una ruta real cargada en el
+    archivo (por ejemplo desde un servicio de rutas) tiene prioridad.
+    """
+
+    def __init__(self, ruta=JSON_POLILINEAS):
+        self.ruta = ruta
+        self._polilineas = {}     # id -> (polilínea, longitudes acumuladas)
+        self._simplificadas = {}  # id -> {zoom: polilínea simplificada}
+        self._mtime = None
+        self._ultima_flota = (None, None)
+        self._lock = threading.Lock()
+
+    def _recargar(self):
+        try:
+            mtime = os.stat(self.ruta).st_mtime_ns
+        except OSError:
+            return
+        if mtime != self._mtime:
+            try:
+                with open(self.ruta, encoding="utf-8") as f:
+                    datos = json.load(f)
+                self._polilineas = {}
+                for k, v in datos.items():
+                    polilinea = np.asarray(v, dtype=np.float64).reshape(-1, 2)
+                    self._polilineas[k] = (polilinea, longitudes_acumuladas(polilinea))
+                self._simplificadas = {}
+                self._ultima_flota = (None, None)
+            except (OSError, ValueError):
+                return
+            self._mtime = mtime
+
+    def _guardar(self):
+        os.makedirs(os.path.dirname(self.ruta), exist_ok=True)
+        temporal = f"{self.ruta}.{os.getpid()}.tmp"
+        with open(temporal, "w", encoding="utf-8") as f:
+            json.dump({k: np.round(v[0], 6).tolist() for k, v in self._polilineas.items()}, f)
+        os.replace(temporal, self.ruta)
+        self._mtime = os.stat(self.ruta).st_mtime_ns
+
+    def flota(self, ids, origenes, destinos):
+        """FlotaPolilineas alineada con ids; traza y guarda las que falten"""
+        origenes = np.asarray(origenes, dtype=np.float64).reshape(-1, 2)
+        destinos = np.asarray(destinos, dtype=np.float64).reshape(-1, 2)
+        claves = tuple(str(i) for i in ids)
+        with self._lock:
+            self._recargar()
+            # la misma flota que el tick anterior se reutiliza sin reconstruir nada
+            claves_previas, previa = self._ultima_flota
+            if (claves_previas == claves and _mismos_puntos(previa.vertices[previa.inicios], origenes)
+                    and _mismos_puntos(previa.vertices[previa.finales], destinos)):
+                return previa
+            nuevas = False
+            for k, clave in enumerate(claves):
+                guardada = self._polilineas.get(clave)
+                if (guardada is None or not _mismos_puntos(guardada[0][0], origenes[k])
+                        or not _mismos_puntos(guardada[0][-1], destinos[k])):
+                    polilinea = trazar_polilinea(origenes[k], destinos[k])
+                    self._polilineas[clave] = (polilinea, longitudes_acumuladas(polilinea))
+                    self._simplificadas.pop(clave, None)
+                    nuevas = True
+            if nuevas:
+                self._guardar()
+            flota = FlotaPolilineas([self._polilineas[c][0] for c in claves],
+                                    [self._polilineas[c][1] for c in claves])
+            self._ultima_flota = (claves, flota)
+        return flota
+
+    def para_zoom(self, id_viaje, zoom):
+        """
+        Polilínea guardada del viaje con el detalle justo para ese zoom, o None si no hay.
+        Todas las versiones de una ruta se calculan juntas la primera vez que se pide.
+        """
+        clave = str(id_viaje)
+        with self._lock:
+            self._recargar()
+            guardada = self._polilineas.get(clave)
+            if guardada is None:
+                return None
+            versiones = self._simplificadas.get(clave)
+            if versiones is None:
+                versiones = self._simplificadas[clave] = simplificaciones(guardada[0])
+            return version_para_zoom(versiones, guardada[0], zoom)
+
+
+_almacen_polilineas = None
+_lock_polilineas = threading.Lock()
+
+
+def obtener_almacen_polilineas(ruta=JSON_POLILINEAS):
+    global _almacen_polilineas
+    with _lock_polilineas:
+        if _almacen_polilineas is None:
+            _almacen_polilineas = AlmacenPolilineas(ruta)
+        return _almacen_polilineas
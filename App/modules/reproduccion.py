@@ -0,0 +1,254 @@
+"""
+Grabación y reproducción determinista de viajes.
+
+Una jornada simulada con semilla siempre produce la misma bitácora de
+posiciones (ver bitacora_posiciones), y cualquier día grabado, simulado o
+real, se puede reproducir de 1x a 1000x por el mismo camino que usa el motor
+de seguimiento: instantánea para las vistas, recorrido de cada viaje y
+geocercas. Cada reproducción escribe en su propio directorio y termina con una
+huella de los eventos y posiciones finales: dos reproducciones del mismo día
+deben dar la misma huella. Uso:
+
+    python App/modules/reproduccion.py simular --dia 2025-11-18 --viajes 200 --semilla 7
+    python App/modules/reproduccion.py reproducir --dia 2025-11-18 --velocidad 100
+    python App/modules/reproduccion.py dias
+"""
+import argparse
+import hashlib
+import os
+import shutil
+import tempfile
+import time
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from bitacora_posiciones import DIR_BITACORA, BitacoraPosiciones, filas_bitacora
+from geocercas import ColaEventos, MotorGeocercas
+from historial_posiciones import AlmacenTrayectos
+from polilineas import obtener_almacen_polilineas
+from rutas import UBICACIONES_CIUDADES
+from seguimiento import (COLUMNAS_MOVIMIENTO, INTERVALO_MOTOR_S, SnapshotSeguimiento,
+                         aplicar_snapshot, paso_flota)
+
+
+# CONFIGURACIÓN
+
+APP_ROOT = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+DATA_DIR = os.path.join(APP_ROOT, "data")
+
+VELOCIDAD_MIN = 1
+VELOCIDAD_MAX = 1000
+HORA_INICIO_JORNADA = 6
+HORAS_JORNADA = 10
+DISPERSION_FINCAS = 0.03   # grados alrededor de la ciudad donde caen las fincas simuladas
+
+
+# SIMULACIÓN CON SEMILLA
+
+def viajes_simulados(dia, n_viajes, n_camiones, semilla, intervalo_s=INTERVALO_MOTOR_S):
+    """Viajes aceptados de la jornada: base del camión, finca de destino y tick de salida"""
+    rng = np.random.default_rng(semilla)
+    ciudades = list(UBICACIONES_CIUDADES.keys())
+    camiones = [f"Camión {k}" for k in range(n_camiones)]
+    base = {c: UBICACIONES_CIUDADES[ciudades[int(rng.integers(len(ciudades)))]] for c in camiones}
+
+    destino = np.array([UBICACIONES_CIUDADES[ciudades[i]] for i in rng.integers(len(ciudades), size=n_viajes)])
+    destino = destino + rng.normal(0, DISPERSION_FINCAS, destino.shape)
+    asignado = [camiones[i] for i in rng.integers(n_camiones, size=n_viajes)]
+    ticks = int(HORAS_JORNADA * 3600 / intervalo_s)
+
+    df = pd.DataFrame({
+        'id_notificacion': [f"SIM-{dia}-{k:05d}" for k in range(n_viajes)],
+        'estado': 'Aceptado',
+        'transportista_asignado': asignado,
+        'latitud': destino[:, 0],
+        'longitud': destino[:, 1],
+        'progreso_viaje': 0.0,
+        'salida': rng.integers(0, ticks, size=n_viajes)
+    })
+    for col in COLUMNAS_MOVIMIENTO:
+        if col not in df.columns:
+            df[col] = np.nan
+    origenes = np.array([base[c] for c in asignado])
+    return df, origenes
+
+
+def simular_dia(bitacora, dia, n_viajes=200, n_camiones=50, semilla=0, intervalo_s=INTERVALO_MOTOR_S):
+    """
+    Corre la jornada con paso_flota (el mismo paso del motor) en tiempo simulado y
+    la graba en la bitácora. Devuelve el número de posiciones grabadas.
+    """
+    df, origenes = viajes_simulados(dia, n_viajes, n_camiones, semilla, intervalo_s)
+    inicio = datetime.strptime(dia, "%Y-%m-%d").timestamp() + HORA_INICIO_JORNADA * 3600
+    salida = df['salida'].to_numpy()
+    registros = []
+    tick = int(salida.min()) if len(df) else 0
+    while True:
+        progreso = df['progreso_viaje'].to_numpy(dtype=np.float64)
+        pendientes = progreso < 1.0
+        if not pendientes.any():
+            break
+        activos = pendientes & (salida <= tick)
+        if not activos.any():
+            # nadie en ruta: se salta directamente a la siguiente salida
+            tick = int(salida[pendientes].min())
+            continue
+        instante = inicio + tick * intervalo_s
+        actualizados = paso_flota(df, df.index[activos], origenes[activos])
+        registros.append(filas_bitacora(df, actualizados, instante))
+        tick += 1
+    if not registros:
+        return 0
+    return bitacora.agregar(pd.concat(registros, ignore_index=True))
+
+
+# REPRODUCCIÓN ACELERADA
+
+class Reproductor:
+    """
+    Reproduce una bitácora respetando los tiempos grabados divididos por la velocidad.
+    Cada instante grabado pasa por el mismo camino que un tick del motor: se publica una
+    instantánea que se aplica a la tabla de viajes, se agrega al recorrido de cada viaje
+    y se evalúan las geocercas con el instante original, no con el reloj de la reproducción.
+    """
+
+    def __init__(self, registros, directorio, velocidad=1):
+        if not VELOCIDAD_MIN <= velocidad <= VELOCIDAD_MAX:
+            raise ValueError(f"La velocidad debe estar entre {VELOCIDAD_MIN}x y {VELOCIDAD_MAX}x")
+        if os.path.realpath(directorio) == os.path.realpath(DATA_DIR):
+            raise ValueError("La reproducción no puede escribir sobre los datos reales")
+        self.registros = registros
+        self.velocidad = velocidad
+        # cada reproducción empieza de cero para que los eventos salgan iguales
+        shutil.rmtree(os.path.join(directorio, "trayectos"), ignore_errors=True)
+        ruta_eventos = os.path.join(directorio, "eventos_geocerca.csv")
+        if os.path.exists(ruta_eventos):
+            os.remove(ruta_eventos)
+        self.almacen = AlmacenTrayectos(os.path.join(directorio, "trayectos"))
+        self.geocercas = MotorGeocercas(ColaEventos(ruta_eventos))
+        self.viajes = pd.DataFrame({'id_notificacion': registros['id_notificacion'].unique()})
+        for col in COLUMNAS_MOVIMIENTO:
+            self.viajes[col] = np.nan
+        self.snapshot = None
+
+    def ejecutar(self, al_publicar=None):
+        """Reproduce todo; al_publicar(snapshot, eventos) se llama tras cada instante"""
+        retrasos, tiempos, eventos = [], [], []
+        grupos = self.registros.groupby('instante', sort=True)
+        t0 = float(self.registros['instante'].min()) if len(self.registros) else 0.0
+        inicio = time.perf_counter()
+
+        for version, (instante, grupo) in enumerate(grupos, 1):
+            objetivo = inicio + (instante - t0) / self.velocidad
+            espera = objetivo - time.perf_counter()
+            if espera > 0:
+                time.sleep(espera)
+            comienzo = time.perf_counter()
+            retrasos.append(max(0.0, comienzo - objetivo))
+
+            ids = grupo['id_notificacion'].tolist()
+            transportistas = grupo['transportista'].tolist()
+            movimiento = grupo[COLUMNAS_MOVIMIENTO].to_numpy(dtype=np.float64)
+            movimiento.flags.writeable = False
+            self.snapshot = SnapshotSeguimiento(version, float(instante), tuple(ids), tuple(transportistas), movimiento)
+            aplicar_snapshot(self.viajes, self.snapshot)
+
+            self.almacen.registrar(ids, instante, movimiento[:, 0], movimiento[:, 1])
+            self.almacen.guardar()
+            nuevos = self.geocercas.evaluar(ids, transportistas, movimiento[:, :2],
+                                            grupo[['latitud', 'longitud']].to_numpy(dtype=np.float64), instante)
+            eventos.extend(nuevos)
+            tiempos.append(time.perf_counter() - comienzo)
+            if al_publicar is not None:
+                al_publicar(self.snapshot, nuevos)
+
+        duracion = time.perf_counter() - inicio
+        grabado = float(self.registros['instante'].max() - t0) if len(self.registros) else 0.0
+        retrasos_ms = np.array(retrasos or [0.0]) * 1000
+        tiempos_ms = np.array(tiempos or [0.0]) * 1000
+        return {
+            'instantes': len(tiempos),
+            'posiciones': len(self.registros),
+            'viajes': len(self.viajes),
+            'eventos': pd.Series([e['tipo'] for e in eventos], dtype=object).value_counts().to_dict(),
+            'duracion_grabada_s': grabado,
+            'duracion_real_s': duracion,
+            'velocidad_efectiva': grabado / duracion if duracion > 0 else 0.0,
+            'retraso_p50_ms': float(np.percentile(retrasos_ms, 50)),
+            'retraso_p99_ms': float(np.percentile(retrasos_ms, 99)),
+            'tick_p50_ms': float(np.percentile(tiempos_ms, 50)),
+            'tick_p99_ms': float(np.percentile(tiempos_ms, 99)),
+            'huella': self.huella(eventos)
+        }
+
+    def huella(self, eventos):
+        """Resumen de los eventos y las posiciones finales: igual en toda reproducción del mismo día"""
+        h = hashlib.sha256()
+        for e in eventos:
+            h.update(f"{e['id_notificacion']}|{e['tipo']}|{e['instante']:.3f}|{e['distancia_km']:.3f}\n".encode("utf-8"))
+        finales = self.viajes.sort_values('id_notificacion')
+        h.update(finales.round(6).to_csv(index=False).encode("utf-8"))
+        return h.hexdigest()[:16]
+
+
+# LÍNEA DE COMANDOS
+
+def main():
+    parser = argparse.ArgumentParser(description="Grabación y reproducción determinista de viajes")
+    parser.add_argument("--bitacora", default=DIR_BITACORA, help="Directorio de la bitácora de posiciones")
+    sub = parser.add_subparsers(dest="comando", required=True)
+
+    p_sim = sub.add_parser("simular", help="Graba una jornada simulada con semilla")
+    p_sim.add_argument("--dia", default=datetime.now().strftime("%Y-%m-%d"))
+    p_sim.add_argument("--viajes", type=int, default=200)
+    p_sim.add_argument("--camiones", type=int, default=50)
+    p_sim.add_argument("--semilla", type=int, default=0)
+    p_sim.add_argument("--reemplazar", action="store_true", help="Borra la grabación previa de ese día")
+
+    p_rep = sub.add_parser("reproducir", help="Reproduce un día grabado a velocidad acelerada")
+    p_rep.add_argument("--dia", required=True)
+    p_rep.add_argument("--velocidad", type=float, default=100, help=f"De {VELOCIDAD_MIN} a {VELOCIDAD_MAX}")
+    p_rep.add_argument("--salida", help="Directorio para recorridos y eventos (por defecto, uno temporal)")
+
+    sub.add_parser("dias", help="Lista los días grabados")
+    args = parser.parse_args()
+    bitacora = BitacoraPosiciones(args.bitacora)
+
+    if args.comando == "dias":
+        for dia in bitacora.dias():
+            print(dia)
+
+    elif args.comando == "simular":
+        if os.path.exists(bitacora.archivo(args.dia)):
+            if not args.reemplazar:
+                parser.error(f"Ya hay una grabación de {args.dia}; usa --reemplazar para sobrescribirla")
+            bitacora.borrar(args.dia)
+        # las rutas de los viajes simulados no se mezclan con las de los viajes reales
+        obtener_almacen_polilineas(os.path.join(args.bitacora, "polilineas_simulacion.json"))
+        inicio = time.perf_counter()
+        n = simular_dia(bitacora, args.dia, args.viajes, args.camiones, args.semilla)
+        print(f"{n} posiciones grabadas en {bitacora.archivo(args.dia)} ({time.perf_counter() - inicio:.1f} s)")
+
+    else:
+        registros = bitacora.leer(args.dia)
+        if registros.empty:
+            parser.error(f"No hay grabación de {args.dia}")
+        salida = args.salida or tempfile.mkdtemp(prefix="reproduccion_")
+        try:
+            reproductor = Reproductor(registros, salida, args.velocidad)
+        except ValueError as e:
+            parser.error(str(e))
+        r = reproductor.ejecutar()
+        print(f"{r['posiciones']} posiciones de {r['viajes']} viajes en {r['instantes']} instantes")
+        print(f"{r['duracion_grabada_s'] / 60:.1f} min grabados en {r['duracion_real_s']:.1f} s "
+              f"({r['velocidad_efectiva']:.0f}x efectiva, {args.velocidad:.0f}x pedida)")
+        print(f"Retraso sobre lo programado: p50 {r['retraso_p50_ms']:.1f} ms | p99 {r['retraso_p99_ms']:.1f} ms")
+        print(f"Procesamiento por instante: p50 {r['tick_p50_ms']:.1f} ms | p99 {r['tick_p99_ms']:.1f} ms")
+        print(f"Eventos de geocerca: {r['eventos']}")
+        print(f"Huella: {r['huella']} (recorridos y eventos en {salida})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,373 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import lru_cache
+from itertools import permutations
+from multiprocessing import shared_memory
+import numpy as np
+
+
+# CONFIGURACIÓN
+
+RADIO_TIERRA_KM = 6371
+MAX_PARADAS_EXACTO = 8      # hasta aquí se prueban todas las permutaciones
+MIN_ZONAS_PARALELO = 4      # con menos zonas no compensa repartir en procesos
+MAX_RECORRIDOS_CACHE = 1024 # zonas cuyo recorrido interno se recuerda
+VELOCIDAD_PROMEDIO_KMH = 40
+
+_pool = None
+
+UBICACIONES_CIUDADES = {
+    'Tunja': (5.5353, -73.3678),
+    'Duitama': (5.8269, -73.0347),
+    'Sogamoso': (5.7147, -72.9342),
+    'Paipa': (5.7808, -73.1175),
+    'Chiquinquirá': (5.6181, -73.8169),
+    'Villa de Leyva': (5.6378, -73.5264),
+    'Nobsa': (5.7703, -72.9486),
+    'Tibasosa': (5.7506, -72.9828),
+    'Moniquirá': (5.8753, -73.5750),
+    'Samacá': (5.4892, -73.4956)
+}
+
+
+# DISTANCIAS
+
+def matriz_distancias(coords, coords_destino=None):
+    """Calcula la matriz de distancias haversine (km) entre todos los puntos (o entre dos conjuntos)"""
+    origen = np.radians(np.asarray(coords, dtype=np.float64).reshape(-1, 2))
+    destino = origen if coords_destino is None else np.radians(np.asarray(coords_destino, dtype=np.float64).reshape(-1, 2))
+    lat1, lon1 = origen[:, 0][:, None], origen[:, 1][:, None]
+    lat2, lon2 = destino[:, 0][None, :], destino[:, 1][None, :]
+    a = np.sin((lat2 - lat1)/2)**2 + np.cos(lat1)*np.cos(lat2)*np.sin((lon2 - lon1)/2)**2
+    return RADIO_TIERRA_KM * 2*np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+# RESOLUCIÓN DE UNA ZONA SOBRE LA MATRIZ
+
+def resolver_ruta_matriz(matriz, origen, paradas):
+    """Ordena las paradas (índices de la matriz) partiendo de origen; devuelve (orden, distancia)"""
+    paradas = np.asarray(paradas, dtype=np.intp)
+    n = len(paradas)
+    if n == 0:
+        return [], 0.0
+    if n == 1:
+        return [0], float(matriz[origen, paradas[0]])
+    if n <= MAX_PARADAS_EXACTO:
+        # todas las permutaciones evaluadas de una vez con numpy
+        perms = np.array(list(permutations(range(n))), dtype=np.intp)
+        nodos = paradas[perms]
+        distancias = matriz[origen, nodos[:, 0]] + matriz[nodos[:, :-1], nodos[:, 1:]].sum(axis=1)
+        mejor = int(np.argmin(distancias))
+        return perms[mejor].tolist(), float(distancias[mejor])
+    # heurística vecino más cercano
+    orden = []
+    pendientes = np.ones(n, dtype=bool)
+    actual = origen
+    distancia_total = 0.0
+    for _ in range(n):
+        distancias = np.where(pendientes, matriz[actual, paradas], np.inf)
+        siguiente = int(np.argmin(distancias))
+        distancia_total += float(distancias[siguiente])
+        pendientes[siguiente] = False
+        orden.append(siguiente)
+        actual = paradas[siguiente]
+    return orden, distancia_total
+
+
+def _resolver_zona_compartida(nombre_shm, n_puntos, origen, paradas):
+    """Resuelve una zona leyendo la matriz compartida sin copiarla (se ejecuta en el proceso hijo)"""
+    shm = shared_memory.SharedMemory(name=nombre_shm)
+    try:
+        matriz = np.ndarray((n_puntos, n_puntos), dtype=np.float64, buffer=shm.buf)
+        resultado = resolver_ruta_matriz(matriz, origen, paradas)
+        del matriz
+        return resultado
+    finally:
+        shm.close()
+
+
+# OPTIMIZACIÓN EN LOTE
+
+def obtener_pool():
+    """Devuelve el pool de procesos del servidor, dimensionado a los núcleos de la máquina"""
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=os.cpu_count() or 1)
+    return _pool
+
+
+def _reiniciar_pool():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+    _pool = None
+
+
+def optimizar_zonas_paralelo(origen, zonas, paralelo=None):
+    """
+    Optimiza varias zonas independientes a la vez.
+    zonas: lista de listas de destinos ({'lat', 'lon', ...}).
+    Devuelve, por zona, (ruta_ordenada, distancia_total) igual que optimizar_ruta_ia.
+    """
+    if not zonas:
+        return []
+
+    # una sola matriz para el origen y todas las paradas de todas las zonas
+    coords = [origen]
+    paradas_por_zona = []
+    for destinos in zonas:
+        inicio = len(coords)
+        coords.extend((d['lat'], d['lon']) for d in destinos)
+        paradas_por_zona.append(list(range(inicio, len(coords))))
+    matriz = matriz_distancias(coords)
+
+    if paralelo is None:
+        paralelo = len(zonas) >= MIN_ZONAS_PARALELO and (os.cpu_count() or 1) > 1
+
+    resultados = None
+    if paralelo:
+        resultados = _resolver_en_pool(matriz, paradas_por_zona)
+    if resultados is None:
+        resultados = [resolver_ruta_matriz(matriz, 0, paradas) for paradas in paradas_por_zona]
+
+    return [
+        ([destinos[i] for i in orden], distancia)
+        for destinos, (orden, distancia) in zip(zonas, resultados)
+    ]
+
+
+def _resolver_en_pool(matriz, paradas_por_zona):
+    n_puntos = matriz.shape[0]
+    shm = shared_memory.SharedMemory(create=True, size=max(matriz.nbytes, 1))
+    try:
+        compartida = np.ndarray(matriz.shape, dtype=np.float64, buffer=shm.buf)
+        compartida[:] = matriz
+        del compartida
+        pool = obtener_pool()
+        futuros = [
+            pool.submit(_resolver_zona_compartida, shm.name, n_puntos, 0, paradas)
+            for paradas in paradas_por_zona
+        ]
+        return [f.result() for f in futuros]
+    except (BrokenProcessPool, OSError):
+        # si el pool murió se recrea en la próxima llamada y esta vez se resuelve en serie
+        _reiniciar_pool()
+        return None
+    finally:
+        shm.close()
+        shm.unlink()
+
+
+# RECOGIDA Y ENTREGA (PICKUP & DELIVERY)
+
+def _nodos_recogida_entrega(solicitudes):
+    """Convierte las solicitudes en paradas; previo[i] es la recogida que debe ir antes de la parada i"""
+    paradas = []
+    previo = []
+    for k, sol in enumerate(solicitudes):
+        idx_recogida = None
+        if sol.get('recogida') is not None:
+            idx_recogida = len(paradas)
+            paradas.append({'tipo': 'recogida', 'solicitud': k, 'lat': sol['recogida'][0], 'lon': sol['recogida'][1]})
+            previo.append(None)
+        if sol.get('entrega') is not None:
+            paradas.append({'tipo': 'entrega', 'solicitud': k, 'lat': sol['entrega'][0], 'lon': sol['entrega'][1]})
+            previo.append(idx_recogida)
+    return paradas, previo
+
+
+def _ruta_exacta_con_precedencia(D, previo):
+    """Búsqueda en profundidad con poda: mejor orden que respeta recogida antes de entrega"""
+    n = len(previo)
+    mejor = [float('inf'), None]
+    visitado = [False] * n
+    camino = []
+
+    def explorar(actual, acumulado):
+        if acumulado >= mejor[0]:
+            return
+        if len(camino) == n:
+            mejor[0], mejor[1] = acumulado, list(camino)
+            return
+        for i in range(n):
+            if visitado[i] or (previo[i] is not None and not visitado[previo[i]]):
+                continue
+            visitado[i] = True
+            camino.append(i)
+            explorar(i + 1, acumulado + D[actual][i + 1])
+            camino.pop()
+            visitado[i] = False
+
+    explorar(0, 0.0)
+    return mejor[1], mejor[0]
+
+
+def _ruta_insercion_con_precedencia(D, previo):
+    """Inserción más barata por solicitud, colocando siempre la recogida antes de la entrega"""
+    n = len(previo)
+    entrega_de = {p: i for i, p in enumerate(previo) if p is not None}
+    ruta = [0]  # nodo 0 = origen, parada i = nodo i + 1
+
+    def delta(a, nodo, b):
+        return D[a][nodo] + (D[nodo][b] - D[a][b] if b is not None else 0.0)
+
+    # se insertan primero las solicitudes más lejanas del origen
+    pendientes = [i for i in range(n) if previo[i] is None]
+    pendientes.sort(key=lambda i: D[0][i + 1], reverse=True)
+
+    for i in pendientes:
+        p = i + 1
+        d = entrega_de.get(i)
+        m = len(ruta)
+        mejor_costo, mejor_pos = float('inf'), None
+        for a in range(m):
+            x = ruta[a]
+            y = ruta[a + 1] if a + 1 < m else None
+            costo_p = delta(x, p, y)
+            if d is None:
+                if costo_p < mejor_costo:
+                    mejor_costo, mejor_pos = costo_p, (a, None)
+                continue
+            # entrega justo después de la recogida
+            costo = D[x][p] + D[p][d + 1] + (D[d + 1][y] - D[x][y] if y is not None else 0.0)
+            if costo < mejor_costo:
+                mejor_costo, mejor_pos = costo, (a, a)
+            for b in range(a + 1, m):
+                costo = costo_p + delta(ruta[b], d + 1, ruta[b + 1] if b + 1 < m else None)
+                if costo < mejor_costo:
+                    mejor_costo, mejor_pos = costo, (a, b)
+        a, b = mejor_pos
+        if b is None:
+            ruta.insert(a + 1, p)
+        elif b == a:
+            ruta[a + 1:a + 1] = [p, d + 1]
+        else:
+            ruta.insert(b + 1, d + 1)
+            ruta.insert(a + 1, p)
+
+    orden = [nodo - 1 for nodo in ruta[1:]]
+    distancia = sum(D[ruta[k]][ruta[k + 1]] for k in range(len(ruta) - 1))
+    return orden, distancia
+
+
+def optimizar_ruta_recogida_entrega(origen, solicitudes):
+    """
+    Ordena recogidas en finca y entregas a compradores en una sola ruta.
+    solicitudes: dicts con 'recogida' y/o 'entrega' como (lat, lon); sin 'recogida'
+    el producto ya va en el camión. Devuelve (paradas_ordenadas, distancia_total).
+    """
+    paradas, previo = _nodos_recogida_entrega(solicitudes)
+    if not paradas:
+        return [], 0.0
+    D = matriz_distancias([origen] + [(p['lat'], p['lon']) for p in paradas]).tolist()
+    if len(paradas) <= MAX_PARADAS_EXACTO:
+        orden, distancia = _ruta_exacta_con_precedencia(D, previo)
+    else:
+        orden, distancia = _ruta_insercion_con_precedencia(D, previo)
+    ruta = []
+    for num, i in enumerate(orden, 1):
+        parada = dict(paradas[i])
+        parada['orden'] = num
+        ruta.append(parada)
+    return ruta, float(distancia)
+
+
+def distancia_viajes_separados(origen, solicitudes):
+    """Km de hacer primero la ronda de recogidas (volviendo a la base) y luego la de entregas"""
+    recogidas = [s['recogida'] for s in solicitudes if s.get('recogida') is not None]
+    entregas = [s['entrega'] for s in solicitudes if s.get('entrega') is not None]
+    total = 0.0
+    if recogidas:
+        D = matriz_distancias([origen] + recogidas)
+        orden, distancia = resolver_ruta_matriz(D, 0, range(1, len(recogidas) + 1))
+        total += distancia + float(D[orden[-1] + 1, 0])
+    if entregas:
+        D = matriz_distancias([origen] + entregas)
+        total += resolver_ruta_matriz(D, 0, range(1, len(entregas) + 1))[1]
+    return total
+
+
+# REPARTO DE ZONAS ENTRE TRANSPORTISTAS
+
+@lru_cache(maxsize=MAX_RECORRIDOS_CACHE)
+def _recorrido_desde_centroide(puntos):
+    """Km de la ruta de una zona partiendo desde su centroide; puntos: tupla ordenada de (lat, lon)"""
+    if not puntos:
+        return 0.0
+    puntos = np.array(puntos, dtype=np.float64)
+    D = matriz_distancias(np.vstack([puntos.mean(axis=0), puntos]))
+    return float(resolver_ruta_matriz(D, 0, range(1, len(puntos) + 1))[1])
+
+
+def recorridos_internos(zonas):
+    """
+    Km del recorrido interno de cada zona, desde su centroide y con las paradas en un orden
+    fijo: no depende de quién lo pida ni del orden de los destinos. Se guarda por zona.
+    """
+    return np.array([
+        _recorrido_desde_centroide(tuple(sorted((float(d['lat']), float(d['lon'])) for d in destinos)))
+        for destinos in zonas
+    ], dtype=np.float64)
+
+
+def matriz_costos_zonas(zonas, bases, velocidad_kmh=VELOCIDAD_PROMEDIO_KMH):
+    """
+    Duración estimada (horas) de que cada transportista atienda cada zona: ir desde su base
+    hasta la parada más cercana de la zona y recorrerla (recorridos_internos). Es la misma
+    para todas las sesiones. Devuelve matriz (transportistas x zonas).
+    """
+    if len(zonas) == 0 or len(bases) == 0:
+        return np.zeros((len(bases), len(zonas)))
+    coords = np.array([(d['lat'], d['lon']) for destinos in zonas for d in destinos], dtype=np.float64)
+    tamanos = np.array([len(destinos) for destinos in zonas])
+    inicios = np.concatenate([[0], np.cumsum(tamanos)[:-1]])
+
+    # acercamiento: distancia de cada base a la parada más cercana de cada zona
+    acercamiento = np.minimum.reduceat(matriz_distancias(bases, coords), inicios, axis=1)
+
+    return (acercamiento + recorridos_internos(zonas)[None, :]) / velocidad_kmh
+
+
+def repartir_zonas(costos, carga_actual=None, max_iteraciones=200):
+    """
+    Asigna cada zona a un transportista minimizando la duración máxima de ruta.
+    costos: matriz (transportistas x zonas) en horas; carga_actual: horas ya comprometidas.
+    Devuelve (asignacion por zona, carga final por transportista).
+    """
+    n_trans, n_zonas = costos.shape
+    carga = np.zeros(n_trans) if carga_actual is None else np.asarray(carga_actual, dtype=np.float64).copy()
+    asignacion = np.full(n_zonas, -1, dtype=np.intp)
+    if n_trans == 0 or n_zonas == 0:
+        return asignacion, carga
+
+    # reparto inicial: zonas más costosas primero, cada una al transportista que termina antes con ella
+    for z in np.argsort(-costos.min(axis=0)):
+        t = int(np.argmin(carga + costos[:, z]))
+        asignacion[z] = t
+        carga[t] += costos[t, z]
+
+    # mejora local: mover zonas del transportista más cargado mientras baje el máximo
+    for _ in range(max_iteraciones):
+        t_max = int(np.argmax(carga))
+        maximo = carga[t_max]
+        propias = np.flatnonzero(asignacion == t_max)
+        if len(propias) == 0:
+            break
+        # carga resultante de mover cada zona propia a cada otro transportista
+        nueva_destino = carga[:, None] + costos[:, propias]
+        nueva_destino[t_max, :] = np.inf
+        nueva_origen = maximo - costos[t_max, propias]
+        otros = carga.copy()
+        otros[t_max] = -np.inf
+        resto = np.max(otros) if n_trans > 1 else -np.inf
+        nuevo_maximo = np.maximum(np.maximum(nueva_destino, nueva_origen[None, :]), resto)
+        t, k = np.unravel_index(int(np.argmin(nuevo_maximo)), nuevo_maximo.shape)
+        if nuevo_maximo[t, k] >= maximo - 1e-9:
+            break
+        z = propias[k]
+        asignacion[z] = t
+        carga[t_max] -= costos[t_max, z]
+        carga[t] += costos[t, z]
+
+    return asignacion, carga
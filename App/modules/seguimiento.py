@@ -0,0 +1,323 @@
+import os
+import threading
+import time
+import zlib
+from collections import namedtuple
+import numpy as np
+import pandas as pd
+from eta import distancia_tramos_km, estimar_eta_minutos
+from historial_posiciones import obtener_almacen
+from geocercas import obtener_motor_geocercas
+from polilineas import obtener_almacen_polilineas
+from bitacora_posiciones import obtener_bitacora
+
+try:
+    import fcntl
+except ImportError:  # Windows: el candado solo cubre los hilos del proceso
+    fcntl = None
+
+
+# CONFIGURACIÓN
+
+APP_ROOT = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+CSV_NOTIFICACIONES = os.path.join(APP_ROOT, "data", "notificaciones_transporte.csv")
+INCREMENTO_MIN = 0.05
+INCREMENTO_MAX = 0.15
+SEMILLA_SIMULACION = 2025    # el avance de un viaje depende solo de la semilla, el viaje y su progreso
+INTERVALO_MOTOR_S = 2        # cada cuánto avanza la flota el motor del servidor
+SEGUNDOS_SIN_VISTA = 60      # un transportista sin vistas abiertas deja de simularse
+COLUMNAS_MOVIMIENTO = [
+    'transportista_lat', 'transportista_lon', 'progreso_viaje',
+    'distancia_restante_km', 'tiempo_estimado_llegada'
+]
+
+
+# CANDADOS DE ARCHIVO
+
+class CandadoArchivo:
+    """
+    Candado entre hilos y entre procesos para reescribir un CSV: un threading.Lock y un
+    flock exclusivo sobre <ruta>.lock. La app y la ingesta GPS (otro proceso) leen,
+    modifican y reescriben el mismo archivo sin pisarse.
+    """
+
+    def __init__(self, ruta):
+        self.ruta = f"{ruta}.lock"
+        self._lock = threading.Lock()
+        self._archivo = None
+
+    def __enter__(self):
+        self._lock.acquire()
+        if fcntl is not None:
+            try:
+                self._archivo = open(self.ruta, "a")
+                fcntl.flock(self._archivo.fileno(), fcntl.LOCK_EX)
+            except OSError:
+                if self._archivo is not None:
+                    self._archivo.close()
+                    self._archivo = None
+                self._lock.release()
+                raise
+        return self
+
+    def __exit__(self, *exc):
+        if self._archivo is not None:
+            fcntl.flock(self._archivo.fileno(), fcntl.LOCK_UN)
+            self._archivo.close()
+            self._archivo = None
+        self._lock.release()
+
+
+_candados = {}
+_lock_candados = threading.Lock()
+
+
+def candado_archivo(ruta):
+    """El candado de un archivo; dentro del proceso, el mismo objeto para la misma ruta"""
+    ruta = os.path.realpath(ruta)
+    with _lock_candados:
+        if ruta not in _candados:
+            _candados[ruta] = CandadoArchivo(ruta)
+        return _candados[ruta]
+
+
+def escribir_csv_atomico(df, ruta):
+    """Escribe a un temporal y lo renombra, para que otros procesos nunca lean un CSV a medias"""
+    temporal = f"{ruta}.{os.getpid()}.tmp"
+    df.to_csv(temporal, index=False)
+    os.replace(temporal, ruta)
+
+
+# todas las escrituras de notificaciones_transporte.csv pasan por este candado, también las de otros procesos
+LOCK_NOTIFICACIONES = candado_archivo(CSV_NOTIFICACIONES)
+
+
+# SIMULACIÓN DETERMINISTA
+
+def _mezclar(x):
+    # splitmix64: cada entero de 64 bits da otro bien repartido (las multiplicaciones desbordan a propósito)
+    x = x + np.uint64(0x9E3779B97F4A7C15)
+    x = (x ^ (x >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return x ^ (x >> np.uint64(31))
+
+
+def incrementos_deterministas(ids, progreso, semilla=SEMILLA_SIMULACION):
+    """
+    Avance de cada viaje en este paso, función de (semilla, id del viaje, progreso actual).
+    No depende del orden de los viajes ni del proceso: la misma flota siempre se mueve igual.
+    """
+    claves = np.array([zlib.crc32(str(i).encode("utf-8")) for i in ids], dtype=np.uint64)
+    pasos = np.round(np.nan_to_num(np.asarray(progreso, dtype=np.float64)) * 1e6).astype(np.uint64)
+    h = _mezclar(_mezclar(claves ^ (np.uint64(semilla) << np.uint64(32))) ^ pasos)
+    u = (h >> np.uint64(11)).astype(np.float64) / float(1 << 53)
+    return INCREMENTO_MIN + (INCREMENTO_MAX - INCREMENTO_MIN) * u
+
+
+# PASO DE FLOTA VECTORIZADO
+
+def avanzar_flota(origenes, destinos, progreso, rng=None, polilineas=None, incrementos=None):
+    """
+    Avanza todos los viajes un paso en una sola pasada de numpy.
+    Con polilineas (FlotaPolilineas alineada con los viajes) la posición sigue la ruta
+    guardada y la distancia restante se mide sobre ella; sin ellas se interpola en línea recta.
+    incrementos fija el avance de cada viaje; si no se da, se sortea con rng.
+    Devuelve una matriz (N, 5) con los valores de COLUMNAS_MOVIMIENTO en ese orden.
+    """
+    origenes = np.asarray(origenes, dtype=np.float64).reshape(-1, 2)
+    destinos = np.asarray(destinos, dtype=np.float64).reshape(-1, 2)
+    progreso = np.nan_to_num(np.asarray(progreso, dtype=np.float64).reshape(-1))
+    n = len(progreso)
+    if n == 0:
+        return np.empty((0, len(COLUMNAS_MOVIMIENTO)))
+
+    if incrementos is None:
+        rng = np.random.default_rng() if rng is None else rng
+        incrementos = rng.uniform(INCREMENTO_MIN, INCREMENTO_MAX, n)
+    nuevo_progreso = np.minimum(progreso + incrementos, 1.0)
+
+    if polilineas is not None:
+        posicion = polilineas.posiciones(nuevo_progreso)
+        distancia_restante = polilineas.longitudes * (1.0 - nuevo_progreso)
+        tiempo_minutos = estimar_eta_minutos(origenes, destinos) * (1.0 - nuevo_progreso)
+    else:
+        posicion = origenes + (destinos - origenes) * nuevo_progreso[:, None]
+        distancia_restante = None
+    llegados = nuevo_progreso >= 1.0
+    posicion[llegados] = destinos[llegados]
+
+    if distancia_restante is None:
+        distancia_restante = distancia_tramos_km(posicion, destinos)
+        tiempo_minutos = estimar_eta_minutos(origenes, destinos, distancia_restante)
+
+    return np.column_stack([posicion, nuevo_progreso, distancia_restante, tiempo_minutos])
+
+
+def paso_flota(df, filas, origenes, rng=None, usar_polilineas=True):
+    """
+    Avanza en df (in-place) los viajes de las filas (etiquetas del índice) que tienen destino y progreso < 1.
+    origenes es un arreglo (len(filas), 2) alineado con las filas o un único (lat, lon) común.
+    Los camiones siguen la polilínea guardada de cada viaje (ver polilineas). Sin rng el
+    avance es determinista (ver incrementos_deterministas), así que una simulación se repite igual.
+    Escribe todas las columnas con una sola asignación y devuelve los índices actualizados.
+    """
+    filas = pd.Index(filas)
+    if len(filas) == 0:
+        return filas
+    progreso = df.loc[filas, 'progreso_viaje'].astype(float).fillna(0.0).to_numpy()
+    destinos = df.loc[filas, ['latitud', 'longitud']].to_numpy(dtype=np.float64)
+    mover = (progreso < 1.0) & ~np.isnan(destinos).any(axis=1)
+    if not mover.any():
+        return filas[:0]
+
+    origenes = np.broadcast_to(np.asarray(origenes, dtype=np.float64), (len(filas), 2))
+    indices = filas[mover]
+    ids = df.loc[indices, 'id_notificacion'].tolist()
+    polilineas = None
+    if usar_polilineas:
+        polilineas = obtener_almacen_polilineas().flota(ids, origenes[mover], destinos[mover])
+    incrementos = incrementos_deterministas(ids, progreso[mover]) if rng is None else None
+    resultado = avanzar_flota(origenes[mover], destinos[mover], progreso[mover], rng, polilineas, incrementos)
+    df.loc[indices, COLUMNAS_MOVIMIENTO] = resultado
+    return indices
+
+
+# MOTOR DE SEGUIMIENTO EN SEGUNDO PLANO
+
+# Instantánea inmutable: nadie la modifica, cada tick publica una nueva
+SnapshotSeguimiento = namedtuple('SnapshotSeguimiento', ['version', 'instante', 'ids', 'transportistas', 'movimiento'])
+
+
+def _publicar(version, ids, transportistas, movimiento):
+    movimiento = np.array(movimiento, dtype=np.float64).reshape(-1, len(COLUMNAS_MOVIMIENTO))
+    movimiento.flags.writeable = False
+    return SnapshotSeguimiento(version, time.time(), tuple(ids), tuple(transportistas), movimiento)
+
+
+def aplicar_snapshot(df, snapshot):
+    """Copia en df (in-place) las columnas de movimiento de los viajes presentes en la instantánea"""
+    if df.empty or not snapshot.ids:
+        return df
+    posiciones = pd.Index(snapshot.ids).get_indexer(df['id_notificacion'])
+    presentes = posiciones >= 0
+    if presentes.any():
+        df.loc[df.index[presentes], COLUMNAS_MOVIMIENTO] = snapshot.movimiento[posiciones[presentes]]
+    return df
+
+
+class MotorSeguimiento:
+    """
+    Un único motor por proceso del servidor: es dueño del estado de los viajes,
+    avanza la flota cada intervalo_s segundos y publica una instantánea inmutable.
+    Las vistas solo avisan qué transportistas siguen y leen la última instantánea.
+    """
+
+    def __init__(self, ruta_csv, intervalo_s=INTERVALO_MOTOR_S):
+        self.ruta_csv = ruta_csv
+        self.intervalo_s = intervalo_s
+        self._seguidos = {}   # transportista -> (lat_base, lon_base, último aviso)
+        self._estado = {}     # id_notificacion -> fila de COLUMNAS_MOVIMIENTO
+        self._snapshot = _publicar(0, [], [], [])
+        self._lock = threading.Lock()
+        self._detener = threading.Event()
+        self._hilo = None
+        self.fallos = 0           # ticks fallidos en segundo plano
+        self.ultimo_error = None
+
+    def seguir(self, transportista, origen):
+        """Activa (o mantiene activa) la simulación de los viajes de un transportista"""
+        with self._lock:
+            self._seguidos[transportista] = (float(origen[0]), float(origen[1]), time.time())
+        self.iniciar()
+
+    def dejar_de_seguir(self, transportista):
+        with self._lock:
+            self._seguidos.pop(transportista, None)
+
+    def snapshot(self):
+        return self._snapshot
+
+    def iniciar(self):
+        with self._lock:
+            if self._hilo is not None and self._hilo.is_alive():
+                return
+            self._detener.clear()
+            self._hilo = threading.Thread(target=self._bucle, name="motor-seguimiento", daemon=True)
+            self._hilo.start()
+
+    def detener(self):
+        self._detener.set()
+
+    def _bucle(self):
+        while not self._detener.wait(self.intervalo_s):
+            try:
+                self.tick()
+            except Exception as e:
+                # un CSV a medio escribir no debe matar el hilo; el siguiente tick reintenta
+                self.fallos += 1
+                self.ultimo_error = e
+                print(f"Error en el tick de seguimiento ({self.fallos} fallos): {e!r}")
+
+    def tick(self, rng=None):
+        """Avanza una vez todos los viajes seguidos; el costo es O(viajes), no depende de las sesiones"""
+        ahora = time.time()
+        with self._lock:
+            for nombre in [n for n, s in self._seguidos.items() if ahora - s[2] > SEGUNDOS_SIN_VISTA]:
+                del self._seguidos[nombre]
+            seguidos = dict(self._seguidos)
+        if not seguidos or not os.path.exists(self.ruta_csv):
+            if self._snapshot.ids:
+                self._estado = {}
+                self._snapshot = _publicar(self._snapshot.version + 1, [], [], [])
+            return self._snapshot
+
+        with candado_archivo(self.ruta_csv):
+            df = pd.read_csv(self.ruta_csv)
+            for col in COLUMNAS_MOVIMIENTO:
+                if col not in df.columns:
+                    df[col] = np.nan
+            activos = df[(df['estado'] == 'Aceptado') & df['transportista_asignado'].isin(seguidos.keys())]
+
+            # el estado propio manda sobre lo que haya en el CSV, salvo que una vista lo haya adelantado
+            if self._estado and not activos.empty:
+                conocidos = activos['id_notificacion'].isin(self._estado.keys()).to_numpy()
+                if conocidos.any():
+                    filas = activos.index[conocidos]
+                    propio = np.array([self._estado[i] for i in activos.loc[filas, 'id_notificacion']])
+                    en_csv = df.loc[filas, 'progreso_viaje'].astype(float).fillna(0.0).to_numpy()
+                    restaurar = propio[:, 2] >= en_csv
+                    if restaurar.any():
+                        df.loc[filas[restaurar], COLUMNAS_MOVIMIENTO] = propio[restaurar]
+
+            origenes = np.array([seguidos[t][:2] for t in activos['transportista_asignado']]).reshape(-1, 2)
+            actualizados = paso_flota(df, activos.index, origenes, rng)
+            if len(actualizados):
+                escribir_csv_atomico(df, self.ruta_csv)
+
+        if len(actualizados):
+            almacen = obtener_almacen()
+            almacen.registrar(df.loc[actualizados, 'id_notificacion'].to_numpy(), ahora,
+                              df.loc[actualizados, 'transportista_lat'].to_numpy(dtype=np.float64),
+                              df.loc[actualizados, 'transportista_lon'].to_numpy(dtype=np.float64))
+            almacen.guardar()
+            obtener_bitacora().registrar_filas(df, actualizados, ahora)
+            obtener_motor_geocercas().evaluar_filas(df, actualizados, ahora)
+
+        movimiento = df.loc[activos.index, COLUMNAS_MOVIMIENTO].to_numpy(dtype=np.float64)
+        ids = activos['id_notificacion'].tolist()
+        self._estado = dict(zip(ids, map(tuple, movimiento)))
+        self._snapshot = _publicar(self._snapshot.version + 1, ids, activos['transportista_asignado'].tolist(), movimiento)
+        return self._snapshot
+
+
+_motor = None
+_lock_motor = threading.Lock()
+
+
+def obtener_motor(ruta_csv):
+    """Motor de seguimiento compartido por todas las sesiones del proceso"""
+    global _motor
+    with _lock_motor:
+        if _motor is None:
+            _motor = MotorSeguimiento(ruta_csv)
+        return _motor
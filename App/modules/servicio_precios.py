@@ -0,0 +1,140 @@
+import os
+import threading
+import joblib
+import numpy as np
+import pandas as pd
+from rutas import UBICACIONES_CIUDADES
+
+
+# CONFIGURACIÓN
+
+# columnas con las que se entrenó el modelo de precios, en su orden
+COLUMNAS_MODELO = ['producto', 'presentacion', 'ciudad', 'categoria', 'unidades (kg)']
+CATEGORIA_DEFECTO = 'General'
+CIUDAD_DEFECTO = 'Tunja'
+
+
+def predecir_lote(modelo, filas):
+    """
+    Precios de N filas (producto, presentacion, ciudad, categoria, unidades) con un solo
+    DataFrame y una sola llamada a predict. Devuelve las filas con precio_min, precio_max
+    y precio_promedio por presentación y los mismos valores por kg.
+    """
+    entrada = pd.DataFrame(list(filas), columns=COLUMNAS_MODELO)
+    if entrada.empty:
+        return entrada.assign(precio_min=[], precio_max=[], precio_promedio=[],
+                              precio_min_kg=[], precio_max_kg=[], precio_promedio_kg=[])
+    pred = np.asarray(modelo.predict(entrada), dtype=np.float64).reshape(len(entrada), -1)
+    # el modelo da (mínimo, máximo) por fila; si da un solo valor, el rango es ese valor
+    precio_min, precio_max = pred.min(axis=1), pred.max(axis=1)
+    kg = entrada['unidades (kg)'].to_numpy(dtype=np.float64)
+    return entrada.assign(
+        precio_min=precio_min,
+        precio_max=precio_max,
+        precio_promedio=(precio_min + precio_max) / 2,
+        precio_min_kg=precio_min / kg,
+        precio_max_kg=precio_max / kg,
+        precio_promedio_kg=(precio_min + precio_max) / 2 / kg
+    )
+
+
+def predecir_precio(modelo, producto, presentacion, kg, ciudad=CIUDAD_DEFECTO, categoria=CATEGORIA_DEFECTO):
+    """(mínimo, máximo) de una presentación: un lote de una fila"""
+    fila = predecir_lote(modelo, [(producto, presentacion, ciudad, categoria, kg)]).iloc[0]
+    return float(fila['precio_min']), float(fila['precio_max'])
+
+
+# TABLA DE PRECIOS PRECALCULADA
+
+class TablaPrecios:
+    """
+    Precio (mínimo, máximo) de cada producto × presentación × municipio, calculado con
+    una sola pasada del modelo al cargarlo y vuelto a calcular si cambia la fecha de
+    modificación del archivo. Las consultas son una búsqueda en un diccionario; lo que
+    no está en el catálogo (una ciudad escrita a mano, un producto nuevo) se predice en
+    lote una vez y queda guardado. Si falla la pasada del catálogo, el modelo queda
+    cargado igual y todo se predice al consultarlo.
+    """
+
+    def __init__(self, ruta_modelo, presentaciones, kg_equivalentes, ciudades=None):
+        self.ruta_modelo = ruta_modelo
+        self.presentaciones = presentaciones
+        self.kg_equivalentes = kg_equivalentes
+        self.ciudades = list(ciudades or UBICACIONES_CIUDADES)
+        self._lock = threading.Lock()
+        self._modelo = None
+        self._mtime = None
+        self._precios = {}   # (producto, presentacion, ciudad) -> (min, max) por presentación
+        self.construcciones = 0
+        self.predichos_aparte = 0
+        self.error_tabla = None   # por qué no se pudo precalcular el catálogo, si falló
+
+    def _filas_catalogo(self):
+        return [(producto, presentacion, ciudad, CATEGORIA_DEFECTO, self.kg_equivalentes[presentacion])
+                for producto, presentaciones in self.presentaciones.items()
+                for presentacion in presentaciones
+                for ciudad in self.ciudades]
+
+    @staticmethod
+    def _a_diccionario(precios):
+        return dict(zip(
+            zip(precios['producto'], precios['presentacion'], precios['ciudad']),
+            zip(precios['precio_min'].tolist(), precios['precio_max'].tolist())
+        ))
+
+    def _vigente(self):
+        """Carga el modelo y arma la tabla si el archivo cambió desde la última vez (llamar con el lock)"""
+        try:
+            mtime = os.path.getmtime(self.ruta_modelo)
+        except OSError:
+            return self._modelo is not None
+        if mtime != self._mtime:
+            modelo = joblib.load(self.ruta_modelo)
+            self._modelo, self._mtime, self._precios = modelo, mtime, {}
+            try:
+                self._precios = self._a_diccionario(predecir_lote(modelo, self._filas_catalogo()))
+                self.error_tabla = None
+            except Exception as e:
+                self.error_tabla = e
+            self.construcciones += 1
+        return True
+
+    def modelo(self):
+        """El modelo de precios cargado (con la tabla armada, si se pudo), o None si no hay archivo"""
+        with self._lock:
+            return self._modelo if self._vigente() else None
+
+    def precios(self, consultas, categoria=CATEGORIA_DEFECTO):
+        """
+        (mínimo, máximo) por presentación de cada (producto, presentacion, ciudad, kg). Las
+        que no están en la tabla se predicen juntas en un solo lote.
+        """
+        consultas = list(consultas)
+        with self._lock:
+            if not self._vigente():
+                raise FileNotFoundError(self.ruta_modelo)
+            faltantes = list({(p, pres, c): kg for p, pres, c, kg in consultas
+                              if (p, pres, c) not in self._precios}.items())
+            if faltantes:
+                precios = predecir_lote(self._modelo, [(p, pres, c, categoria, kg) for (p, pres, c), kg in faltantes])
+                self._precios.update(self._a_diccionario(precios))
+                self.predichos_aparte += len(faltantes)
+            return [self._precios[(p, pres, c)] for p, pres, c, _ in consultas]
+
+    def precio(self, producto, presentacion, kg, ciudad=CIUDAD_DEFECTO):
+        return self.precios([(producto, presentacion, ciudad, kg)])[0]
+
+    def __len__(self):
+        return len(self._precios)
+
+
+_tabla = None
+_lock_tabla = threading.Lock()
+
+
+def obtener_tabla_precios(ruta_modelo, presentaciones, kg_equivalentes):
+    global _tabla
+    with _lock_tabla:
+        if _tabla is None:
+            _tabla = TablaPrecios(ruta_modelo, presentaciones, kg_equivalentes)
+        return _tabla
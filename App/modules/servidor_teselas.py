@@ -0,0 +1,313 @@
+"""
+Proxy local de teselas de mapa con caché en disco.
+
+Sin configuración los mapas de folium piden sus teselas directamente a la fuente
+original. Si se define TESELAS_URL (la dirección con la que los navegadores llegan
+a este servidor, por ejemplo a través del mismo proxy inverso que publica la app),
+los mapas las piden al proxy, que escucha solo en 127.0.0.1 y sirve desde
+data/teselas. Las de OpenStreetMap que falten se descargan una vez y se guardan;
+las de Google no se guardan nunca: si no están en disco, el navegador se redirige
+a Google.
+
+Para trabajar sin conexión se presiembra Boyacá desde un servidor de teselas
+propio o de un proveedor cuya licencia permita la descarga masiva y el uso sin
+conexión; los servidores de OpenStreetMap y de Google no lo permiten, así que el
+origen se indica siempre a mano, junto con la fuente de los mapas cuyo estilo tiene:
+cada corrida llena la caché de una sola fuente. Uso:
+
+    python App/modules/servidor_teselas.py presembrar --fuente osm --origen "https://teselas.ejemplo.org/{z}/{x}/{y}.png"
+    python App/modules/servidor_teselas.py presembrar --fuente google --origen "http://localhost:8080/{z}/{x}/{y}.png" --zoom-max 12
+    TESELAS_URL=https://app.ejemplo.org/teselas python App/modules/servidor_teselas.py servir
+"""
+import argparse
+import errno
+import math
+import os
+import re
+import threading
+import time
+import urllib.request
+from http.client import HTTPException
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+# CONFIGURACIÓN
+
+APP_ROOT = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+DIR_TESELAS = os.path.join(APP_ROOT, "data", "teselas")
+
+HOST = "127.0.0.1"
+PUERTO = int(os.environ.get("TESELAS_PUERTO", 8766))  # 8765 es el de ingesta_gps
+# dirección con la que el navegador llega al proxy; sin ella los mapas usan la fuente original
+URL_PUBLICA = os.environ.get("TESELAS_URL")
+
+FUENTES = {
+    'osm': "https://tile.openstreetmap.org/{z}/{x}/{y}.png",
+    'google': "https://mt1.google.com/vt/lyrs=r&x={x}&y={y}&z={z}",
+}
+ATRIBUCIONES = {
+    'osm': '&copy; <a href="https://www.openstreetmap.org/copyright">OpenStreetMap</a>',
+    'google': 'Google',
+}
+# fuentes cuyas teselas se pueden guardar al vuelo (Google no lo permite)
+CACHEABLES = {'osm'}
+
+BBOX_BOYACA = (4.65, -74.70, 7.10, -71.90)  # lat_min, lon_min, lat_max, lon_max
+ZOOM_MIN = 9               # el zoom más lejano de los mapas (zoom_para_distancia y el mapa de oferta)
+ZOOM_MAX_PRESIEMBRA = 13
+ZOOM_MAX = 19
+PAUSA_DESCARGA_S = 0.1
+TIMEOUT_DESCARGA_S = 10
+USER_AGENT = "parcialFinal-teselas/1.0 (cache local de la app)"
+# ruta y respuesta con las que el proxy se reconoce cuando su puerto ya está ocupado
+RUTA_IDENTIDAD = "/identidad"
+IDENTIDAD = b"parcialFinal-teselas"
+TIMEOUT_IDENTIDAD_S = 2
+
+_RUTA_TESELA = re.compile(r"^/(\w+)/(\d+)/(\d+)/(\d+)\.png$")
+
+
+def tesela_de(lat, lon, zoom):
+    """Índices (x, y) de la tesela que contiene el punto"""
+    n = 1 << zoom
+    lat_rad = math.radians(lat)
+    x = int((lon + 180.0) / 360.0 * n)
+    y = int((1.0 - math.asinh(math.tan(lat_rad)) / math.pi) / 2.0 * n)
+    return min(max(x, 0), n - 1), min(max(y, 0), n - 1)
+
+
+def teselas_bbox(bbox, zoom):
+    lat_min, lon_min, lat_max, lon_max = bbox
+    x0, y0 = tesela_de(lat_max, lon_min, zoom)
+    x1, y1 = tesela_de(lat_min, lon_max, zoom)
+    return [(x, y) for x in range(x0, x1 + 1) for y in range(y0, y1 + 1)]
+
+
+def en_zona(z, x, y, bbox=BBOX_BOYACA):
+    """Si la tesela toca la zona: fuera de ella el proxy no guarda nada en disco"""
+    lat_min, lon_min, lat_max, lon_max = bbox
+    x0, y0 = tesela_de(lat_max, lon_min, z)
+    x1, y1 = tesela_de(lat_min, lon_max, z)
+    return x0 <= x <= x1 and y0 <= y <= y1
+
+
+# CACHÉ EN DISCO
+
+class CacheTeselas:
+    """Teselas en data/teselas/<fuente>/<z>/<x>/<y>.png"""
+
+    def __init__(self, directorio=DIR_TESELAS):
+        self.directorio = directorio
+        self.aciertos = 0
+        self.descargas = 0
+        self.fallos = 0
+
+    def ruta(self, fuente, z, x, y):
+        return os.path.join(self.directorio, fuente, str(z), str(x), f"{y}.png")
+
+    def descargar(self, origen, z, x, y):
+        """Bytes de la tesela desde una plantilla de URL con {z}, {x} y {y}"""
+        peticion = urllib.request.Request(origen.format(z=z, x=x, y=y), headers={"User-Agent": USER_AGENT})
+        with urllib.request.urlopen(peticion, timeout=TIMEOUT_DESCARGA_S) as respuesta:
+            return respuesta.read()
+
+    def guardar(self, fuente, z, x, y, datos):
+        # escritura atómica: un lector concurrente nunca ve una tesela a medias
+        ruta = self.ruta(fuente, z, x, y)
+        os.makedirs(os.path.dirname(ruta), exist_ok=True)
+        temporal = f"{ruta}.{threading.get_ident()}.tmp"
+        with open(temporal, "wb") as f:
+            f.write(datos)
+        os.replace(temporal, ruta)
+
+    def obtener(self, fuente, z, x, y, origen=None):
+        """
+        Bytes de la tesela, o None si no está en disco y no se pudo (o no se debe)
+        descargar. Solo se descarga y guarda si se da el origen.
+        """
+        try:
+            with open(self.ruta(fuente, z, x, y), "rb") as f:
+                datos = f.read()
+            self.aciertos += 1
+            return datos
+        except OSError:
+            pass
+        if origen is None:
+            return None
+        try:
+            datos = self.descargar(origen, z, x, y)
+        except (OSError, ValueError):
+            self.fallos += 1
+            return None
+        self.guardar(fuente, z, x, y, datos)
+        self.descargas += 1
+        return datos
+
+
+def presembrar(cache, origen, fuente, zoom_min=ZOOM_MIN, zoom_max=ZOOM_MAX_PRESIEMBRA,
+               bbox=BBOX_BOYACA, pausa_s=PAUSA_DESCARGA_S, progreso=None):
+    """
+    Descarga desde el origen (plantilla de URL de un servidor que permita la descarga
+    masiva, con el estilo de la fuente) las teselas que falten en la zona y niveles
+    indicados, y las guarda como teselas de esa fuente. Devuelve (ya estaban, descargadas, fallidas).
+    """
+    ya_estaban = descargadas = fallidas = 0
+    for z in range(zoom_min, zoom_max + 1):
+        for x, y in teselas_bbox(bbox, z):
+            if os.path.exists(cache.ruta(fuente, z, x, y)):
+                ya_estaban += 1
+                continue
+            try:
+                datos = cache.descargar(origen, z, x, y)
+            except (OSError, ValueError):
+                fallidas += 1
+                continue
+            cache.guardar(fuente, z, x, y, datos)
+            descargadas += 1
+            time.sleep(pausa_s)
+        if progreso:
+            progreso(z, ya_estaban, descargadas, fallidas)
+    return ya_estaban, descargadas, fallidas
+
+
+# SERVIDOR HTTP
+
+def _tipo_imagen(datos):
+    return "image/jpeg" if datos[:2] == b"\xff\xd8" else "image/png"
+
+
+class ManejadorTeselas(BaseHTTPRequestHandler):
+    cache = None
+
+    def do_GET(self):
+        if self.path == RUTA_IDENTIDAD:
+            self._responder(IDENTIDAD, "text/plain", "no-store")
+            return
+        coincidencia = _RUTA_TESELA.match(self.path)
+        if not coincidencia or coincidencia.group(1) not in FUENTES:
+            self.send_error(404)
+            return
+        fuente = coincidencia.group(1)
+        z, x, y = (int(v) for v in coincidencia.groups()[1:])
+        if z > ZOOM_MAX or x >= (1 << z) or y >= (1 << z):
+            self.send_error(404)
+            return
+        guardable = fuente in CACHEABLES and en_zona(z, x, y)
+        datos = self.cache.obtener(fuente, z, x, y, FUENTES[fuente] if guardable else None)
+        if datos is None and not guardable:
+            # Google o fuera de Boyacá: el navegador la pide a la fuente, sin pasar por el disco
+            self.send_response(302)
+            self.send_header("Location", FUENTES[fuente].format(z=z, x=x, y=y))
+            self.end_headers()
+            return
+        if datos is None:
+            # sin conexión y sin copia local: el mapa deja ese cuadro en blanco
+            self.send_error(404)
+            return
+        self._responder(datos, _tipo_imagen(datos), "public, max-age=604800")
+
+    def _responder(self, datos, tipo, cache_control):
+        self.send_response(200)
+        self.send_header("Content-Type", tipo)
+        self.send_header("Content-Length", str(len(datos)))
+        self.send_header("Cache-Control", cache_control)
+        self.send_header("Access-Control-Allow-Origin", "*")
+        self.end_headers()
+        self.wfile.write(datos)
+
+    def log_message(self, formato, *args):
+        pass
+
+
+def crear_servidor(puerto=PUERTO, directorio=DIR_TESELAS, host=HOST):
+    manejador = type("Manejador", (ManejadorTeselas,), {"cache": CacheTeselas(directorio)})
+    servidor = ThreadingHTTPServer((host, puerto), manejador)
+    servidor.daemon_threads = True
+    return servidor
+
+
+def es_proxy_teselas(puerto=PUERTO, host=HOST):
+    """Si lo que escucha en el puerto es este proxy (y no, por ejemplo, la ingesta GPS)"""
+    try:
+        with urllib.request.urlopen(f"http://{host}:{puerto}{RUTA_IDENTIDAD}", timeout=TIMEOUT_IDENTIDAD_S) as respuesta:
+            return respuesta.read(len(IDENTIDAD) + 1) == IDENTIDAD
+    except (OSError, ValueError, HTTPException):
+        return False
+
+
+_servidor = None
+_disponible = None
+_lock_servidor = threading.Lock()
+
+
+def obtener_servidor_teselas(puerto=PUERTO, directorio=DIR_TESELAS):
+    """
+    Arranca el proxy en un hilo la primera vez. Si el puerto ya está ocupado se usa el
+    proxy de otro proceso de la app, solo si responde como tal. Devuelve si hay proxy disponible.
+    """
+    global _servidor, _disponible
+    with _lock_servidor:
+        if _disponible is None:
+            try:
+                _servidor = crear_servidor(puerto, directorio)
+                threading.Thread(target=_servidor.serve_forever, name="servidor-teselas", daemon=True).start()
+                _disponible = True
+            except OSError as e:
+                _disponible = e.errno == errno.EADDRINUSE and es_proxy_teselas(puerto)
+                if not _disponible:
+                    print(f"Proxy de teselas no disponible en el puerto {puerto}: {e}")
+        return _disponible
+
+
+def url_teselas(fuente='osm'):
+    """
+    Plantilla de teselas para folium: el proxy solo si se configuró TESELAS_URL y está
+    disponible; si no, la fuente original, que funciona desde cualquier navegador.
+    """
+    if URL_PUBLICA and obtener_servidor_teselas():
+        return f"{URL_PUBLICA}/{fuente}/{{z}}/{{x}}/{{y}}.png"
+    return FUENTES[fuente]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Proxy local de teselas con caché en disco")
+    parser.add_argument("--directorio", default=DIR_TESELAS)
+    sub = parser.add_subparsers(dest="comando", required=True)
+
+    p_pre = sub.add_parser("presembrar", help="Descarga de antemano las teselas de Boyacá")
+    p_pre.add_argument("--origen", required=True,
+                       help="Plantilla de URL {z}/{x}/{y} de un servidor que permita la descarga masiva")
+    p_pre.add_argument("--fuente", required=True, choices=sorted(FUENTES),
+                       help="Fuente de los mapas con el mismo estilo que el origen; sus teselas se guardan en su caché")
+    p_pre.add_argument("--zoom-min", type=int, default=ZOOM_MIN)
+    p_pre.add_argument("--zoom-max", type=int, default=ZOOM_MAX_PRESIEMBRA)
+    p_pre.add_argument("--pausa", type=float, default=PAUSA_DESCARGA_S, help="Segundos entre descargas")
+
+    p_serv = sub.add_parser("servir", help="Sirve las teselas en primer plano")
+    p_serv.add_argument("--puerto", type=int, default=PUERTO)
+    p_serv.add_argument("--host", default=HOST)
+    args = parser.parse_args()
+
+    if args.comando == "presembrar":
+        if not 0 <= args.zoom_min <= args.zoom_max <= ZOOM_MAX:
+            parser.error(f"Los niveles de zoom deben ir de 0 a {ZOOM_MAX}, con --zoom-min <= --zoom-max")
+        if not all(f"{{{c}}}" in args.origen for c in "zxy"):
+            parser.error("--origen debe contener {z}, {x} y {y}")
+        total = sum(len(teselas_bbox(BBOX_BOYACA, z)) for z in range(args.zoom_min, args.zoom_max + 1))
+        print(f"{total} teselas de Boyacá entre zoom {args.zoom_min} y {args.zoom_max} (fuente {args.fuente})")
+        ya, nuevas, fallidas = presembrar(
+            CacheTeselas(args.directorio), args.origen, args.fuente, args.zoom_min, args.zoom_max, pausa_s=args.pausa,
+            progreso=lambda z, y, d, f: print(f"  zoom {z}: {y} en disco, {d} descargadas, {f} fallidas")
+        )
+        print(f"Listo: {ya} ya estaban, {nuevas} descargadas, {fallidas} fallidas en {args.directorio}")
+    else:
+        servidor = crear_servidor(args.puerto, args.directorio, args.host)
+        print(f"Sirviendo teselas de {args.directorio} en http://{args.host}:{args.puerto}/<fuente>/<z>/<x>/<y>.png")
+        try:
+            servidor.serve_forever()
+        except KeyboardInterrupt:
+            servidor.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -6,8 +6,25 @@ import numpy as np
 import folium
 from streamlit_folium import st_folium
 from folium import plugins
+from folium.utilities import JsCode
 from itertools import permutations
 import time
+from rutas import (UBICACIONES_CIUDADES, VELOCIDAD_PROMEDIO_KMH, optimizar_zonas_paralelo,
+                   optimizar_ruta_recogida_entrega, distancia_viajes_separados,
+                   matriz_costos_zonas, repartir_zonas)
+from eta import estimar_tiempo_rutas_minutos
+from seguimiento import (LOCK_NOTIFICACIONES, avanzar_flota, aplicar_snapshot, candado_archivo,
+                         escribir_csv_atomico, incrementos_deterministas, obtener_motor)
+from bitacora_posiciones import obtener_bitacora
+from historial_posiciones import obtener_almacen
+from geocercas import obtener_motor_geocercas
+from polilineas import obtener_almacen_polilineas
+from geojson_rutas import COLORES_RUTA, ESTILO_FEATURE_JS, a_texto, coleccion_rutas
+from mapa_webgl import mapa_webgl_transportista
+from oferta_grilla import mostrar_mapa_oferta
+from servidor_teselas import ATRIBUCIONES, url_teselas
+from bus_eventos import (ACEPTADA, ENTREGA_ASIGNADA, ENTREGADA, INTERVALO_ESCUCHA_S, PUBLICADA,
+                         RECOGIDA, RETIRADA, describir_evento, obtener_bus)
 
 
 # CONFIGURACIÓN
@@ -16,20 +33,30 @@ APP_ROOT = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
 DATA_DIR = os.path.join(APP_ROOT, "data")
 CSV_NOTIFICACIONES = os.path.join(DATA_DIR, "notificaciones_transporte.csv")
 CSV_VENTAS_TRANSPORTADOR = os.path.join(DATA_DIR, "ventas_transportador.csv")
-os.makedirs(DATA_DIR, exist_ok=True)
+CSV_COMPRAS = os.path.join(DATA_DIR, "historial_compras.csv")
+CSV_TRACKING = os.path.join(DATA_DIR, "tracking_transportistas.csv")
+MINUTOS_ACTIVO = 15  # un transportista sin actividad en este tiempo deja de recibir zonas
+# el registro de actividad se renueva a mitad de la ventana: nunca vence entre dos renovaciones
+MINUTOS_RENOVAR_ACTIVO = MINUTOS_ACTIVO / 2
+UMBRAL_MARCADORES_AGRUPADOS = 200  # con más paradas el mapa agrupa los marcadores en el navegador
+MODOS_MAPA = ["📍 Marcadores", "⚡ Marcadores agrupados", "🧩 Capa GeoJSON", "🌐 WebGL"]
 
-UBICACIONES_CIUDADES = {
-    'Tunja': (5.5353, -73.3678),
-    'Duitama': (5.8269, -73.0347),
-    'Sogamoso': (5.7147, -72.9342),
-    'Paipa': (5.7808, -73.1175),
-    'Chiquinquirá': (5.6181, -73.8169),
-    'Villa de Leyva': (5.6378, -73.5264),
-    'Nobsa': (5.7703, -72.9486),
-    'Tibasosa': (5.7506, -72.9828),
-    'Moniquirá': (5.8753, -73.5750),
-    'Samacá': (5.4892, -73.4956)
-}
+# Los marcadores agrupados se arman en el navegador a partir de arreglos simples
+# [lat, lon, ...]: el HTML no crece con un DivIcon por parada.
+CALLBACK_PARADA = """(function (row) {
+    var icono = L.divIcon({
+        html: '<div style="font-size: 14px; color: white; background-color: ' + row[3] + '; border-radius: 50%; '
+            + 'width: 24px; height: 24px; display: flex; align-items: center; justify-content: center; '
+            + 'border: 2px solid white; font-weight: bold;">' + row[2] + '</div>',
+        className: '', iconSize: [24, 24]
+    });
+    return L.marker(new L.LatLng(row[0], row[1]), {icon: icono}).bindTooltip('Parada ' + row[2]).bindPopup(row[4]);
+})"""
+CALLBACK_CAMION = """(function (row) {
+    var icono = L.AwesomeMarkers.icon({icon: 'truck', prefix: 'fa', markerColor: 'red'});
+    return L.marker(new L.LatLng(row[0], row[1]), {icon: icono}).bindPopup(row[2]);
+})"""
+os.makedirs(DATA_DIR, exist_ok=True)
 
 
 # FUNCIONES DE DATOS
@@ -59,15 +86,184 @@ def cargar_notificaciones():
 
 def guardar_notificaciones(df):
     try:
-        df.to_csv(CSV_NOTIFICACIONES, index=False)
+        with LOCK_NOTIFICACIONES:
+            escribir_csv_atomico(df, CSV_NOTIFICACIONES)
         return True
     except Exception as e:
         st.error(f"Error al guardar: {e}")
         return False
 
+def cargar_compras():
+    columnas = [
+        'fecha_compra', 'comprador', 'vendedor', 'origen', 'producto', 'cantidad_kg',
+        'ciudad', 'id_notificacion', 'ciudad_entrega', 'lat_entrega', 'lon_entrega',
+        'estado_entrega', 'transportista_entrega', 'fecha_entrega'
+    ]
+    if not os.path.exists(CSV_COMPRAS):
+        return pd.DataFrame(columns=columnas)
+    try:
+        df = pd.read_csv(CSV_COMPRAS)
+    except Exception:
+        return pd.DataFrame(columns=columnas)
+    for col in columnas:
+        if col not in df.columns:
+            df[col] = None
+    for col in ['estado_entrega', 'transportista_entrega', 'fecha_entrega']:
+        df[col] = df[col].astype(object)
+    return df
+
+def guardar_compras(df):
+    try:
+        df.to_csv(CSV_COMPRAS, index=False)
+        return True
+    except Exception as e:
+        st.error(f"Error al guardar compras: {e}")
+        return False
+
+def registrar_transportista_activo(nombre, ciudad_origen):
+    """
+    Marca al transportista como activo (con su base) para el reparto de zonas. El CSV solo
+    se reescribe al cambiar de nombre o ciudad, o cada MINUTOS_RENOVAR_ACTIVO, no en cada rerun.
+    """
+    previo = st.session_state.get('registro_activo')
+    ahora = time.time()
+    if previo is not None and previo[:2] == (nombre, ciudad_origen) and ahora - previo[2] < MINUTOS_RENOVAR_ACTIVO * 60:
+        return
+    columnas = ['transportista', 'latitud', 'longitud', 'ultima_actualizacion',
+                'velocidad_kmh', 'estado_viaje', 'id_notificacion_asignada']
+    lat, lon = UBICACIONES_CIUDADES.get(ciudad_origen, UBICACIONES_CIUDADES['Tunja'])
+    fila = {
+        'transportista': nombre,
+        'latitud': lat,
+        'longitud': lon,
+        'ultima_actualizacion': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        'velocidad_kmh': VELOCIDAD_PROMEDIO_KMH,
+        'estado_viaje': 'Disponible',
+        'id_notificacion_asignada': None
+    }
+    try:
+        # lectura y escritura bajo el mismo candado: otras sesiones registran a la vez
+        with candado_archivo(CSV_TRACKING):
+            try:
+                df = pd.read_csv(CSV_TRACKING) if os.path.exists(CSV_TRACKING) else pd.DataFrame(columns=columnas)
+            except Exception:
+                df = pd.DataFrame(columns=columnas)
+            df = pd.concat([df[df['transportista'] != nombre], pd.DataFrame([fila])], ignore_index=True)
+            df.to_csv(CSV_TRACKING, index=False)
+        st.session_state.registro_activo = (nombre, ciudad_origen, ahora)
+    except Exception as e:
+        st.error(f"Error al registrar transportista: {e}")
+
+def cargar_transportistas_activos(minutos=MINUTOS_ACTIVO):
+    if not os.path.exists(CSV_TRACKING):
+        return pd.DataFrame(columns=['transportista', 'latitud', 'longitud', 'ultima_actualizacion'])
+    with candado_archivo(CSV_TRACKING):
+        df = pd.read_csv(CSV_TRACKING)
+    ultima = pd.to_datetime(df['ultima_actualizacion'], errors='coerce')
+    limite = pd.Timestamp.now() - pd.Timedelta(minutes=minutos)
+    return df[(ultima >= limite) & df['latitud'].notna() & df['longitud'].notna()].reset_index(drop=True)
+
+def zonas_del_transportista(zonas, df_notif, nombre_transportista):
+    """
+    Reparte las zonas pendientes entre los transportistas activos y devuelve las que tocan a este.
+    Los costos no dependen de quién mira, así que todas las sesiones llegan al mismo reparto.
+    """
+    activos = cargar_transportistas_activos()
+    if activos.empty or nombre_transportista not in set(activos['transportista']):
+        return set(range(len(zonas))), 1
+    bases = activos[['latitud', 'longitud']].to_numpy(dtype=float)
+    costos = matriz_costos_zonas(zonas, bases)
+
+    # horas ya comprometidas por cada transportista en viajes aceptados
+    en_curso = df_notif[df_notif['estado'] == 'Aceptado']
+    restante = pd.to_numeric(en_curso['distancia_restante_km'], errors='coerce').fillna(0)
+    km_por_transportista = restante.groupby(en_curso['transportista_asignado']).sum()
+    carga_actual = activos['transportista'].map(km_por_transportista).fillna(0).to_numpy() / VELOCIDAD_PROMEDIO_KMH
+
+    asignacion, _ = repartir_zonas(costos, carga_actual)
+    propio = int(np.flatnonzero(activos['transportista'].to_numpy() == nombre_transportista)[0])
+    return set(np.flatnonzero(asignacion == propio).tolist()), len(activos)
+
+def suscripcion_transportista(nombre_transportista):
+    """Suscripción de la sesión al bus: cargas que aparecen o se van y todo lo que toca a este transportista"""
+    if 'bus_transportista' not in st.session_state:
+        st.session_state.bus_transportista = obtener_bus().suscribir()
+    suscripcion = st.session_state.bus_transportista
+    suscripcion.filtrar({'tipo': {PUBLICADA, ACEPTADA, RETIRADA}}, {'transportista': nombre_transportista})
+    return suscripcion
+
+
+@st.fragment(run_every=INTERVALO_ESCUCHA_S)
+def escuchar_cambios():
+    """La vista solo se vuelve a ejecutar cuando llega un evento que le interesa"""
+    eventos = st.session_state.bus_transportista.nuevos()
+    if eventos:
+        for evento in eventos[-3:]:
+            st.toast(describir_evento(evento))
+        st.rerun()
+
+
 def validar_coordenadas(lat, lon):
     return lat is not None and lon is not None and not pd.isna(lat) and not pd.isna(lon)
 
+def construir_solicitudes_recogida_entrega(df_notif, df_compras, nombre_transportista):
+    """Empareja cada compra pendiente de entrega con su recogida en finca (si aún no va en el camión)"""
+    solicitudes = []
+    ids_con_entrega = set()
+
+    pendientes = df_compras[
+        (df_compras['estado_entrega'] == 'Por entregar') &
+        df_compras['lat_entrega'].notna() & df_compras['lon_entrega'].notna() &
+        (df_compras['transportista_entrega'].isna() | (df_compras['transportista_entrega'] == nombre_transportista))
+    ]
+    notif_por_id = df_notif.drop_duplicates('id_notificacion').set_index('id_notificacion')
+
+    for idx_compra, compra in pendientes.iterrows():
+        entrega = (float(compra['lat_entrega']), float(compra['lon_entrega']))
+        if compra['origen'] == 'Transportador':
+            # ya recogido: solo falta la entrega, y únicamente la hace quien lo lleva
+            if compra['vendedor'] != nombre_transportista:
+                continue
+            recogida = None
+        else:
+            if compra['id_notificacion'] not in notif_por_id.index:
+                continue
+            fila = notif_por_id.loc[compra['id_notificacion']]
+            if not validar_coordenadas(fila['latitud'], fila['longitud']):
+                continue
+            recogida = (float(fila['latitud']), float(fila['longitud']))
+        ids_con_entrega.add(compra['id_notificacion'])
+        solicitudes.append({
+            'recogida': recogida,
+            'entrega': entrega,
+            'kg': float(compra['cantidad_kg']),
+            'producto': compra['producto'],
+            'nombre': compra['comprador'],
+            'ciudad_entrega': compra['ciudad_entrega'],
+            'idx_compra': idx_compra,
+            'idx_notif': None
+        })
+
+    # cargas aceptadas que todavía no tienen comprador: solo recogida
+    mis_cargas = df_notif[
+        (df_notif['transportista_asignado'] == nombre_transportista) &
+        (df_notif['estado'] == 'Aceptado')
+    ]
+    for idx, row in mis_cargas.iterrows():
+        if row['id_notificacion'] in ids_con_entrega or not validar_coordenadas(row['latitud'], row['longitud']):
+            continue
+        solicitudes.append({
+            'recogida': (float(row['latitud']), float(row['longitud'])),
+            'entrega': None,
+            'kg': float(row['cantidad_kg']),
+            'producto': row['producto'],
+            'nombre': row['campesino'],
+            'ciudad_entrega': None,
+            'idx_compra': None,
+            'idx_notif': idx
+        })
+    return solicitudes
+
 def agrupar_por_proximidad(df_disponibles, radio_km=5):
     """Agrupa productos que están cerca unos de otros"""
     if df_disponibles.empty:
@@ -125,16 +321,19 @@ def calcular_distancia(coord1, coord2):
     c = 2*np.arcsin(np.sqrt(a))
     return R * c
 
-def simular_movimiento(ciudad_origen, lat_destino, lon_destino, progreso_actual=0.0):
+def simular_movimiento(ciudad_origen, lat_destino, lon_destino, progreso_actual=0.0, id_notificacion=None):
     lat_origen, lon_origen = UBICACIONES_CIUDADES.get(ciudad_origen, UBICACIONES_CIUDADES['Tunja'])
-    incremento = np.random.uniform(0.05, 0.15)
-    nuevo_progreso = min(progreso_actual + incremento, 1.0)
-    lat_actual = lat_origen + (lat_destino - lat_origen) * nuevo_progreso
-    lon_actual = lon_origen + (lon_destino - lon_origen) * nuevo_progreso
-    if nuevo_progreso >= 1.0:
-        lat_actual, lon_actual = lat_destino, lon_destino
-    distancia_restante = calcular_distancia((lat_actual, lon_actual), (lat_destino, lon_destino))
-    tiempo_minutos = (distancia_restante / 40) * 60
+    polilineas = None
+    if id_notificacion is not None:
+        polilineas = obtener_almacen_polilineas().flota(
+            [id_notificacion], [(lat_origen, lon_origen)], [(lat_destino, lon_destino)]
+        )
+    # mismo viaje y mismo avance dan siempre el mismo paso
+    clave = id_notificacion if id_notificacion is not None else f"{lat_destino},{lon_destino}"
+    lat_actual, lon_actual, nuevo_progreso, distancia_restante, tiempo_minutos = avanzar_flota(
+        [(lat_origen, lon_origen)], [(lat_destino, lon_destino)], [progreso_actual], polilineas=polilineas,
+        incrementos=incrementos_deterministas([clave], [progreso_actual])
+    )[0]
     return lat_actual, lon_actual, nuevo_progreso, distancia_restante, tiempo_minutos
 
 def optimizar_ruta_ia(origen, destinos):
@@ -167,12 +366,13 @@ def optimizar_ruta_ia(origen, destinos):
 
 def crear_mapa(ciudad_origen, viajes_activos):
     lat_origen, lon_origen = UBICACIONES_CIUDADES.get(ciudad_origen, UBICACIONES_CIUDADES['Tunja'])
-    mapa = folium.Map(location=[lat_origen, lon_origen], zoom_start=11, control_scale=True)
+    mapa = folium.Map(location=[lat_origen, lon_origen], zoom_start=11, control_scale=True,
+                      tiles=url_teselas('osm'), attr=ATRIBUCIONES['osm'])
     plugins.Fullscreen(position='topright').add_to(mapa)
     
     folium.Marker([lat_origen, lon_origen], popup=f"🏢 Base: {ciudad_origen}", tooltip='Base', icon=folium.Icon(color='blue', icon='home', prefix='fa')).add_to(mapa)
     
-    colores_ruta = ['#4285F4', '#EA4335', '#FBBC04', '#34A853', '#FF6D00', '#9C27B0']
+    colores_ruta = COLORES_RUTA
     
     if not viajes_activos.empty and 'ruta_optimizada' in viajes_activos.columns:
         rutas = viajes_activos.groupby('ruta_optimizada', dropna=False)
@@ -222,6 +422,69 @@ def crear_mapa(ciudad_origen, viajes_activos):
     
     return mapa
 
+def crear_mapa_agrupado(ciudad_origen, viajes_activos):
+    """
+    Mismo mapa que crear_mapa para miles de paradas: paradas y camiones viajan como
+    arreglos de coordenadas a FastMarkerCluster y los iconos se crean en el navegador.
+    Los datos se arman con operaciones de columnas, sin recorrer fila por fila.
+    """
+    lat_origen, lon_origen = UBICACIONES_CIUDADES.get(ciudad_origen, UBICACIONES_CIUDADES['Tunja'])
+    mapa = folium.Map(location=[lat_origen, lon_origen], zoom_start=11, control_scale=True, prefer_canvas=True,
+                      tiles=url_teselas('osm'), attr=ATRIBUCIONES['osm'])
+    plugins.Fullscreen(position='topright').add_to(mapa)
+    
+    folium.Marker([lat_origen, lon_origen], popup=f"🏢 Base: {ciudad_origen}", tooltip='Base', icon=folium.Icon(color='blue', icon='home', prefix='fa')).add_to(mapa)
+    
+    if viajes_activos.empty:
+        return mapa
+    paradas = viajes_activos[viajes_activos['latitud'].notna() & viajes_activos['longitud'].notna()].copy()
+    if paradas.empty:
+        return mapa
+    
+    # mismo color por ruta que crear_mapa: el orden de los grupos de groupby
+    paradas['grupo'] = paradas.groupby('ruta_optimizada', dropna=False).ngroup()
+    paradas = paradas.sort_values(['grupo', 'orden_parada'], kind='stable')
+    orden = paradas['orden_parada'].fillna(1).astype(int)
+    progreso = (paradas['progreso_viaje'].astype(float).fillna(0.0) * 100).round().astype(int).astype(str)
+    ruta = paradas['ruta_optimizada'].fillna("Entrega Individual").astype(str)
+    colores = np.array(COLORES_RUTA)[paradas['grupo'].to_numpy() % len(COLORES_RUTA)]
+    
+    texto_parada = ("📍 Parada " + orden.astype(str) + ": " + paradas['campesino'].astype(str)
+                    + "<br>Producto: " + paradas['producto'].astype(str) + "<br>Progreso: " + progreso + "%")
+    datos_paradas = list(zip(paradas['latitud'].astype(float), paradas['longitud'].astype(float),
+                             orden, colores.tolist(), texto_parada))
+    plugins.FastMarkerCluster([list(d) for d in datos_paradas], callback=CALLBACK_PARADA, name="Paradas").add_to(mapa)
+    
+    # un camión por ruta (en su primera parada) y uno por cada entrega individual
+    con_camion = (orden == 1) | paradas['ruta_optimizada'].isna()
+    lat_trans = paradas['transportista_lat'].astype(float).where(paradas['transportista_lon'].notna()).fillna(lat_origen)
+    lon_trans = paradas['transportista_lon'].astype(float).where(paradas['transportista_lat'].notna()).fillna(lon_origen)
+    texto_camion = "🚚 Transportista<br>Ruta: " + ruta + "<br>Progreso: " + progreso + "%"
+    datos_camiones = list(zip(lat_trans[con_camion], lon_trans[con_camion], texto_camion[con_camion]))
+    plugins.FastMarkerCluster([list(d) for d in datos_camiones], callback=CALLBACK_CAMION, name="Transportistas").add_to(mapa)
+    
+    for grupo, tramo in paradas.groupby('grupo', sort=True):
+        puntos_ruta = [[lat_origen, lon_origen]] + tramo[['latitud', 'longitud']].to_numpy(dtype=float).tolist()
+        folium.PolyLine(puntos_ruta, color=COLORES_RUTA[grupo % len(COLORES_RUTA)], weight=4, opacity=0.7,
+                        popup=f"Ruta: {ruta.loc[tramo.index[0]]}").add_to(mapa)
+    
+    return mapa
+
+def crear_mapa_geojson(ciudad_origen, coleccion):
+    """Base, rutas, paradas y camiones como una sola capa GeoJSON con el estilo en sus propiedades"""
+    lat_origen, lon_origen = UBICACIONES_CIUDADES.get(ciudad_origen, UBICACIONES_CIUDADES['Tunja'])
+    mapa = folium.Map(location=[lat_origen, lon_origen], zoom_start=11, control_scale=True, prefer_canvas=True,
+                      tiles=url_teselas('osm'), attr=ATRIBUCIONES['osm'])
+    plugins.Fullscreen(position='topright').add_to(mapa)
+    folium.GeoJson(
+        coleccion,
+        name="Rutas activas",
+        on_each_feature=JsCode(ESTILO_FEATURE_JS),
+        marker=folium.CircleMarker(fill=True),
+        tooltip=folium.GeoJsonTooltip(fields=['etiqueta'], labels=False)
+    ).add_to(mapa)
+    return mapa
+
 def aplicar_estilos():
     st.markdown("""
     <style>
@@ -259,7 +522,11 @@ def view_transportista():
         if agrupar_entregas:
             radio_agrupacion = st.slider("Radio de agrupación (km)", 1, 15, 5)
             st.info(f"🗺️ Se agruparán productos dentro de {radio_agrupacion} km")
-        
+            repartir = st.checkbox("⚖️ Repartir zonas entre transportistas activos", value=True,
+                                   help="Cada transportista ve solo las zonas que le tocan para equilibrar la carga")
+        recogida_entrega = st.checkbox("🔁 Incluir entregas a compradores", value=False,
+                                       help="Combina recogidas en finca y entregas a compradores en una sola ruta")
+
         st.markdown("---")
         auto_update = st.checkbox("🔄 Actualización automática", value=False)
         if auto_update:
@@ -268,7 +535,12 @@ def view_transportista():
         else:
             st.info("📍 Usa el botón 'Actualizar ubicación' para simular movimiento hacia el destino.")
     
+    registrar_transportista_activo(nombre_transportista, ciudad_origen)
+    # lo publicado hasta aquí ya está en el CSV que se lee a continuación
+    suscripcion = suscripcion_transportista(nombre_transportista)
+    suscripcion.nuevos()
     df_notif = cargar_notificaciones()
+    escuchar_cambios()
 
     # TABS PRINCIPALES
     tabs = st.tabs(["🎯 Cargas Disponibles", "🚛 Entregas en Curso", "🛒 Mis Productos en Venta", "🗺️ Mapa", "📊 Estadísticas"])
@@ -286,8 +558,27 @@ def view_transportista():
                 grupos = agrupar_por_proximidad(notif_disponibles, radio_agrupacion)
                 
                 st.markdown(f"**Se encontraron {len(grupos)} zona(s) con productos disponibles**")
-                
+
+                # Todas las zonas se optimizan en lote (en paralelo) antes de repartirlas y pintarlas
+                lat_o, lon_o = UBICACIONES_CIUDADES.get(ciudad_origen, UBICACIONES_CIUDADES['Tunja'])
+                destinos_por_zona = [
+                    [{'lat': p['latitud'], 'lon': p['longitud'], 'nombre': p['campesino'], 'producto': p['producto']}
+                     for p in grupo['productos']]
+                    for grupo in grupos
+                ]
+                rutas_zonas = optimizar_zonas_paralelo((lat_o, lon_o), destinos_por_zona)
+
+                zonas_propias = set(range(len(grupos)))
+                if repartir and grupos:
+                    zonas_propias, num_activos = zonas_del_transportista(destinos_por_zona, df_notif, nombre_transportista)
+                    if num_activos > 1:
+                        st.info(f"⚖️ {len(zonas_propias)} de {len(grupos)} zona(s) asignadas a ti entre {num_activos} transportistas activos")
+
+                tiempos_zonas = estimar_tiempo_rutas_minutos((lat_o, lon_o), [ruta for ruta, _ in rutas_zonas])
+
                 for i, grupo in enumerate(grupos, 1):
+                    if i - 1 not in zonas_propias:
+                        continue
                     num_productos = len(grupo['productos'])
                     total_kg = sum([p['cantidad_kg'] for p in grupo['productos']])
                     total_precio = sum([p['precio'] for p in grupo['productos']])
@@ -303,16 +594,14 @@ def view_transportista():
                         
                         st.markdown("---")
                         
-                        lat_o, lon_o = UBICACIONES_CIUDADES.get(ciudad_origen, UBICACIONES_CIUDADES['Tunja'])
-                        destinos = [{'lat': p['latitud'], 'lon': p['longitud'], 'nombre': p['campesino'], 'producto': p['producto']} 
-                                   for p in grupo['productos']]
-                        ruta_optimizada, distancia_total = optimizar_ruta_ia((lat_o, lon_o), destinos)
-                        
+                        ruta_optimizada, distancia_total = rutas_zonas[i-1]
+                        tiempo_total = tiempos_zonas[i-1]
+
                         st.markdown(f"""
                         <div style='background:#e8f5e9; padding:12px; border-radius:8px; margin:10px 0;'>
                             <h5>🚀 Ruta Optimizada por IA</h5>
                             <p><b>📏 Distancia total:</b> {distancia_total:.2f} km</p>
-                            <p><b>⏱️ Tiempo estimado:</b> {(distancia_total/40)*60:.0f} minutos</p>
+                            <p><b>⏱️ Tiempo estimado:</b> {tiempo_total:.0f} minutos</p>
                             <p><b>🔄 Orden de recogida:</b></p>
                         </div>
                         """, unsafe_allow_html=True)
@@ -329,6 +618,7 @@ def view_transportista():
                         st.markdown("---")
                         
                         if st.button(f"✅ Aceptar todas las entregas de Zona {i}", key=f"aceptar_grupo_{i}"):
+                            aceptados = []
                             for orden, destino in enumerate(ruta_optimizada, 1):
                                 idx = None
                                 for k, p in zip(grupo['indices'], grupo['productos']):
@@ -344,9 +634,11 @@ def view_transportista():
                                     df_notif.loc[idx, 'transportista_lon'] = lon_o
                                     df_notif.loc[idx, 'ruta_optimizada'] = f"Zona_{i}"
                                     df_notif.loc[idx, 'orden_parada'] = orden
+                                    aceptados.append(idx)
                             
                             guardar_notificaciones(df_notif)
-                            st.success(f"✅ Has aceptado {num_productos} entregas en Zona {i}. Distancia total: {distancia_total:.1f} km, Tiempo: {(distancia_total/40)*60:.0f} min")
+                            obtener_bus().publicar_filas(ACEPTADA, df_notif.loc[aceptados], origen=suscripcion)
+                            st.success(f"✅ Has aceptado {num_productos} entregas en Zona {i}. Distancia total: {distancia_total:.1f} km, Tiempo: {tiempo_total:.0f} min")
                             st.rerun()
             else:
                 for idx, row in notif_disponibles.iterrows():
@@ -373,6 +665,7 @@ def view_transportista():
                         df_notif.loc[idx, 'transportista_lon'] = lon_o
                         df_notif.loc[idx, 'orden_parada'] = 1
                         guardar_notificaciones(df_notif)
+                        obtener_bus().publicar_fila(ACEPTADA, df_notif.loc[idx], origen=suscripcion)
                         st.success(f"✅ Has aceptado recoger {row['producto']} de {row['campesino']}")
                         st.rerun()
 
@@ -383,85 +676,164 @@ def view_transportista():
             (df_notif['estado'] == 'Aceptado')
         ]
 
-        if auto_update and not viajes_activos.empty:
-            tiempo_actualizado = False
-            for idx, row in viajes_activos.iterrows():
-                progreso = row.get('progreso_viaje', 0.0)
-                if progreso < 1.0:
-                    lat_t, lon_t, prog, dist, tiempo_est = simular_movimiento(
-                        ciudad_origen, row['latitud'], row['longitud'], progreso
-                    )
-                    df_notif.loc[idx, ['transportista_lat', 'transportista_lon',
-                                       'progreso_viaje', 'distancia_restante_km',
-                                       'tiempo_estimado_llegada']] = [lat_t, lon_t, prog, dist, tiempo_est]
-                    tiempo_actualizado = True
-            
-            if tiempo_actualizado:
-                guardar_notificaciones(df_notif)
-                time.sleep(intervalo)
-                st.rerun()
-
-        if viajes_activos.empty:
-            st.info("No tienes entregas activas en este momento.")
+        # un único motor por proceso avanza la flota; la pestaña solo lee su última instantánea
+        motor = obtener_motor(CSV_NOTIFICACIONES)
+        if auto_update:
+            motor.seguir(nombre_transportista, UBICACIONES_CIUDADES.get(ciudad_origen, UBICACIONES_CIUDADES['Tunja']))
         else:
-            st.markdown("### 🚛 Mis Entregas en Curso")
+            motor.dejar_de_seguir(nombre_transportista)
 
-            rutas = viajes_activos.groupby('ruta_optimizada', dropna=False)
-            
-            for nombre_ruta, grupo_ruta in rutas:
-                if pd.isna(nombre_ruta):
-                    nombre_ruta = "Entrega Individual"
-                
-                grupo_ruta = grupo_ruta.sort_values('orden_parada')
-                num_paradas = len(grupo_ruta)
-                
-                st.markdown(f"#### 🗺️ {nombre_ruta} ({num_paradas} parada{'s' if num_paradas > 1 else ''})")
-                
-                for idx, row in grupo_ruta.iterrows():
-                    progreso = row.get('progreso_viaje', 0.0)
-                    distancia = row.get('distancia_restante_km', 0)
-                    tiempo = row.get('tiempo_estimado_llegada', 0)
-                    orden = row.get('orden_parada', 1)
+        if recogida_entrega:
+            df_compras = cargar_compras()
+            solicitudes = construir_solicitudes_recogida_entrega(df_notif, df_compras, nombre_transportista)
+
+            st.markdown("### 🔁 Ruta Combinada: Recogidas + Entregas")
+            if not any(s['entrega'] is not None for s in solicitudes):
+                st.info("No hay compras pendientes de entrega para combinar con tus recogidas.")
+            else:
+                lat_o, lon_o = UBICACIONES_CIUDADES.get(ciudad_origen, UBICACIONES_CIUDADES['Tunja'])
+                ruta_pd, distancia_pd = optimizar_ruta_recogida_entrega((lat_o, lon_o), solicitudes)
+                distancia_separada = distancia_viajes_separados((lat_o, lon_o), solicitudes)
+                kg_entregados = sum(s['kg'] for s in solicitudes if s['entrega'] is not None)
 
+                col1, col2, col3 = st.columns(3)
+                with col1:
+                    st.metric("📏 Ruta combinada", f"{distancia_pd:.1f} km")
+                with col2:
+                    st.metric("📏 Viajes separados", f"{distancia_separada:.1f} km")
+                with col3:
+                    st.metric("🚚 km por kg entregado", f"{distancia_pd/kg_entregados:.3f}",
+                              delta=f"{(distancia_pd - distancia_separada)/kg_entregados:.3f}", delta_color="inverse")
+
+                for parada in ruta_pd:
+                    sol = solicitudes[parada['solicitud']]
+                    if parada['tipo'] == 'recogida':
+                        titulo = f"🌾 Parada {parada['orden']}: Recoger {sol['producto']}"
+                        color = '#34A853'
+                    else:
+                        titulo = f"📦 Parada {parada['orden']}: Entregar {sol['producto']} a {sol['nombre']}"
+                        color = '#4285F4'
+                    detalle = f"{sol['kg']:.0f} kg" + (f" • {sol['ciudad_entrega']}" if parada['tipo'] == 'entrega' else "")
                     st.markdown(f"""
-                    <div style='background:white; padding:15px; border-radius:10px; margin:10px 0;
-                                box-shadow:0 2px 6px rgba(0,0,0,0.1); border-left:4px solid #EA4335;'>
-                        <h4>📍 Parada {orden}: {row['producto']} - {row['campesino']}</h4>
-                        <p><b>Ciudad:</b> {row['ciudad']} | <b>Cantidad:</b> {row['cantidad_kg']} kg</p>
-                        <p><b>Progreso:</b> {progreso*100:.1f}% | <b>Distancia restante:</b> {distancia:.1f} km | <b>ETA:</b> {tiempo:.0f} min</p>
+                    <div style='background:#f8f9fa; padding:10px; border-radius:8px; margin:8px 0;
+                                border-left:3px solid {color};'>
+                        <h5>{titulo}</h5>
+                        <p>{detalle}</p>
                     </div>
                     """, unsafe_allow_html=True)
-                    st.progress(progreso)
-
-                    col1, col2, col3 = st.columns([1, 1, 1])
-                    with col1:
-                        if st.button(f"📍 Actualizar ubicación", key=f"ubicacion_{idx}"):
-                            lat_t, lon_t, prog, dist, tiempo = simular_movimiento(
-                                ciudad_origen, row['latitud'], row['longitud'], progreso
-                            )
-                            df_notif.loc[idx, ['transportista_lat', 'transportista_lon',
-                                               'progreso_viaje', 'distancia_restante_km',
-                                               'tiempo_estimado_llegada']] = [lat_t, lon_t, prog, dist, tiempo]
-                            guardar_notificaciones(df_notif)
-                            st.success("📍 Ubicación actualizada.")
+
+                    if parada['tipo'] == 'entrega' and df_compras.loc[sol['idx_compra'], 'transportista_entrega'] == nombre_transportista:
+                        if st.button("✅ Marcar como Entregado", key=f"entregado_{sol['idx_compra']}"):
+                            df_compras.loc[sol['idx_compra'], 'estado_entrega'] = 'Entregado'
+                            df_compras.loc[sol['idx_compra'], 'fecha_entrega'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+                            guardar_compras(df_compras)
+                            id_notif = df_compras.loc[sol['idx_compra'], 'id_notificacion']
+                            vendido = (df_notif['id_notificacion'] == id_notif) & df_notif['estado'].isin(['Vendido', 'Completado'])
+                            if vendido.any():
+                                df_notif.loc[vendido, 'estado'] = 'Entregado'
+                                guardar_notificaciones(df_notif)
+                            obtener_bus().publicar_fila(ENTREGADA, df_compras.loc[sol['idx_compra']], nombre_transportista, suscripcion)
+                            st.success("📦 Entrega registrada.")
                             st.rerun()
 
-                    with col2:
-                        if progreso >= 0.95:
-                            if st.button(f"✅ Marcar como Recogido", key=f"recogido_{idx}"):
-                                # IMPORTANTE: Marcar como recogido Y asignar al transportista como vendedor
-                                df_notif.loc[idx, 'estado'] = 'Recogido'
-                                df_notif.loc[idx, 'fecha_recogida'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-                                df_notif.loc[idx, 'origen'] = 'Transportador'  # Cambiar origen
-                                df_notif.loc[idx, 'transportador'] = nombre_transportista  # Asignar como vendedor
+                sin_asignar = [s['idx_compra'] for s in solicitudes
+                               if s['idx_compra'] is not None and pd.isna(df_compras.loc[s['idx_compra'], 'transportista_entrega'])]
+                if sin_asignar and st.button(f"✅ Tomar ruta combinada ({len(sin_asignar)} entrega(s) nuevas)", key="tomar_ruta_pd"):
+                    df_compras.loc[sin_asignar, 'transportista_entrega'] = nombre_transportista
+                    guardar_compras(df_compras)
+                    obtener_bus().publicar_filas(ENTREGA_ASIGNADA, df_compras.loc[sin_asignar], nombre_transportista, suscripcion)
+                    st.success(f"✅ Ruta combinada asignada. Distancia total: {distancia_pd:.1f} km")
+                    st.rerun()
+
+            st.markdown("---")
+
+        def mostrar_entregas_en_curso():
+            viajes_en_curso = viajes_activos
+            if auto_update:
+                motor.seguir(nombre_transportista, UBICACIONES_CIUDADES.get(ciudad_origen, UBICACIONES_CIUDADES['Tunja']))
+                aplicar_snapshot(df_notif, motor.snapshot())
+                viajes_en_curso = df_notif.loc[viajes_activos.index]
+            # la recogida se habilita con el evento de llegada de la geocerca, no con el % de avance;
+            # evaluar sin cambios de nivel no escribe nada
+            geocercas = obtener_motor_geocercas()
+            con_posicion = viajes_en_curso[viajes_en_curso['transportista_lat'].notna() & viajes_en_curso['transportista_lon'].notna()]
+            geocercas.evaluar_filas(df_notif, con_posicion.index)
+            llegados = geocercas.cola.ids_con_evento('llegada')
+
+            if viajes_en_curso.empty:
+                st.info("No tienes entregas activas en este momento.")
+            else:
+                st.markdown("### 🚛 Mis Entregas en Curso")
+
+                rutas = viajes_en_curso.groupby('ruta_optimizada', dropna=False)
+            
+                for nombre_ruta, grupo_ruta in rutas:
+                    if pd.isna(nombre_ruta):
+                        nombre_ruta = "Entrega Individual"
+                
+                    grupo_ruta = grupo_ruta.sort_values('orden_parada')
+                    num_paradas = len(grupo_ruta)
+                
+                    st.markdown(f"#### 🗺️ {nombre_ruta} ({num_paradas} parada{'s' if num_paradas > 1 else ''})")
+                
+                    for idx, row in grupo_ruta.iterrows():
+                        progreso = row.get('progreso_viaje', 0.0)
+                        distancia = row.get('distancia_restante_km', 0)
+                        tiempo = row.get('tiempo_estimado_llegada', 0)
+                        orden = row.get('orden_parada', 1)
+
+                        st.markdown(f"""
+                        <div style='background:white; padding:15px; border-radius:10px; margin:10px 0;
+                                    box-shadow:0 2px 6px rgba(0,0,0,0.1); border-left:4px solid #EA4335;'>
+                            <h4>📍 Parada {orden}: {row['producto']} - {row['campesino']}</h4>
+                            <p><b>Ciudad:</b> {row['ciudad']} | <b>Cantidad:</b> {row['cantidad_kg']} kg</p>
+                            <p><b>Progreso:</b> {progreso*100:.1f}% | <b>Distancia restante:</b> {distancia:.1f} km | <b>ETA:</b> {tiempo:.0f} min</p>
+                        </div>
+                        """, unsafe_allow_html=True)
+                        st.progress(progreso)
+
+                        col1, col2, col3 = st.columns([1, 1, 1])
+                        with col1:
+                            if st.button(f"📍 Actualizar ubicación", key=f"ubicacion_{idx}"):
+                                lat_t, lon_t, prog, dist, tiempo = simular_movimiento(
+                                    ciudad_origen, row['latitud'], row['longitud'], progreso, row['id_notificacion']
+                                )
+                                df_notif.loc[idx, ['transportista_lat', 'transportista_lon',
+                                                   'progreso_viaje', 'distancia_restante_km',
+                                                   'tiempo_estimado_llegada']] = [lat_t, lon_t, prog, dist, tiempo]
                                 guardar_notificaciones(df_notif)
-                                st.success("✅ Producto recogido. Ahora disponible para venta.")
+                                ahora = time.time()
+                                almacen = obtener_almacen()
+                                almacen.registrar([row['id_notificacion']], ahora, [lat_t], [lon_t])
+                                almacen.guardar()
+                                obtener_bitacora().registrar_filas(df_notif, [idx], ahora)
+                                obtener_motor_geocercas().evaluar_filas(df_notif, [idx], ahora)
+                                st.success("📍 Ubicación actualizada.")
                                 st.rerun()
 
-                    with col3:
-                        st.metric("Avance", f"{progreso*100:.1f}%")
+                        with col2:
+                            if row['id_notificacion'] in llegados:
+                                if st.button(f"✅ Marcar como Recogido", key=f"recogido_{idx}"):
+                                    # IMPORTANTE: Marcar como recogido Y asignar al transportista como vendedor
+                                    df_notif.loc[idx, 'estado'] = 'Recogido'
+                                    df_notif.loc[idx, 'fecha_recogida'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+                                    df_notif.loc[idx, 'origen'] = 'Transportador'  # Cambiar origen
+                                    df_notif.loc[idx, 'transportador'] = nombre_transportista  # Asignar como vendedor
+                                    guardar_notificaciones(df_notif)
+                                    obtener_bus().publicar_fila(RECOGIDA, df_notif.loc[idx], origen=suscripcion)
+                                    st.success("✅ Producto recogido. Ahora disponible para venta.")
+                                    st.rerun()
+
+                        with col3:
+                            st.metric("Avance", f"{progreso*100:.1f}%")
                 
-                st.markdown("---")
+                    st.markdown("---")
+
+        if auto_update:
+            # solo esta sección se vuelve a ejecutar en cada intervalo, sin bloquear la pestaña
+            st.fragment(run_every=intervalo)(mostrar_entregas_en_curso)()
+        else:
+            mostrar_entregas_en_curso()
 
     # TAB 3: PRODUCTOS EN VENTA
     with tabs[2]:
@@ -525,6 +897,7 @@ def view_transportista():
                     if st.button("🗑️ Retirar", key=f"retirar_{idx}"):
                         df_notif.loc[idx, 'estado'] = 'Retirado'
                         guardar_notificaciones(df_notif)
+                        obtener_bus().publicar_fila(RETIRADA, df_notif.loc[idx], origen=suscripcion)
                         st.success("Producto retirado del marketplace")
                         st.rerun()
                 
@@ -560,8 +933,37 @@ def view_transportista():
         ]
         
         st.markdown("### 🗺️ Mapa de Operaciones en Tiempo Real")
-        mapa = crear_mapa(ciudad_origen, viajes_activos)
-        st_folium(mapa, width=1400, height=600)
+        col_modo, col_descarga = st.columns([3, 1])
+        with col_modo:
+            modo_mapa = st.radio(
+                "Modo del mapa:", MODOS_MAPA, horizontal=True, key="modo_mapa",
+                index=1 if len(viajes_activos) > UMBRAL_MARCADORES_AGRUPADOS else 0,
+                help="Con muchas paradas, los marcadores agrupados, la capa GeoJSON o el modo WebGL cargan mucho más rápido"
+            )
+        coleccion = coleccion_rutas(viajes_activos, ciudad_origen)
+        with col_descarga:
+            st.download_button(
+                "⬇️ Descargar GeoJSON",
+                data=a_texto(coleccion),
+                file_name=f"rutas_{nombre_transportista}.geojson",
+                mime="application/geo+json",
+                help="Rutas, paradas y camiones para abrir en QGIS, geojson.io u otras herramientas"
+            )
+        if modo_mapa == MODOS_MAPA[3]:
+            # deck.gl dibuja en la GPU desde columnas: fluido con decenas de miles de puntos
+            st.pydeck_chart(mapa_webgl_transportista(ciudad_origen, viajes_activos), use_container_width=True)
+        else:
+            if modo_mapa == MODOS_MAPA[1]:
+                mapa = crear_mapa_agrupado(ciudad_origen, viajes_activos)
+            elif modo_mapa == MODOS_MAPA[2]:
+                mapa = crear_mapa_geojson(ciudad_origen, coleccion)
+            else:
+                mapa = crear_mapa(ciudad_origen, viajes_activos)
+            st_folium(mapa, width=1400, height=600, returned_objects=[])
+        
+        st.markdown("---")
+        st.markdown("### 🔥 Dónde hay Cargas Pendientes")
+        mostrar_mapa_oferta(df_notif, "oferta_transportista")
 
     # TAB 5: ESTADÍSTICAS 
     with tabs[4]:
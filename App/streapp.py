@@ -11,6 +11,7 @@ try:
     from modules.campesino import view_campesino
     from modules.transportista import view_transportista
     from modules.comprador import view_comprador
+    from modules.mapa_webgl import vista_flota
 except ImportError as e:
     st.error(f"Error al importar módulos: {e}")
     st.info("Asegúrate de que existan los archivos en la carpeta 'modules/'")
@@ -192,7 +193,7 @@ elif rol == "Comprador":
 elif rol == "Administrador":
     st.header("⚙️ Panel de Administración")
 
-    tab1, tab2, tab3, tab4 = st.tabs(["👥 Usuarios", "📊 Dashboard", "⚙️ Configuración", "📝 Logs"])
+    tab1, tab2, tab3, tab4, tab5 = st.tabs(["👥 Usuarios", "📊 Dashboard", "🚚 Flota en Vivo", "⚙️ Configuración", "📝 Logs"])
 
     with tab1:
         st.subheader("Gestión de Usuarios")
@@ -211,9 +212,17 @@ elif rol == "Administrador":
             st.metric("Satisfacción", "4.8/5", "+0.2")
 
     with tab3:
+        st.subheader("Flota en Vivo")
+        st.caption("Todas las paradas y camiones en un mapa WebGL, fluido aun con decenas de miles de puntos.")
+        try:
+            vista_flota()
+        except Exception as e:
+            st.error(f"Error al cargar el mapa de flota: {e}")
+
+    with tab4:
         st.subheader("Configuración del Sistema")
         st.write("Parámetros generales de la plataforma...")
 
-    with tab4:
+    with tab5:
         st.subheader("Registro de Actividad")
         st.write("Logs del sistema y auditoría...")